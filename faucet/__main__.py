@@ -20,7 +20,10 @@
 
 import argparse
 import os
+import signal
+import subprocess
 import sys
+import time
 
 if sys.version_info < (3,):
     raise ImportError("""You are trying to run faucet on python {py}
@@ -66,6 +69,8 @@ RYU_OPTIONAL_ARGS = [
     ('wsapi-port', 'webapp listen port (default 8080)')
 ]
 
+DEFAULT_OFP_TCP_LISTEN_PORT = 6653
+
 
 def parse_args(sys_args):
     """Parse Faucet/Gauge arguments.
@@ -85,6 +90,9 @@ def parse_args(sys_args):
         '--use-stderr', action='store_true', help='log to standard error')
     args.add_argument(
         '--use-syslog', action='store_true', help='output to syslog')
+    args.add_argument(
+        '--shards', type=int, default=1,
+        help='run this many FAUCET processes, each controlling a shard of the DPs')
     args.add_argument(
         '--ryu-app',
         action='append',
@@ -159,10 +167,54 @@ def build_ryu_args(argv):
     return ryu_args
 
 
+def build_shard_ryu_args(ryu_args, shards):
+    """Return Ryu arguments for each shard, each listening on its own OpenFlow port.
+
+    Shard n listens on the OpenFlow port (default 6653) plus n, so DPs in shard n
+    must be configured to connect to that port.
+    """
+    listen_port_arg = '--ofp-tcp-listen-port='
+    listen_port = DEFAULT_OFP_TCP_LISTEN_PORT
+    base_ryu_args = []
+    for ryu_arg in ryu_args:
+        if ryu_arg.startswith(listen_port_arg):
+            listen_port = int(ryu_arg[len(listen_port_arg):])
+            continue
+        base_ryu_args.append(ryu_arg)
+    return [
+        base_ryu_args[:1] + ['%s%u' % (listen_port_arg, listen_port + shard)] + base_ryu_args[1:]
+        for shard in range(shards)]
+
+
+def run_shards(shard_ryu_args):
+    """Run a ryu-manager per shard, until any one exits."""
+    shards = len(shard_ryu_args)
+    procs = []
+    for shard, ryu_args in enumerate(shard_ryu_args):
+        env = dict(os.environ, FAUCET_SHARD=str(shard), FAUCET_SHARDS=str(shards))
+        procs.append(subprocess.Popen(ryu_args, env=env))
+
+    def _signal_shards(signum, _frame):
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signum)
+
+    # Forward HUP (config reload) as well as termination to all shards.
+    for signum in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, _signal_shards)
+    while all(proc.poll() is None for proc in procs):
+        time.sleep(1)
+    _signal_shards(signal.SIGTERM, None)
+    return max([abs(proc.wait()) for proc in procs])
+
+
 def main():
     """Main program."""
     ryu_args = build_ryu_args(sys.argv)
     if ryu_args:
+        shards = parse_args(sys.argv[1:]).shards
+        if shards > 1 and 'faucet.faucet' in ryu_args:
+            sys.exit(run_shards(build_shard_ryu_args(ryu_args, shards)))
         os.execvp(ryu_args[0], ryu_args)
 
 
@@ -41,6 +41,7 @@ class Conf:
     defaults_types = None # type: dict
     dyn_finalized = False
     dyn_hash = None
+    dyn_conf_keys_cache = None
 
     def __init__(self, _id, dp_id, conf=None):
         self._id = _id
@@ -58,6 +59,8 @@ class Conf:
 
     def __setattr__(self, name, value):
         if not self.dyn_finalized or name.startswith('dyn') or name in self.mutable_attrs:
+            if self.dyn_conf_keys_cache and not name.startswith('dyn'):
+                self.dyn_conf_keys_cache = None
             super(Conf, self).__setattr__(name, value)
         else:
             raise ValueError('cannot update %s on finalized Conf object' % name)
@@ -170,10 +173,30 @@ class Conf:
         return '\n'.join(differ.compare(
             self.to_conf().splitlines(), other.to_conf().splitlines()))
 
+    def _conf_str_keys(self, dyn=False, subconf=True, ignore_keys=None):
+        """Return hash and frozenset of stringified key/values, cached if finalized."""
+        if ignore_keys:
+            ignore_keys = frozenset(ignore_keys)
+        else:
+            ignore_keys = None
+        cache_key = (subconf, ignore_keys)
+        if not dyn and self.dyn_conf_keys_cache:
+            cached = self.dyn_conf_keys_cache.get(cache_key, None)
+            if cached is not None:
+                return cached
+        str_keys = frozenset(map(
+            str, self._conf_keys(self, dyn=dyn, subconf=subconf, ignore_keys=ignore_keys)))
+        result = (hash(str_keys), str_keys)
+        if not dyn and self.dyn_finalized:
+            if self.dyn_conf_keys_cache is None:
+                self.dyn_conf_keys_cache = {}
+            self.dyn_conf_keys_cache[cache_key] = result
+        return result
+
     def conf_hash(self, dyn=False, subconf=True, ignore_keys=None):
         """Return hash of keys configurably filtering attributes."""
-        return hash(frozenset(list(map(
-            str, self._conf_keys(self, dyn=dyn, subconf=subconf, ignore_keys=ignore_keys)))))
+        conf_hash, _ = self._conf_str_keys(dyn=dyn, subconf=subconf, ignore_keys=ignore_keys)
+        return conf_hash
 
     def __hash__(self):
         if self.dyn_hash is not None:
@@ -201,14 +224,28 @@ class Conf:
             {k: self._finalize_val(v) for k, v in self.__dict__.items()
              if not k.startswith('dyn')})
         self.dyn_finalized = True
+        self.dyn_conf_keys_cache = None
+        self.dyn_hash = self.conf_hash(dyn=False, subconf=True)
+
+    def _conf_equal(self, other, subconf=True, ignore_keys=None):
+        """Return True if config same as other, comparing hashes first."""
+        if self is other:
+            return True
+        self_hash, self_keys = self._conf_str_keys(subconf=subconf, ignore_keys=ignore_keys)
+        other_hash, other_keys = other._conf_str_keys( # pylint: disable=protected-access
+            subconf=subconf, ignore_keys=ignore_keys)
+        return self_hash == other_hash and self_keys == other_keys
 
     def ignore_subconf(self, other, ignore_keys=None):
         """Return True if this config same as other, ignoring sub config."""
-        return (self.conf_hash(dyn=False, subconf=False, ignore_keys=ignore_keys)
-                == other.conf_hash(dyn=False, subconf=False, ignore_keys=ignore_keys))
+        return self._conf_equal(other, subconf=False, ignore_keys=ignore_keys)
 
     def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+        if not isinstance(other, Conf):
+            return False
+        if self.__hash__() != other.__hash__():
+            return False
+        return self._conf_equal(other)
 
     def __ne__(self, other):
         return not self.__eq__(other)
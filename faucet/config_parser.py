@@ -17,6 +17,7 @@
 # limitations under the License.
 
 import copy
+import hashlib
 import re
 
 from faucet import config_parser_util
@@ -38,8 +39,12 @@ V2_TOP_CONFS = (
     'vlans')
 
 
-def dp_parser(config_file, logname, meta_dp_state=None):
-    """Parse a config file into DP configuration objects with hashes of config include/files."""
+def dp_parser(config_file, logname, meta_dp_state=None, dp_cache=None):
+    """Parse a config file into DP configuration objects with hashes of config include/files.
+
+    If dp_cache (a dict) is provided, DPs whose configuration is unchanged since
+    they were cached are reused rather than reparsed, and dp_cache is updated.
+    """
     conf, _ = config_parser_util.read_config(config_file, logname)
     config_hashes = None
     dps = None
@@ -51,7 +56,7 @@ def dp_parser(config_file, logname, meta_dp_state=None):
     version = conf.pop('version', 2)
     test_config_condition(version != 2, 'Only config version 2 is supported')
     config_hashes, config_contents, dps, top_conf = _config_parser_v2(
-        config_file, logname, meta_dp_state)
+        config_file, logname, meta_dp_state, dp_cache)
     test_config_condition(dps is None, 'no DPs are not defined')
 
     return config_hashes, config_contents, dps, top_conf
@@ -184,22 +189,51 @@ def _parse_dp(dp_key, dp_conf, acls_conf, meters_conf, routers_conf, vlans_conf)
     return dp
 
 
+def _conf_hash(conf):
+    """Return hash of a parsed config subtree."""
+    config_hash = getattr(hashlib, config_parser_util.CONFIG_HASH_FUNC)
+    return config_hash(repr(conf).encode('utf-8')).hexdigest()
+
+
+def _dp_reusable(dp):
+    """Return True if a DP does not depend on the config of other DPs."""
+    return not (dp.stack or dp.stack_ports or dp.routers or dp.tunnel_acls)
+
+
 def _dp_parser_v2(dps_conf, acls_conf, meters_conf,
-                  routers_conf, vlans_conf, meta_dp_state):
+                  routers_conf, vlans_conf, meta_dp_state, dp_cache=None):
 
     dps = []
+    new_dps = []
+    new_dp_cache = {}
+    shared_conf_hash = None
+    if dp_cache is not None:
+        shared_conf_hash = _conf_hash((acls_conf, meters_conf, routers_conf, vlans_conf))
     for dp_key, dp_conf in dps_conf.items():
+        dp_conf_hash = None
+        if dp_cache is not None:
+            # Hash before parsing, as parsing modifies the config.
+            dp_conf_hash = _conf_hash((dp_conf, shared_conf_hash))
+            cached_conf_hash, cached_dp = dp_cache.get(dp_key, (None, None))
+            if cached_conf_hash == dp_conf_hash:
+                dps.append(cached_dp)
+                new_dp_cache[dp_key] = (dp_conf_hash, cached_dp)
+                continue
         try:
-            dps.append(_parse_dp(
-                dp_key, dp_conf, acls_conf, meters_conf, routers_conf, vlans_conf))
+            dp = _parse_dp(
+                dp_key, dp_conf, acls_conf, meters_conf, routers_conf, vlans_conf)
         except InvalidConfigError as err:
             raise InvalidConfigError('DP %s: %s' % (dp_key, err))
+        dps.append(dp)
+        new_dps.append(dp)
+        new_dp_cache[dp_key] = (dp_conf_hash, dp)
 
-    for dp in dps:
+    # Reused DPs are already finalized, but remain visible to new DPs.
+    for dp in new_dps:
         dp.finalize_config(dps)
-    for dp in dps:
+    for dp in new_dps:
         dp.resolve_stack_topology(dps, meta_dp_state)
-    for dp in dps:
+    for dp in new_dps:
         dp.finalize()
 
     dpid_refs = set()
@@ -215,10 +249,15 @@ def _dp_parser_v2(dps_conf, acls_conf, meters_conf,
         test_config_condition(router not in routers_referenced, (
             'router %s configured but not used by any DP' % router))
 
+    if dp_cache is not None:
+        dp_cache.clear()
+        dp_cache.update({
+            dp_key: cache_entry for dp_key, cache_entry in new_dp_cache.items()
+            if _dp_reusable(cache_entry[1])})
     return dps
 
 
-def dp_preparsed_parser(top_confs, meta_dp_state):
+def dp_preparsed_parser(top_confs, meta_dp_state, dp_cache=None):
     """Parse a preparsed (after include files have been applied) FAUCET config."""
     local_top_confs = copy.deepcopy(top_confs)
     return _dp_parser_v2(
@@ -227,10 +266,11 @@ def dp_preparsed_parser(top_confs, meta_dp_state):
         local_top_confs.get('meters', {}),
         local_top_confs.get('routers', {}),
         local_top_confs.get('vlans', {}),
-        meta_dp_state)
+        meta_dp_state,
+        dp_cache)
 
 
-def _config_parser_v2(config_file, logname, meta_dp_state):
+def _config_parser_v2(config_file, logname, meta_dp_state, dp_cache=None):
     config_path = config_parser_util.dp_config_path(config_file)
     top_confs = {top_conf: {} for top_conf in V2_TOP_CONFS}
     config_hashes = {}
@@ -244,7 +284,7 @@ def _config_parser_v2(config_file, logname, meta_dp_state):
     if not top_confs['dps']:
         raise InvalidConfigError('DPs not configured in file: %s' % config_path)
 
-    dps = dp_preparsed_parser(top_confs, meta_dp_state)
+    dps = dp_preparsed_parser(top_confs, meta_dp_state, dp_cache)
     return (config_hashes, config_contents, dps, top_confs)
 
 
@@ -98,6 +98,18 @@ configuration.
         # Max number of seconds to back off to when resolving nexthops.
         'packetin_pps': None,
         # Ask switch to rate limit packet pps. TODO: Not supported by OVS in 2.7.0
+        'packetin_batch_size': 0,
+        # If > 1, process up to this many packet ins from this DP as one batch.
+        'packetin_batch_window_ms': 10,
+        # Process a packet in batch after this many milliseconds, even if not full.
+        'packetin_port_learn_pps': None,
+        # If set, process at most this many L2 learning packet ins per second per port.
+        'packetin_port_control_plane_pps': None,
+        # If set, process at most this many routing control plane packet ins per second per port.
+        'ofmsg_send_window': 0,
+        # If > 0, send at most this many OF messages to this DP before awaiting a barrier reply.
+        'diff_cold_start': False,
+        # If True, on connect, change only flows that differ from those expected on the DP.
         'learn_jitter': 0,
         # Jitter learn timeouts by up to this many seconds
         'learn_ban_timeout': 0,
@@ -148,6 +160,8 @@ configuration.
         # Have OFA copy packet outs to multiple ports.
         'idle_dst': True,
         # If False, workaround for flow idle timer not reset on flow refresh.
+        'multipath_routing': False,
+        # Install routes with more than one gateway as OpenFlow select groups.
         }
 
     defaults_types = {
@@ -176,6 +190,12 @@ configuration.
         'max_host_fib_retry_count': int,
         'max_resolve_backoff_time': int,
         'packetin_pps': int,
+        'packetin_batch_size': int,
+        'packetin_batch_window_ms': int,
+        'packetin_port_learn_pps': int,
+        'packetin_port_control_plane_pps': int,
+        'ofmsg_send_window': int,
+        'diff_cold_start': bool,
         'learn_jitter': int,
         'learn_ban_timeout': int,
         'advertise_interval': int,
@@ -201,6 +221,7 @@ configuration.
         'multi_out': bool,
         'lacp_timeout': int,
         'idle_dst': bool,
+        'multipath_routing': bool,
     }
 
     default_table_sizes_types = {
@@ -250,6 +271,7 @@ configuration.
         self.configured = False
         self.cookie = None
         self.description = None
+        self.diff_cold_start = None
         self.dot1x = {}
         self.dp_acls = None
         self.dp_id = None
@@ -280,10 +302,16 @@ configuration.
         self.max_resolve_backoff_time = None
         self.meters = None
         self.metrics_rate_limit_sec = None
+        self.multipath_routing = None
         self.name = None
         self.ofchannel_log = None
+        self.ofmsg_send_window = None
         self.output_only_ports = None
         self.packetin_pps = None
+        self.packetin_batch_size = None
+        self.packetin_batch_window_ms = None
+        self.packetin_port_learn_pps = None
+        self.packetin_port_control_plane_pps = None
         self.ports = None
         self.priority_offset = None
         self.proactive_learn_v4 = None
@@ -346,6 +374,7 @@ configuration.
         self.dyn_running = prev_dp.dyn_running
         self.dyn_up_port_nos = set(prev_dp.dyn_up_port_nos)
         self.dyn_last_coldstart_time = prev_dp.dyn_last_coldstart_time
+        self.groups.clone_state(prev_dp.groups)
 
     def check_config(self):
         super(DP, self).check_config()
@@ -368,6 +397,16 @@ configuration.
             'L2 timeout must be > ND timeout * 2'))
         test_config_condition(
             self.nd_neighbor_timeout > 65535, 'nd_neighbor_timeout cannot be > 65535')
+        test_config_condition(self.packetin_batch_size < 0, (
+            'packetin_batch_size must be >= 0'))
+        test_config_condition(self.packetin_batch_window_ms < 0, (
+            'packetin_batch_window_ms must be >= 0'))
+        for pps_attr in ('packetin_port_learn_pps', 'packetin_port_control_plane_pps'):
+            pps = getattr(self, pps_attr)
+            test_config_condition(pps is not None and pps < 1, (
+                '%s must be >= 1' % pps_attr))
+        test_config_condition(self.ofmsg_send_window < 0, (
+            'ofmsg_send_window must be >= 0'))
         test_config_condition(self.combinatorial_port_flood and self.group_table, (
             'combinatorial_port_flood and group_table mutually exclusive'))
         if self.cache_update_guard_time == 0:
@@ -784,15 +823,67 @@ configuration.
         edge_attr = make_edge_attr(edge_a, edge_z)
         edge_a_dp, _ = edge_a
         edge_z_dp, _ = edge_z
+        edge_key = (edge_a_dp.name, edge_z_dp.name, edge_name)
         if add:
+            if edge_key not in graph.edges:
+                DP._invalidate_stack_routes(graph)
             graph.add_edge(
                 edge_a_dp.name, edge_z_dp.name,
                 key=edge_name, port_map=edge_attr)
-        elif (edge_a_dp.name, edge_z_dp.name, edge_name) in graph.edges:
-            graph.remove_edge(edge_a_dp.name, edge_z_dp.name, edge_name)
+        elif edge_key in graph.edges:
+            graph.remove_edge(*edge_key)
+            DP._invalidate_stack_routes(graph)
 
         return edge_name
 
+    @staticmethod
+    def _invalidate_stack_routes(graph):
+        """Discard cached routes, as the stack graph has changed."""
+        graph.graph.pop('stack_routes', None)
+        graph.graph.pop('stack_paths', None)
+
+    @staticmethod
+    def _stack_routes(graph, dest_dp):
+        """Return dict of DP name to (next hop DP name, hops) towards dest_dp.
+
+        Computed once per destination, until the stack graph changes. Of all
+        shortest paths, the next hop is chosen so the path is the lowest sorted,
+        so all DPs agree on the same path.
+        """
+        routes_by_dest = graph.graph.setdefault('stack_routes', {})
+        routes = routes_by_dest.get(dest_dp, None)
+        if routes is None:
+            routes = {}
+            if dest_dp in graph:
+                hops_to_dest = networkx.single_source_shortest_path_length(graph, dest_dp)
+                for src_dp, hops in hops_to_dest.items():
+                    next_hop = None
+                    if hops:
+                        next_hop = min(
+                            peer_dp for peer_dp in graph.neighbors(src_dp)
+                            if hops_to_dest.get(peer_dp, None) == hops - 1)
+                    routes[src_dp] = (next_hop, hops)
+            routes_by_dest[dest_dp] = routes
+        return routes
+
+    @classmethod
+    def _stack_path(cls, graph, dest_dp, src_dp):
+        """Return shortest path from src_dp to dest_dp as a tuple, cached until graph changes."""
+        paths = graph.graph.setdefault('stack_paths', {})
+        path_key = (src_dp, dest_dp)
+        path = paths.get(path_key, None)
+        if path is None:
+            routes = cls._stack_routes(graph, dest_dp)
+            path = []
+            next_hop = src_dp
+            if src_dp in routes:
+                while next_hop is not None:
+                    path.append(next_hop)
+                    next_hop, _ = routes[next_hop]
+            path = tuple(path)
+            paths[path_key] = path
+        return path
+
     @classmethod
     def add_stack_link(cls, graph, dp, port):
         """Add a stack link to the stack graph."""
@@ -870,12 +961,10 @@ configuration.
         graph = self.stack.get('graph', None)
         if not graph:
             return None
-        len_paths_to_root = [
-            len(self.shortest_path(self.stack_root_name, src_dp=dp))
-            for dp in graph.nodes()]
-        if len_paths_to_root:
-            return max(len_paths_to_root)
-        return None
+        if not graph.nodes():
+            return None
+        routes = self._stack_routes(graph, self.stack_root_name)
+        return max([hops + 1 for _, hops in routes.values()], default=0)
 
     def finalize_tunnel_acls(self, dps):
         """Turn off ACLs not in use and resolve the ACL src dp and port.
@@ -909,10 +998,7 @@ configuration.
         if self.stack:
             graph = self.stack.get('graph', None)
             if graph:
-                try:
-                    return sorted(networkx.all_shortest_paths(graph, src_dp, dest_dp))[0]
-                except (networkx.exception.NetworkXNoPath, networkx.exception.NodeNotFound):
-                    pass
+                return list(self._stack_path(graph, dest_dp, src_dp))
         return []
 
     def shortest_path_to_root(self):
@@ -74,6 +74,14 @@ class EventFaucetFastAdvertise(event.EventBase):  # pylint: disable=too-few-publ
     """Event used to trigger periodic fast network advertisements (eg LACP)."""
 
 
+class EventFaucetPacketInBatches(event.EventBase):  # pylint: disable=too-few-public-methods
+    """Event used to trigger processing of queued packet in batches."""
+
+
+class EventFaucetBgpRouteChanges(event.EventBase):  # pylint: disable=too-few-public-methods
+    """Event used to trigger processing of queued BGP route changes."""
+
+
 
 class Faucet(RyuAppBase):
     """A RyuApp that implements an L2/L3 learning VLAN switch.
@@ -101,20 +109,29 @@ class Faucet(RyuAppBase):
     metrics = None
     notifier = None
     valves_manager = None
+    _packet_in_batches_due = None
 
     def __init__(self, *args, **kwargs):
         super(Faucet, self).__init__(*args, **kwargs)
         self.api = kwargs['faucet_experimental_api']
         self.metrics = faucet_metrics.FaucetMetrics(reg=self._reg)
         self.bgp = faucet_bgp.FaucetBgp(
-            self.logger, self.exc_logname, self.metrics, self._send_flow_msgs)
+            self.logger, self.exc_logname, self.metrics, self._send_flow_msgs,
+            schedule_route_changes=self._schedule_bgp_route_changes)
         self.dot1x = faucet_dot1x.FaucetDot1x(
             self.logger, self.exc_logname, self.metrics, self._send_flow_msgs)
+        self.shard = int(self.get_setting('SHARD'))
+        self.shards = int(self.get_setting('SHARDS'))
+        event_sock = self.get_setting('EVENT_SOCK')
+        if event_sock and self.shards > 1:
+            event_sock = '%s.%u' % (event_sock, self.shard)
         self.notifier = faucet_event.FaucetEventNotifier(
-            self.get_setting('EVENT_SOCK'), self.metrics, self.logger)
+            event_sock, self.metrics, self.logger,
+            history=int(self.get_setting('EVENT_SOCK_HISTORY')))
         self.valves_manager = valves_manager.ValvesManager(
             self.logname, self.logger, self.metrics, self.notifier, self.bgp,
-            self.dot1x, self.get_setting('CONFIG_AUTO_REVERT'), self._send_flow_msgs)
+            self.dot1x, self.get_setting('CONFIG_AUTO_REVERT'), self._send_flow_msgs,
+            shard=self.shard, shards=self.shards)
         self.thread_managers = (self.bgp, self.dot1x, self.metrics, self.notifier)
 
     @kill_on_exception(exc_logname)
@@ -125,10 +142,13 @@ class Faucet(RyuAppBase):
     def start(self):
         super(Faucet, self).start()
 
-        # Start Prometheus
-        prom_port = int(self.get_setting('PROMETHEUS_PORT'))
+        # Start Prometheus (each shard on its own port).
+        prom_port = int(self.get_setting('PROMETHEUS_PORT')) + self.shard
         prom_addr = self.get_setting('PROMETHEUS_ADDR')
-        self.metrics.start(prom_port, prom_addr)
+        self.metrics.start(
+            prom_port, prom_addr,
+            cache_secs=float(self.get_setting('PROMETHEUS_CACHE_SECS')),
+            render_thread=self.get_setting('PROMETHEUS_RENDER_THREAD'))
 
         # Start event notifier
         notifier_thread = self.notifier.start()
@@ -146,6 +166,25 @@ class Faucet(RyuAppBase):
         self.api._register(self)
         self.send_event_to_observers(EventFaucetExperimentalAPIRegistered())
 
+    def _schedule_bgp_route_changes(self):
+        """Trigger processing of queued BGP route changes, after allowing them to coalesce."""
+        hub.spawn_after(
+            faucet_bgp.BGP_ROUTE_UPDATE_TIME,
+            self.send_event, self.__class__.__name__, EventFaucetBgpRouteChanges())
+
+    def _schedule_packet_in_batches(self, now):
+        """Trigger processing of packet in batches once the oldest is due (if any are queued)."""
+        due_secs = self.valves_manager.packet_in_batch_due_secs(now)
+        if due_secs is None:
+            return
+        due_secs = max(due_secs, valves_manager.PACKET_IN_BATCH_UPDATE_TIME)
+        due_time = now + due_secs
+        if self._packet_in_batches_due is not None and self._packet_in_batches_due <= due_time:
+            return
+        self._packet_in_batches_due = due_time
+        hub.spawn_after(
+            due_secs, self.send_event, self.__class__.__name__, EventFaucetPacketInBatches())
+
     def _delete_deconfigured_dp(self, deleted_dpid):
         self.logger.info(
             'Deleting de-configured %s', dpid_log(deleted_dpid))
@@ -232,7 +271,27 @@ class Faucet(RyuAppBase):
         valve, _, msg = self._get_valve(ryu_event, require_running=True)
         if valve is None:
             return
-        self.valves_manager.valve_packet_in(ryu_event.timestamp, valve, msg)
+        # Ryu timestamps events with time.time() on receipt, so batches
+        # are aged and scheduled on the same clock as _packet_in_batches().
+        now = ryu_event.timestamp
+        self.valves_manager.valve_packet_in(now, valve, msg)
+        if valve.dp.packetin_batch_size > 1:
+            self._schedule_packet_in_batches(now)
+
+    @set_ev_cls(EventFaucetPacketInBatches, MAIN_DISPATCHER)
+    @kill_on_exception(exc_logname)
+    def _packet_in_batches(self, _):
+        """Process any queued packet ins that have waited long enough."""
+        now = time.time()
+        self._packet_in_batches_due = None
+        self.valves_manager.valve_packet_in_batches(now)
+        self._schedule_packet_in_batches(now)
+
+    @set_ev_cls(EventFaucetBgpRouteChanges, MAIN_DISPATCHER)
+    @kill_on_exception(exc_logname)
+    def _bgp_route_changes(self, _):
+        """Apply queued BGP route changes."""
+        self.bgp.process_route_changes(time.time())
 
     @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER) # pylint: disable=no-member
     @kill_on_exception(exc_logname)
@@ -270,6 +329,7 @@ class Faucet(RyuAppBase):
         now = time.time()
         valve, ryu_dp, _ = self._get_valve(ryu_event)
         if valve is None:
+            self.valves_manager.datapath_wrong_shard(ryu_dp.id)
             return
         discovered_up_ports = {
             port.port_no for port in list(ryu_dp.ports.values())
@@ -289,7 +349,7 @@ class Faucet(RyuAppBase):
         valve, _, _ = self._get_valve(ryu_event)
         if valve is None:
             return
-        valve.datapath_disconnect()
+        self.valves_manager.datapath_disconnect(valve)
 
     @set_ev_cls(ofp_event.EventOFPDescStatsReply, MAIN_DISPATCHER) # pylint: disable=no-member
     @kill_on_exception(exc_logname)
@@ -317,6 +377,34 @@ class Faucet(RyuAppBase):
             return
         self.valves_manager.port_status_handler(valve, msg)
 
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER) # pylint: disable=no-member
+    @kill_on_exception(exc_logname)
+    def barrier_reply_handler(self, ryu_event):
+        """Handle a barrier reply, sending any messages queued for the datapath.
+
+        Args:
+            ryu_event (ryu.controller.ofp_event.EventOFPBarrierReply): trigger.
+        """
+        valve, _, _ = self._get_valve(ryu_event)
+        if valve is None:
+            return
+        valve.barrier_reply(time.time())
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER) # pylint: disable=no-member
+    @kill_on_exception(exc_logname)
+    def flowstats_reply_handler(self, ryu_event):
+        """Handle flows from a datapath, for a diff cold start.
+
+        Args:
+            ryu_event (ryu.controller.ofp_event.EventOFPFlowStatsReply): trigger.
+        """
+        valve, ryu_dp, msg = self._get_valve(ryu_event)
+        if valve is None:
+            return
+        more = bool(msg.flags & ryu_dp.ofproto.OFPMPF_REPLY_MORE)
+        self._send_flow_msgs(
+            valve, valve.flow_stats_reply(time.time(), msg.body, more), ryu_dp=ryu_dp)
+
     @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER) # pylint: disable=no-member
     @kill_on_exception(exc_logname)
     def flowremoved_handler(self, ryu_event):
@@ -18,7 +18,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import ipaddress
+import time
 
 import eventlet
 eventlet.monkey_patch()
@@ -30,6 +32,10 @@ from beka.beka import Beka # pylint: disable=wrong-import-position
 from faucet.valve_util import kill_on_exception
 
 
+BGP_ROUTE_UPDATE_TIME = 0.1
+BGP_ROUTE_BATCH_SIZE = 4096
+
+
 class BgpSpeakerKey:
     """Uniquely describe a BGP speaker."""
 
@@ -57,13 +63,17 @@ class FaucetBgp:
 
     exc_logname = None
 
-    def __init__(self, logger, exc_logname, metrics, send_flow_msgs):
+    def __init__(self, logger, exc_logname, metrics, send_flow_msgs,
+                 schedule_route_changes=None):
         self.logger = logger
         self.exc_logname = exc_logname
         self.metrics = metrics
         self._send_flow_msgs = send_flow_msgs
+        self._schedule_route_changes = schedule_route_changes
         self._dp_bgp_speakers = {}
         self._dp_bgp_rib = {}
+        self._route_changes = {}
+        self._route_queue_depth_labels = {}
         self._valves = None
         self.thread = None
 
@@ -95,48 +105,113 @@ class FaucetBgp:
 
     @kill_on_exception(exc_logname)
     def _bgp_route_handler(self, path_change, bgp_speaker_key):
-        """Handle a BGP change event.
+        """Queue a BGP change event, to be applied by process_route_changes().
+
+        Changes to the same prefix are coalesced, so only the last is applied.
+        Processing is scheduled when the first change is queued.
 
         Args:
             path_change (ryu.services.protocols.bgp.bgpspeaker.EventPrefix): path change
         """
-        dp_id = bgp_speaker_key.dp_id
-        vlan_vid = bgp_speaker_key.vlan_vid
-        valve, vlan = self._valve_vlan(dp_id, vlan_vid)
-        if vlan is None:
-            return
         prefix = ipaddress.ip_network(str(path_change.prefix))
-        route_str = 'BGP route %s' % prefix
-
-        if path_change.next_hop:
+        nexthop = None
+        if not path_change.is_withdraw:
             nexthop = ipaddress.ip_address(str(path_change.next_hop))
+        if not self._route_changes:
+            self._schedule()
+        if bgp_speaker_key not in self._route_changes:
+            self._route_changes[bgp_speaker_key] = collections.OrderedDict()
+        route_changes = self._route_changes[bgp_speaker_key]
+        queued_time = time.time()
+        if prefix in route_changes:
+            # Convergence time counts from the first, not latest change.
+            _, queued_time = route_changes[prefix]
+        route_changes[prefix] = (nexthop, queued_time)
+
+    def _apply_route_change(self, valve, vlan, bgp_speaker_key, prefix, nexthop):
+        """Apply a BGP route change to the RIB, and return flowmods."""
+        route_str = 'BGP route %s' % prefix
+        if nexthop is not None:
             route_str = 'BGP route %s nexthop %s' % (prefix, nexthop)
 
             if vlan.is_faucet_vip(nexthop):
                 self.logger.error(
                     'Skipping %s because nexthop cannot be us' % route_str)
-                return
+                return []
 
             if valve.router_vlan_for_ip_gw(vlan, nexthop) is None:
                 self.logger.info(
                     'Skipping %s because nexthop not in %s' % (route_str, vlan))
-                return
+                return []
 
         if bgp_speaker_key not in self._dp_bgp_rib:
             self._dp_bgp_rib[bgp_speaker_key] = {}
 
-        flowmods = []
-        if path_change.is_withdraw:
+        if nexthop is None:
             self.logger.info('withdraw %s', route_str)
             if prefix in self._dp_bgp_rib[bgp_speaker_key]:
                 del self._dp_bgp_rib[bgp_speaker_key][prefix]
-            flowmods = valve.del_route(vlan, prefix)
-        else:
-            self.logger.info('add %s', route_str)
-            self._dp_bgp_rib[bgp_speaker_key][prefix] = nexthop
-            flowmods = valve.add_route(vlan, nexthop, prefix)
-        if flowmods:
-            self._send_flow_msgs(valve, flowmods)
+            return valve.del_route(vlan, prefix)
+        self.logger.info('add %s', route_str)
+        self._dp_bgp_rib[bgp_speaker_key][prefix] = nexthop
+        return valve.add_route(vlan, nexthop, prefix)
+
+    def route_changes_queued(self):
+        """Return True if any BGP route changes are queued."""
+        return bool(self._route_changes)
+
+    def _schedule(self):
+        """Request process_route_changes() be called."""
+        if self._schedule_route_changes is not None:
+            self._schedule_route_changes()
+
+    def _set_route_queue_depth(self, bgp_speaker_key, speaker_labels, depth):
+        self._route_queue_depth_labels[bgp_speaker_key] = speaker_labels
+        self.metrics.bgp_route_queue_depth.labels( # pylint: disable=no-member
+            **speaker_labels).set(depth)
+
+    def _discard_route_changes(self, bgp_speaker_key):
+        """Discard any queued route changes for a BGP speaker."""
+        self._route_changes.pop(bgp_speaker_key, None)
+        speaker_labels = self._route_queue_depth_labels.get(bgp_speaker_key, None)
+        if speaker_labels is not None:
+            self._set_route_queue_depth(bgp_speaker_key, speaker_labels, 0)
+
+    @kill_on_exception(exc_logname)
+    def process_route_changes(self, now):
+        """Apply a batch of queued BGP route changes for each speaker.
+
+        Each batch results in one set of flowmods sent to the DP. Changes
+        for a speaker whose VLAN no longer exists are discarded.
+        Processing is scheduled again if any changes remain queued.
+
+        Args:
+            now (float): current epoch time.
+        """
+        for bgp_speaker_key, route_changes in list(self._route_changes.items()):
+            valve, vlan = self._valve_vlan(bgp_speaker_key.dp_id, bgp_speaker_key.vlan_vid)
+            if vlan is None:
+                self._discard_route_changes(bgp_speaker_key)
+                continue
+            batch = [
+                route_changes.popitem(last=False)
+                for _ in range(min(len(route_changes), BGP_ROUTE_BATCH_SIZE))]
+            if not route_changes:
+                del self._route_changes[bgp_speaker_key]
+            flowmods = []
+            for prefix, (nexthop, _) in batch:
+                flowmods.extend(self._apply_route_change(
+                    valve, vlan, bgp_speaker_key, prefix, nexthop))
+            if flowmods:
+                self._send_flow_msgs(valve, flowmods)
+            speaker_labels = dict(
+                valve.dp.base_prom_labels(), vlan=vlan.vid, ipv=bgp_speaker_key.ipv)
+            self._set_route_queue_depth(bgp_speaker_key, speaker_labels, len(route_changes))
+            oldest_queued_time = min([queued_time for _, (_, queued_time) in batch])
+            self.metrics.bgp_route_convergence_secs.labels( # pylint: disable=no-member
+                **speaker_labels).observe(max(now - oldest_queued_time, 0))
+        if self._route_changes:
+            self._schedule()
 
     @staticmethod
     def _vlan_prefixes_by_ipv(vlan, ipv):
@@ -178,9 +253,10 @@ class FaucetBgp:
         return beka
 
     def shutdown_bgp_speakers(self):
-        """Shutdown any active BGP speakers."""
-        for bgp_speaker in self._dp_bgp_speakers.values():
+        """Shutdown any active BGP speakers, discarding their queued route changes."""
+        for bgp_speaker_key, bgp_speaker in self._dp_bgp_speakers.items():
             bgp_speaker.shutdown()
+            self._discard_route_changes(bgp_speaker_key)
         self._dp_bgp_speakers = {}
 
     def _add_bgp_speaker(self, valve, bgp_speaker_key, bgp_router):
@@ -189,12 +265,13 @@ class FaucetBgp:
             bgp_speaker = self._dp_bgp_speakers[bgp_speaker_key]
             if bgp_speaker_key in self._dp_bgp_rib:
                 # Re-add routes (to avoid flapping BGP even when VLAN cold starts).
+                flowmods = []
+                bgp_vlan = bgp_router.bgp_vlan()
                 for prefix, nexthop in self._dp_bgp_rib[bgp_speaker_key].items():
                     self.logger.info('Re-adding %s via %s' % (prefix, nexthop))
-                    bgp_vlan = bgp_router.bgp_vlan()
-                    flowmods = valve.add_route(bgp_vlan, nexthop, prefix)
-                    if flowmods:
-                        self._send_flow_msgs(valve, flowmods)
+                    flowmods.extend(valve.add_route(bgp_vlan, nexthop, prefix))
+                if flowmods:
+                    self._send_flow_msgs(valve, flowmods)
         else:
             self.logger.info('Adding %s' % bgp_speaker_key)
             bgp_speaker = self._create_bgp_speaker_for_vlan(bgp_speaker_key, bgp_router)
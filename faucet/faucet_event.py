@@ -2,8 +2,6 @@
 
 # TODO: events are currently schema-less. This is to facilitate rapid prototyping, and will change.
 # TODO: not all cases where a notified client fails or could block, have been tested.
-# only one client is supported (multiple clients should be implemented with a client that
-# copies/pushes to a message bus)
 
 # Copyright (C) 2013 Nippon Telegraph and Telephone Corporation.
 # Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
@@ -25,46 +23,80 @@
 import json
 import os
 import socket
+import struct
 import time
-from contextlib import contextmanager
+from collections import deque
 
 import eventlet
 eventlet.monkey_patch()
 
+import msgpack # pylint: disable=wrong-import-position
+
 from ryu.lib import hub # pylint: disable=wrong-import-position
 from ryu.lib.hub import StreamServer # pylint: disable=wrong-import-position
 
 
-class NonBlockLock:
-    """Non blocking lock that can be used as a context manager."""
+JSON_FRAMING = 'json'
+MSGPACK_FRAMING = 'msgpack'
+FRAMINGS = frozenset([JSON_FRAMING, MSGPACK_FRAMING])
+
 
-    def __init__(self):
-        self._lock = eventlet.semaphore.Semaphore()
+class FaucetEvent:
+    """An event, encoded at most once per framing and shared by all clients."""
 
-    @contextmanager
-    def acquire_nonblock(self):
-        """Attempt to acquire a lock."""
-        result = self._lock.acquire(blocking=False)
-        yield result
-        if result:
-            self.release()
+    __slots__ = ['event_id', 'event', '_encoded']
 
-    def release(self):
-        """Release lock when done."""
-        self._lock.release()
+    def __init__(self, event):
+        self.event_id = event['event_id']
+        self.event = event
+        self._encoded = {}
+
+    def encode(self, framing):
+        """Return event encoded for a framing.
+
+        JSON events are newline terminated, msgpack events are prefixed
+        with their length as a 32 bit, network byte order integer.
+        """
+        event_bytes = self._encoded.get(framing, None)
+        if event_bytes is None:
+            if framing == MSGPACK_FRAMING:
+                payload = msgpack.packb(self.event, use_bin_type=True)
+                event_bytes = struct.pack('!I', len(payload)) + payload
+            else:
+                event_bytes = '\n'.join((json.dumps(self.event), '')).encode('UTF-8')
+            self._encoded[framing] = event_bytes
+        return event_bytes
 
 
 class FaucetEventNotifier:
-    """Event notification, via Unix domain socket."""
+    """Event notification, via Unix domain socket.
+
+    Any number of clients may connect. Recent events are kept in a bounded
+    history shared by all clients, and each client has its own position in
+    that history, so a slow client only loses its own oldest events and never
+    delays notify() or other clients.
+
+    On connection, a client may send a single JSON request, e.g.
+    {"resume_from": 123, "framing": "msgpack"} to resume from a given
+    event ID (if still in the history), and/or select msgpack framing.
+    Clients that send no request receive JSON lines, starting with the
+    oldest event not yet sent to any client.
+    """
 
-    def __init__(self, socket_path, metrics, logger):
+    HANDSHAKE_SECS = 0.1
+    MAX_REQUEST_BYTES = 1024
+    MAX_SEND_EVENTS = 64
+
+    def __init__(self, socket_path, metrics, logger, history=1024):
         self.logger = logger
         self.socket_path = self.check_path(socket_path)
         self.metrics = metrics
         self.event_id = 0
         self.thread = None
-        self.lock = NonBlockLock()
-        self.event_q = eventlet.queue.Queue(120)
+        self.history = deque(maxlen=history)
+        self.clients = 0
+        self.undelivered_event_id = 1
+        self._event_ready = eventlet.event.Event()
 
     def start(self):
         """Start socket server."""
@@ -74,25 +106,79 @@ class FaucetEventNotifier:
             self.thread.name = 'event'
         return self.thread
 
+    def _client_request(self, sock):
+        """Return framing and event ID to resume from requested by a client."""
+        framing = JSON_FRAMING
+        resume_from = None
+        sock.settimeout(self.HANDSHAKE_SECS)
+        try:
+            request = sock.recv(self.MAX_REQUEST_BYTES)
+        except socket.timeout:
+            request = None
+        finally:
+            sock.settimeout(None)
+        if request:
+            try:
+                request = json.loads(request.decode('UTF-8'))
+                framing = request.get('framing', JSON_FRAMING)
+                resume_from = request.get('resume_from', None)
+                if framing not in FRAMINGS:
+                    raise ValueError('unknown framing %s' % framing)
+                if resume_from is not None:
+                    resume_from = max(int(resume_from), 1)
+            except (ValueError, TypeError, AttributeError) as err:
+                self.logger.info('ignoring invalid event client request: %s', err)
+                framing = JSON_FRAMING
+                resume_from = None
+        return (framing, resume_from)
+
+    def _pending_events(self, next_event_id):
+        """Return events from next_event_id (or oldest retained), and how many were dropped."""
+        oldest_event_id = self.history[0].event_id
+        dropped = 0
+        if next_event_id > self.event_id + 1:
+            # Event IDs restarted since client last connected.
+            next_event_id = oldest_event_id
+        elif next_event_id < oldest_event_id:
+            dropped = oldest_event_id - next_event_id
+            next_event_id = oldest_event_id
+        first = next_event_id - oldest_event_id
+        last = min(len(self.history), first + self.MAX_SEND_EVENTS)
+        return ([self.history[i] for i in range(first, last)], dropped)
+
     def _loop(self, sock, _addr):
-        """Serve events."""
-        with self.lock.acquire_nonblock() as result:
-            if not result:
-                self.logger.info('multiple event clients not supported')
-            else:
-                self.logger.info('event client connected')
-                while True:
-                    event = self.event_q.get()
-                    event_bytes = bytes('\n'.join((json.dumps(event), '')).encode('UTF-8'))
-                    try:
-                        sock.sendall(event_bytes)
-                    except (socket.error, IOError) as err:
-                        self.logger.info('event client disconnected: %s', err)
-                        break
+        """Serve events to one client until it disconnects."""
         try:
+            framing, resume_from = self._client_request(sock)
+        except (socket.error, IOError) as err:
+            self.logger.info('event client disconnected: %s', err)
             sock.close()
-        except (socket.error, IOError):
-            pass
+            return
+        next_event_id = resume_from or self.undelivered_event_id
+        self.clients += 1
+        self.metrics.faucet_event_clients.set(self.clients)
+        self.logger.info(
+            'event client connected (%s framing, from event %u)', framing, next_event_id)
+        try:
+            while True:
+                while not self.history or next_event_id == self.event_id + 1:
+                    self._event_ready.wait()
+                events, dropped = self._pending_events(next_event_id)
+                if dropped:
+                    self.logger.info('event client too slow, %u events dropped', dropped)
+                    self.metrics.faucet_event_client_dropped.inc(dropped)
+                sock.sendall(b''.join([event.encode(framing) for event in events]))
+                next_event_id = events[-1].event_id + 1
+                self.undelivered_event_id = max(self.undelivered_event_id, next_event_id)
+        except (socket.error, IOError) as err:
+            self.logger.info('event client disconnected: %s', err)
+        finally:
+            self.clients -= 1
+            self.metrics.faucet_event_clients.set(self.clients)
+            try:
+                sock.close()
+            except (socket.error, IOError):
+                pass
 
     def notify(self, dp_id, dp_name, event_dict):
         """Notify of an event."""
@@ -109,9 +195,11 @@ class FaucetEventNotifier:
             assert header_key not in event_dict
         event.update(event_dict)
         self.metrics.faucet_event_id.set(event['event_id'])
-        if self.event_q.full():
-            self.event_q.get()
-        self.event_q.put(event)
+        self.history.append(FaucetEvent(event))
+        # Wake all waiting clients; encoding and sending happens in their threads.
+        event_ready = self._event_ready
+        self._event_ready = eventlet.event.Event()
+        event_ready.send()
 
     def check_path(self, socket_path):
         """Check that socket_path is valid."""
@@ -56,6 +56,12 @@ class FaucetMetrics(PromClient):
         self.faucet_event_id = self._gauge(
             'faucet_event_id',
             'highest/most recent event ID to be sent', [])
+        self.faucet_event_clients = self._gauge(
+            'faucet_event_clients',
+            'number of event clients connected', [])
+        self.faucet_event_client_dropped = self._counter(
+            'faucet_event_client_dropped',
+            'number of events dropped because an event client was too slow', [])
         self.faucet_config_reload_warm = self._dpid_counter(
             'faucet_config_reload_warm',
             'number of warm, differences only config reloads executed')
@@ -65,6 +71,10 @@ class FaucetMetrics(PromClient):
         self.of_ignored_packet_ins = self._dpid_counter(
             'of_ignored_packet_ins',
             'number of OF packet_ins received but ignored from DP (due to rate limiting)')
+        self.of_dropped_packet_ins = self._counter(
+            'of_dropped_packet_ins',
+            'number of OF packet_ins dropped by per port packet class rate limiting',
+            self.REQUIRED_LABELS + ['packet_class'])
         self.of_unexpected_packet_ins = self._dpid_counter(
             'of_unexpected_packet_ins',
             'number of OF packet_ins received that are unexpected from DP (e.g. for unknown VLAN)')
@@ -80,12 +90,24 @@ class FaucetMetrics(PromClient):
         self.of_flowmsgs_sent = self._dpid_counter(
             'of_flowmsgs_sent',
             'number of OF flow messages (and packet outs) sent to DP')
+        self.of_send_queue_depth = self._dpid_gauge(
+            'of_send_queue_depth',
+            'number of OF messages queued waiting for DP to process earlier messages')
+        self.of_send_queue_drain_secs = self._histogram(
+            'of_send_queue_drain_secs',
+            'time taken to send all queued OF messages to DP',
+            self.REQUIRED_LABELS,
+            (0.001, 0.01, 0.1, 1, 10))
         self.of_errors = self._dpid_counter(
             'of_errors',
             'number of OF errors received from DP')
         self.of_dp_connections = self._dpid_counter(
             'of_dp_connections',
             'number of OF connections from a DP')
+        self.of_dp_wrong_shard_connections = self._counter(
+            'of_dp_wrong_shard_connections',
+            'number of OF connections from a DP controlled by another shard',
+            ['dp_id', 'shard'])
         self.of_dp_disconnections = self._dpid_counter(
             'of_dp_disconnections',
             'number of OF connections from a DP')
@@ -101,6 +123,18 @@ class FaucetMetrics(PromClient):
             'vlan_neighbors',
             'number of L3 neighbors on a VLAN (whether resolved to L2 addresses, or not)',
             self.REQUIRED_LABELS + ['vlan', 'ipv'])
+        self.vlan_neighbor_resolve_backlog = self._gauge(
+            'vlan_neighbor_resolve_backlog',
+            'number of L3 neighbors due for resolution, deferred by max_hosts_per_resolve_cycle',
+            self.REQUIRED_LABELS + ['vlan', 'ipv'])
+        self.proactive_learn_cache_hits = self._gauge(
+            'proactive_learn_cache_hits',
+            'number of L3 hosts not relearned, because recently learned',
+            self.REQUIRED_LABELS + ['ipv'])
+        self.proactive_learn_cache_misses = self._gauge(
+            'proactive_learn_cache_misses',
+            'number of L3 hosts learned, because not recently learned',
+            self.REQUIRED_LABELS + ['ipv'])
         self.vlan_learn_bans = self._gauge(
             'vlan_learn_bans',
             'number of times learning was banned on a VLAN',
@@ -114,6 +148,16 @@ class FaucetMetrics(PromClient):
             'FAUCET packet in processing time',
             self.REQUIRED_LABELS,
             (0.0001, 0.001, 0.01, 0.1, 1))
+        self.faucet_packet_in_batch_size = self._histogram(
+            'faucet_packet_in_batch_size',
+            'number of packet ins processed per packet in batch',
+            self.REQUIRED_LABELS,
+            (1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self.faucet_packet_in_batch_latency_secs = self._histogram(
+            'faucet_packet_in_batch_latency_secs',
+            'time first packet in of a batch waited before batch processed',
+            self.REQUIRED_LABELS,
+            (0.0001, 0.001, 0.01, 0.1, 1))
         self.faucet_valve_service_secs = self._histogram(
             'faucet_valve_service_secs',
             'FAUCET valve service processing time',
@@ -127,6 +171,15 @@ class FaucetMetrics(PromClient):
             'bgp_neighbor_routes',
             'BGP neighbor route count',
             self.REQUIRED_LABELS + ['vlan', 'neighbor', 'ipv'])
+        self.bgp_route_queue_depth = self._gauge(
+            'bgp_route_queue_depth',
+            'number of BGP route changes queued waiting to be applied',
+            self.REQUIRED_LABELS + ['vlan', 'ipv'])
+        self.bgp_route_convergence_secs = self._histogram(
+            'bgp_route_convergence_secs',
+            'time oldest BGP route change in a batch waited before being applied',
+            self.REQUIRED_LABELS + ['vlan', 'ipv'],
+            (0.01, 0.1, 1, 10, 100))
         self.learned_macs = self._gauge(
             'learned_macs',
             ('MAC address stored as 64bit number to DP ID, port, VLAN, '
@@ -161,6 +214,11 @@ class FaucetMetrics(PromClient):
         self.stack_probes_received = self._dpid_counter(
             'stack_probes_received',
             'number of stacking messages received')
+        self.stack_flood_rules_changed = self._histogram(
+            'stack_flood_rules_changed',
+            'number of flood rules changed by a stack topology change',
+            self.REQUIRED_LABELS,
+            (0, 10, 100, 1000, 10000))
         self.dp_dot1x_success = self._dpid_counter(
             'dp_dot1x_success',
             'number of successful authentications on dp')
@@ -207,6 +265,7 @@ class FaucetMetrics(PromClient):
 
     def reset_dpid(self, dp_labels):
         """Set all DPID-only counter/gauges to 0."""
+        self.exposition.invalidate()
         for counter in self._dpid_counters.values():
             counter.labels(**dp_labels).inc(0)
         for gauge in self._dpid_gauges.values():
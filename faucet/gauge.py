@@ -16,16 +16,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import partial
 import time
 
 from ryu.controller.handler import MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
+from ryu.controller import event
 from ryu.controller import ofp_event
+from ryu.lib import hub
 
 from faucet import valve_of
 from faucet.conf import InvalidConfigError
 from faucet.config_parser import watcher_parser
-from faucet.gauge_pollers import GaugePortStatePoller
+from faucet.gauge_influx import stop_unused_influx_writers
+from faucet.gauge_pollers import GaugePollScheduler, GaugePortStatePoller
 from faucet.gauge_prom import GaugePrometheusClient
 from faucet.valves_manager import ConfigWatcher
 from faucet.valve_of import ofp, parser
@@ -34,6 +38,10 @@ from faucet.valve_util import dpid_log, kill_on_exception
 from faucet.watcher import watcher_factory
 
 
+class EventGaugePoll(event.EventBase):  # pylint: disable=too-few-public-methods
+    """Event used to trigger sending of any due stats requests."""
+
+
 class Gauge(RyuAppBase):
     """Ryu app for polling Faucet controlled datapaths for stats/state.
 
@@ -52,8 +60,16 @@ class Gauge(RyuAppBase):
         self.config_watcher = ConfigWatcher()
         self.faucet_config_watchers = []
         self.prom_client = GaugePrometheusClient(reg=self._reg)
+        self.poll_scheduler = GaugePollScheduler()
         self.thread_managers = (self.prom_client,)
 
+    def start(self):
+        super(Gauge, self).start()
+        thread = hub.spawn(partial(
+            self._thread_reschedule, EventGaugePoll(), self.poll_scheduler.tick_sec, jitter=0))
+        thread.name = 'gauge_poll'
+        self.threads.append(thread)
+
     @kill_on_exception(exc_logname)
     def _check_thread_exception(self):
         super(Gauge, self)._check_thread_exception()
@@ -83,6 +99,7 @@ class Gauge(RyuAppBase):
 
         for old_watchers in self.watchers.values():
             self._stop_watchers(old_watchers)
+        stop_unused_influx_writers(new_confs)
         new_watchers = {}
         for watcher in watchers:
             watcher_dpid = watcher.dp.dp_id
@@ -143,7 +160,7 @@ class Gauge(RyuAppBase):
                         msg = parser.OFPPortStatus(
                             ryu_dp, desc=port, reason=ofp.OFPPR_ADD)
                         watcher.update(timestamp, msg)
-                watcher.start(ryu_dp, is_active)
+                watcher.start(ryu_dp, is_active, self.poll_scheduler)
 
     @kill_on_exception(exc_logname)
     def _datapath_connect(self, ryu_event):
@@ -181,6 +198,12 @@ class Gauge(RyuAppBase):
         self.logger.info('%s down', dpid_log(ryu_dp.id))
         self._stop_watchers(watchers)
 
+    @set_ev_cls(EventGaugePoll, MAIN_DISPATCHER)
+    @kill_on_exception(exc_logname)
+    def _poll(self, _):
+        """Send any stats requests that are due."""
+        self.poll_scheduler.tick(time.time())
+
     _WATCHER_HANDLERS = {
         ofp_event.EventOFPPortStatus: 'port_state',  # pylint: disable=no-member
         ofp_event.EventOFPPortStatsReply: 'port_stats',  # pylint: disable=no-member
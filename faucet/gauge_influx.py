@@ -16,45 +16,164 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import deque
+from itertools import islice
+
 from influxdb import InfluxDBClient
 from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
 import requests # pytype: disable=pyi-error
+from ryu.lib import hub
 from faucet.gauge_pollers import GaugePortStatePoller, GaugeFlowTablePoller, GaugePortStatsPoller
 
 
+_INFLUX_CONF_KEYS = (
+    'influx_host', 'influx_port', 'influx_user', 'influx_pwd', 'influx_db',
+    'influx_timeout', 'influx_retries', 'influx_batch_points', 'influx_batch_secs',
+    'influx_buffer_points')
+_INFLUX_WRITERS = {}
+
+
+def _influx_writer_key(conf):
+    return tuple(getattr(conf, conf_key) for conf_key in _INFLUX_CONF_KEYS)
+
+
+def influx_writer(conf, logger):
+    """Return the InfluxWriter shared by all shippers with the same InfluxDB config."""
+    writer_key = _influx_writer_key(conf)
+    writer = _INFLUX_WRITERS.get(writer_key, None)
+    if writer is None:
+        writer = InfluxWriter(conf, logger)
+        _INFLUX_WRITERS[writer_key] = writer
+    return writer
+
+
+def stop_unused_influx_writers(watcher_confs):
+    """Stop InfluxWriters not used by any of watcher_confs (e.g. after a config reload)."""
+    writer_keys = {
+        _influx_writer_key(conf) for conf in watcher_confs if conf.db_type == 'influx'}
+    for writer_key in set(_INFLUX_WRITERS) - writer_keys:
+        _INFLUX_WRITERS.pop(writer_key).stop()
+
+
+class InfluxWriter:
+    """Write points to an InfluxDB, on behalf of all shippers using it.
+
+    One client (and so one pooled keep-alive HTTP session) is kept. Points
+    are buffered and written in the background, in batches of up to
+    influx_batch_points, when a batch is full or every influx_batch_secs.
+    While InfluxDB is unreachable, up to influx_buffer_points are kept
+    (oldest dropped first) to be written when it is reachable again.
+    """
+
+    ship_error_prefix = 'error shipping points: '
+
+    def __init__(self, conf, logger):
+        self.conf = conf
+        self.logger = logger
+        self.client = None
+        self.points = deque(maxlen=conf.influx_buffer_points)
+        self.dropped_points = 0
+        self.flush_event = hub.Event()
+        self.thread = None
+
+    def _get_client(self):
+        if self.client is None:
+            self.client = InfluxDBClient(
+                host=self.conf.influx_host,
+                port=self.conf.influx_port,
+                username=self.conf.influx_user,
+                password=self.conf.influx_pwd,
+                database=self.conf.influx_db,
+                timeout=self.conf.influx_timeout,
+                retries=self.conf.influx_retries)
+        return self.client
+
+    def start(self):
+        """Start background flushing."""
+        if self.thread is None:
+            self.thread = hub.spawn(self._flush_loop)
+            self.thread.name = 'influx_writer'
+
+    def stop(self):
+        """Stop background flushing (any buffered points are discarded)."""
+        if self.thread is not None:
+            hub.kill(self.thread)
+            self.thread = None
+
+    def _flush_loop(self):
+        while True:
+            self.flush_event.wait(timeout=self.conf.influx_batch_secs)
+            self.flush_event.clear()
+            self.flush()
+
+    def write(self, points):
+        """Buffer points to be written in the background.
+
+        Returns:
+            bool: True if all points buffered.
+        """
+        overflow = len(self.points) + len(points) - self.points.maxlen
+        if overflow > 0:
+            self.dropped_points += overflow
+            self.logger.warning(
+                '%s buffer full, dropped %u oldest points' % (self.ship_error_prefix, overflow))
+        self.points.extend(points)
+        self.start()
+        if len(self.points) >= self.conf.influx_batch_points:
+            self.flush_event.set()
+        return overflow <= 0
+
+    def _write_points(self, points):
+        try:
+            if self._get_client().write_points(points=points, time_precision='s'):
+                return True
+            self.logger.warning(
+                '%s failed to update InfluxDB' % self.ship_error_prefix)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout,
+                InfluxDBClientError, InfluxDBServerError) as err:
+            self.logger.warning('%s %s' % (self.ship_error_prefix, err))
+        return False
+
+    def flush(self):
+        """Write buffered points in batches, until none left or a write fails.
+
+        Returns:
+            bool: True if all buffered points were written.
+        """
+        while self.points:
+            batch = list(islice(self.points, self.conf.influx_batch_points))
+            for _ in batch:
+                self.points.popleft()
+            if not self._write_points(batch):
+                # Keep unwritten points, ahead of any buffered meanwhile.
+                points = batch + list(self.points)
+                overflow = len(points) - self.points.maxlen
+                if overflow > 0:
+                    self.dropped_points += overflow
+                    self.logger.warning(
+                        '%s buffer full, dropped %u oldest points' % (
+                            self.ship_error_prefix, overflow))
+                self.points = deque(points, maxlen=self.points.maxlen)
+                return False
+        return True
+
+
 class InfluxShipper:
     """Convenience class for shipping values to InfluxDB.
 
     Inheritors must have a WatcherConf object as conf.
     """
     conf = None
-    ship_error_prefix = 'error shipping points: '
     logger = None
+    writer = None
 
     def ship_points(self, points):
-        """Make a connection to InfluxDB and ship points."""
-
-        if self.conf is not None:
-            try:
-                client = InfluxDBClient(
-                    host=self.conf.influx_host,
-                    port=self.conf.influx_port,
-                    username=self.conf.influx_user,
-                    password=self.conf.influx_pwd,
-                    database=self.conf.influx_db,
-                    timeout=self.conf.influx_timeout)
-                if client:
-                    if client.write_points(points=points, time_precision='s'):
-                        return True
-                    self.logger.warning(
-                        '%s failed to update InfluxDB' % self.ship_error_prefix)
-                else:
-                    self.logger.warning(
-                        '%s error connecting to InfluxDB' % self.ship_error_prefix)
-            except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout,
-                    InfluxDBClientError, InfluxDBServerError) as err:
-                self.logger.warning('%s %s' % (self.ship_error_prefix, err))
-        return False
+        """Queue points to be shipped to InfluxDB by the shared writer."""
+        if self.conf is None:
+            return False
+        if self.writer is None:
+            self.writer = influx_writer(self.conf, self.logger)
+        return self.writer.write(points)
 
     @staticmethod
     def make_point(tags, rcv_time, stat_name, stat_val):
@@ -195,10 +314,7 @@ Example:
 """
 
     def _update(self, rcv_time, msg):
-        points = []
-        jsondict = msg.to_jsondict()
-        for stats_reply in jsondict['OFPFlowStatsReply']['body']:
-            stats = stats_reply['OFPFlowStats']
-            for var, tags, count in self._parse_flow_stats(stats):
-                points.append(self.make_point(tags, rcv_time, var, count))
+        points = [
+            self.make_point(tags, rcv_time, var, count)
+            for var, tags, count in self._flow_stat_records(msg)]
         self.ship_points(points)
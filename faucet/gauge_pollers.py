@@ -16,11 +16,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import defaultdict
 import logging
-import random
 import time
+import zlib
 
-from ryu.lib import hub
 from ryu.ofproto import ofproto_v1_3 as ofp
 from ryu.ofproto import ofproto_v1_3_parser as parser
 
@@ -49,7 +49,7 @@ class GaugePoller:
         self.prom_client.dp_status.labels(
             **dict(dp_id=hex(self.dp.dp_id), dp_name=self.dp.name)).set(dp_status) # pylint: disable=no-member
 
-    def start(self, ryudp, active):
+    def start(self, ryudp, active, scheduler=None): # pylint: disable=unused-argument
         """Start the poller."""
         self.ryudp = ryudp
         self._running = True
@@ -139,53 +139,172 @@ class GaugePoller:
         return '\t'.join((rcv_time_str, stat_name, str(stat_val))) + '\n'
 
 
+class GaugePollScheduler:
+    """Timer wheel sending stats requests for all pollers from one thread.
+
+    The wheel has one slot per tick, holding the pollers due in that slot.
+    A poller is first scheduled at an offset into its interval derived from
+    a hash of its DP ID and type (rather than at a random delay), so
+    requests to many DPs are spread deterministically across the interval,
+    and keep the same spread when Gauge restarts.
+    """
+
+    TICK_SEC = 1
+
+    def __init__(self, tick_sec=TICK_SEC):
+        self.tick_sec = tick_sec
+        self.wheel = defaultdict(dict)
+        self.poller_slots = {}
+        self.last_slot = None
+
+    def _slot(self, now):
+        return int(now // self.tick_sec)
+
+    def _interval_slots(self, poller):
+        return max(1, int(poller.interval // self.tick_sec))
+
+    @staticmethod
+    def poll_offset(poller, interval_slots):
+        """Return deterministic offset of a poller into its interval."""
+        poller_key = '%s %s' % (poller.dp.dp_id, poller.conf.type)
+        return zlib.crc32(poller_key.encode()) % interval_slots
+
+    def _schedule(self, poller, slot):
+        self.wheel[slot][poller] = None
+        self.poller_slots[poller] = slot
+
+    def add(self, poller, now):
+        """Schedule a poller's first request.
+
+        Args:
+            poller (GaugeThreadPoller): poller to schedule.
+            now (float): current epoch time.
+        """
+        self.remove(poller)
+        now_slot = self._slot(now)
+        interval_slots = self._interval_slots(poller)
+        offset = self.poll_offset(poller, interval_slots)
+        slot = now_slot + ((offset - now_slot) % interval_slots)
+        if slot == now_slot:
+            slot += interval_slots
+        self._schedule(poller, slot)
+
+    def remove(self, poller):
+        """Unschedule a poller."""
+        slot = self.poller_slots.pop(poller, None)
+        if slot is None:
+            return
+        pollers = self.wheel[slot]
+        pollers.pop(poller, None)
+        if not pollers:
+            del self.wheel[slot]
+
+    def pollers(self):
+        """Return number of scheduled pollers."""
+        return len(self.poller_slots)
+
+    def _due_slots(self, now_slot):
+        if self.last_slot is None or now_slot - self.last_slot > len(self.wheel):
+            return sorted(slot for slot in self.wheel if slot <= now_slot)
+        return [slot for slot in range(self.last_slot + 1, now_slot + 1) if slot in self.wheel]
+
+    def tick(self, now):
+        """Send requests for all pollers due since the last tick.
+
+        Args:
+            now (float): current epoch time.
+        Returns:
+            int: number of requests sent.
+        """
+        now_slot = self._slot(now)
+        polled = 0
+        for slot in self._due_slots(now_slot):
+            for poller in self.wheel.pop(slot):
+                del self.poller_slots[poller]
+                poller.poll(now)
+                polled += 1
+                interval_slots = self._interval_slots(poller)
+                next_slot = slot + interval_slots
+                if next_slot <= now_slot:
+                    # Too late to keep up, skip missed polls but keep offset.
+                    next_slot += ((now_slot - next_slot) // interval_slots + 1) * interval_slots
+                self._schedule(poller, next_slot)
+        self.last_slot = now_slot
+        return polled
+
+
 class GaugeThreadPoller(GaugePoller):
-    """A ryu thread object for sending and receiving OpenFlow stats requests.
+    """A poller sending OpenFlow stats requests when scheduled.
 
-    The thread runs in a loop sending a request, sleeping then checking a
-    response was received before sending another request.
+    A GaugePollScheduler calls poll() every interval, which checks a
+    response to the last request was received before sending another
+    request. The interval backs off (up to MAX_INTERVAL_MULTIPLIER times
+    the configured interval) while the datapath is slow to reply, and
+    returns to the configured interval once replies are fast again.
 
     The methods send_req, update and no_response should be implemented by
     subclasses.
     """
 
+    MAX_INTERVAL_MULTIPLIER = 8
+
     def __init__(self, conf, logname, prom_client):
         super(GaugeThreadPoller, self).__init__(conf, logname, prom_client)
-        self.thread = None
+        self.scheduler = None
         self.interval = self.conf.interval
+        self.req_time = None
+        self.reply_latency = None
         self.ryudp = None
 
-    def start(self, ryudp, active):
+    def start(self, ryudp, active, scheduler=None):
         self.stop()
         super(GaugeThreadPoller, self).start(ryudp, active)
-        if active:
-            self.thread = hub.spawn(self)
-            self.thread.name = 'GaugeThreadPoller'
+        if active and scheduler is not None:
+            self.scheduler = scheduler
+            self.scheduler.add(self, time.time())
 
     def stop(self):
         super(GaugeThreadPoller, self).stop()
         if self.is_active():
-            hub.kill(self.thread)
-            hub.joinall([self.thread])
-            self.thread = None
+            self.scheduler.remove(self)
+            self.scheduler = None
 
     def is_active(self):
-        return self.thread is not None
-
-    def __call__(self):
-        """Send request loop.
-
-        Delays the initial request for a random interval to reduce load.
-        Then sends a request to the datapath, waits the specified interval and
-        checks that a response has been received in a loop."""
-        # TODO: this should use a deterministic method instead of random
-        hub.sleep(random.randint(1, self.conf.interval))
-        while True:
-            self.send_req()
-            self.reply_pending = True
-            hub.sleep(self.conf.interval)
-            if self.reply_pending:
-                self.no_response()
+        return self.scheduler is not None
+
+    def _prom_labels(self):
+        return dict(dp_id=hex(self.dp.dp_id), dp_name=self.dp.name, watcher=self.conf.type)
+
+    def _adapt_interval(self, reply_latency):
+        """Back off interval if reply slow (or missing), else return to configured."""
+        interval = self.interval
+        if reply_latency is None or reply_latency > self.interval / 2:
+            interval = min(self.interval * 2, self.conf.interval * self.MAX_INTERVAL_MULTIPLIER)
+        elif reply_latency < self.interval / 4:
+            interval = max(self.interval // 2, self.conf.interval)
+        if interval != self.interval:
+            self.logger.info('poll interval now %u (reply latency %s)' % (
+                interval, reply_latency))
+            self.interval = interval
+        self.prom_client.poll_interval.labels( # pylint: disable=no-member
+            **self._prom_labels()).set(self.interval)
+
+    def poll(self, now):
+        """Send a request, if the last was replied to or is overdue."""
+        if self.reply_pending:
+            self.no_response()
+            self._adapt_interval(None)
+        self.send_req()
+        self.req_time = now
+        self.reply_pending = True
+
+    def update(self, rcv_time, msg):
+        if self.running() and self.reply_pending and self.req_time is not None:
+            self.reply_latency = max(rcv_time - self.req_time, 0)
+            self.prom_client.poll_reply_latency_secs.labels( # pylint: disable=no-member
+                **self._prom_labels()).observe(self.reply_latency)
+            self._adapt_interval(self.reply_latency)
+        super(GaugeThreadPoller, self).update(rcv_time, msg)
 
     def send_req(self):
         """Send a stats request to a datapath."""
@@ -229,35 +348,62 @@ class GaugeFlowTablePoller(GaugeThreadPoller):
     Includes a timestamp and a reference ($DATAPATHNAME-flowtables). The
     flow table is dumped as an OFFlowStatsReply message (in yaml format) that
     matches all flows.
+
+    Flows are exported one at a time as the reply is consumed, optionally
+    from only some tables (tables), and optionally only a consistent sample
+    of 1 in flow_sample flows.
     """
 
+    def _table_ids(self):
+        """Return IDs of tables to export flows from, or None for all tables."""
+        if not self.conf.tables:
+            return None
+        return {self.dp.tables[table_name].table_id for table_name in self.conf.tables}
+
     def send_req(self):
         if self.ryudp:
+            table_id = ofp.OFPTT_ALL
+            table_ids = self._table_ids()
+            if table_ids is not None and len(table_ids) == 1:
+                table_id = list(table_ids)[0]
             match = parser.OFPMatch()
             self.req = parser.OFPFlowStatsRequest(
-                self.ryudp, 0, ofp.OFPTT_ALL, ofp.OFPP_ANY, ofp.OFPG_ANY,
+                self.ryudp, 0, table_id, ofp.OFPP_ANY, ofp.OFPG_ANY,
                 0, 0, match)
             self.ryudp.send_msg(self.req)
 
-    def _parse_flow_stats(self, stats):
-        """Parse flow stats reply message into tags/labels and byte/packet counts."""
-        packet_count = int(stats['packet_count'])
-        byte_count = int(stats['byte_count'])
-        instructions = stats['instructions']
+    def _flow_stats(self, msg):
+        """Yield each flow stat in a flow stats reply that should be exported."""
+        table_ids = self._table_ids()
+        flow_sample = self.conf.flow_sample
+        for stat in msg.body:
+            if table_ids is not None and stat.table_id not in table_ids:
+                continue
+            # Sample by flow identity, so the same flows are exported each poll
+            # (and by every gauge instance, as the key is hashed deterministically).
+            if flow_sample > 1 and zlib.crc32(self._flow_key(stat).encode()) % flow_sample:
+                continue
+            yield stat
+
+    @staticmethod
+    def _flow_key(stat):
+        """Return a string identifying the flow of a flow stat."""
+        return '%u %u %s' % (stat.table_id, stat.priority, sorted(stat.match.items()))
+
+    def _parse_flow_stats(self, stat):
+        """Parse flow stats into tags/labels and byte/packet counts."""
         tags = {
             'dp_name': self.dp.name,
             'dp_id': hex(self.dp.dp_id),
-            'table_id': int(stats['table_id']),
-            'priority': int(stats['priority']),
-            'inst_count': len(instructions),
-            'cookie': int(stats['cookie']),
+            'table_id': stat.table_id,
+            'priority': stat.priority,
+            'inst_count': len(stat.instructions),
+            'cookie': stat.cookie,
         }
-        oxm_matches = stats['match']['OFPMatch']['oxm_fields']
-        for oxm_match in oxm_matches:
-            oxm_tlv = oxm_match['OXMTlv']
-            mask = oxm_tlv['mask']
-            val = oxm_tlv['value']
-            orig_field = oxm_tlv['field']
+        for orig_field, val in stat.match.items():
+            mask = None
+            if isinstance(val, tuple):
+                val, mask = val
             if mask is not None:
                 val = '/'.join((str(val), str(mask)))
             field = OLD_MATCH_FIELDS.get(orig_field, orig_field)
@@ -265,8 +411,13 @@ class GaugeFlowTablePoller(GaugeThreadPoller):
             if field == 'vlan_vid' and mask is None:
                 tags['vlan'] = devid_present(int(val))
         return (
-            ('flow_packet_count', tags, packet_count),
-            ('flow_byte_count', tags, byte_count))
+            ('flow_packet_count', tags, stat.packet_count),
+            ('flow_byte_count', tags, stat.byte_count))
+
+    def _flow_stat_records(self, msg):
+        """Yield (var, tags, count) for each exported flow in a flow stats reply."""
+        for stat in self._flow_stats(msg):
+            yield from self._parse_flow_stats(stat)
 
 
 class GaugePortStatePoller(GaugePoller):
@@ -18,7 +18,8 @@
 
 import collections
 
-from prometheus_client import Gauge
+from prometheus_client import Gauge, Histogram
+from ryu.ofproto import ofproto_v1_3 as ofp
 
 from faucet.gauge_pollers import GaugePortStatsPoller, GaugePortStatePoller, GaugeFlowTablePoller
 from faucet.prom_client import PromClient
@@ -59,12 +60,25 @@ class GaugePrometheusClient(PromClient):
     def __init__(self, reg=None):
         super(GaugePrometheusClient, self).__init__(reg=reg)
         self.table_tags = collections.defaultdict(set)
+        self.table_generations = collections.defaultdict(int)
+        self.flow_var_labels = {}
         self.metrics = {}
         self.dp_status = Gauge( # pylint: disable=unexpected-keyword-arg
             'dp_status',
             'status of datapaths',
             self.REQUIRED_LABELS,
             registry=self._reg)
+        self.poll_interval = Gauge( # pylint: disable=unexpected-keyword-arg
+            'gauge_poll_interval',
+            'current interval between stats requests to datapaths',
+            self.REQUIRED_LABELS + ['watcher'],
+            registry=self._reg)
+        self.poll_reply_latency_secs = Histogram( # pylint: disable=unexpected-keyword-arg
+            'gauge_poll_reply_latency_secs',
+            'time from stats request to first reply from datapaths',
+            self.REQUIRED_LABELS + ['watcher'],
+            buckets=(0.001, 0.01, 0.1, 1, 10),
+            registry=self._reg)
         for prom_var in PROM_PORT_VARS + PROM_PORT_STATE_VARS:
             exported_prom_var = PROM_PREFIX_DELIM.join(
                 (PROM_PORT_PREFIX, prom_var))
@@ -82,6 +96,7 @@ class GaugePrometheusClient(PromClient):
 
     def reregister_flow_vars(self, table_name, table_tags):
         """Register the flow variables needed for this client"""
+        labels = list(table_tags)
         for prom_var in PROM_FLOW_VARS:
             table_prom_var = PROM_PREFIX_DELIM.join((prom_var, table_name))
             try:
@@ -89,7 +104,11 @@ class GaugePrometheusClient(PromClient):
             except KeyError:
                 pass
             self.metrics[table_prom_var] = Gauge( # pylint: disable=unexpected-keyword-arg
-                table_prom_var, '', list(table_tags), registry=self._reg)
+                table_prom_var, '', labels, registry=self._reg)
+            self.flow_var_labels[table_prom_var] = labels
+        # All series for this table were discarded, so pollers must set them again.
+        self.table_generations[table_name] += 1
+        self.exposition.invalidate()
 
 
 class GaugePortStatsPrometheusPoller(GaugePortStatsPoller):
@@ -161,15 +180,101 @@ class GaugePortStatePrometheusPoller(GaugePortStatePoller):
 
 
 class GaugeFlowTablePrometheusPoller(GaugeFlowTablePoller):
-    """Export flow table entries to Prometheus."""
+    """Export flow table entries to Prometheus.
+
+    Only series whose counts changed since the last poll are updated, and
+    series for flows no longer present are removed once all replies to a
+    poll are received. At most prometheus_max_flow_series series are
+    exported (new flows are not exported beyond that, and a flow's packet
+    and byte series are always exported together).
+    """
+
+    def __init__(self, conf, logger, prom_client):
+        super(GaugeFlowTablePrometheusPoller, self).__init__(
+            conf, logger, prom_client)
+        self.flow_series = {}
+        self.table_generations = {}
+        self._poll_flow_series = collections.defaultdict(dict)
+        self._poll_flow_series_count = 0
+        self._poll_flow_series_skipped = 0
+
+    def _set_flow_series(self, table_prom_var, tags, count):
+        try:
+            self.prom_client.metrics[table_prom_var].labels(**tags).set(count)
+        except ValueError:
+            self.logger.error( # pylint: disable=logging-not-lazy
+                'labels %s versus %s incorrect on %s' % (
+                    tags, self.prom_client.flow_var_labels[table_prom_var], table_prom_var))
+
+    def _resync_table(self, table_name):
+        """Set again all series for a table, if its variables were re-registered."""
+        generation = self.prom_client.table_generations[table_name]
+        if self.table_generations.get(table_name, None) == generation:
+            return
+        self.table_generations[table_name] = generation
+        table_tags = self.prom_client.table_tags[table_name]
+        for prom_var in PROM_FLOW_VARS:
+            table_prom_var = PROM_PREFIX_DELIM.join((prom_var, table_name))
+            self.flow_series.pop(table_prom_var, None)
+            poll_series = {}
+            for tags_key, count in self._poll_flow_series.get(table_prom_var, {}).items():
+                tags = dict(tags_key)
+                for tag in table_tags - tags.keys():
+                    tags[tag] = ''
+                poll_series[frozenset(tags.items())] = count
+                self._set_flow_series(table_prom_var, tags, count)
+            if poll_series:
+                self._poll_flow_series[table_prom_var] = poll_series
+
+    def _remove_stale_flow_series(self):
+        """Remove series for flows not present in this poll, and start next poll."""
+        for table_prom_var, series in self.flow_series.items():
+            metric = self.prom_client.metrics[table_prom_var]
+            labels = self.prom_client.flow_var_labels[table_prom_var]
+            poll_series = self._poll_flow_series.get(table_prom_var, {})
+            for tags_key in series.keys() - poll_series.keys():
+                tags = dict(tags_key)
+                try:
+                    metric.remove(*[tags[label] for label in labels])
+                except (KeyError, ValueError):
+                    pass
+        if self._poll_flow_series_skipped:
+            self.logger.warning(
+                'not exporting %u flow series, over limit of %u' % (
+                    self._poll_flow_series_skipped, self.conf.prometheus_max_flow_series))
+        self.flow_series = dict(self._poll_flow_series)
+        self._poll_flow_series = collections.defaultdict(dict)
+        self._poll_flow_series_count = 0
+        self._poll_flow_series_skipped = 0
+
+    def _flow_series_admitted(self, flow_series):
+        """Return True if a flow's series can be exported this poll.
+
+        All series for a flow (packets and bytes) are admitted or skipped
+        together, so a flow is never exported with only some of its counts.
+        """
+        new_series = [
+            (table_prom_var, tags_key) for table_prom_var, tags_key, _, _ in flow_series
+            if tags_key not in self._poll_flow_series[table_prom_var]]
+        if not new_series:
+            return True
+        max_flow_series = self.conf.prometheus_max_flow_series
+        exported = any(
+            tags_key in self.flow_series.get(table_prom_var, {})
+            for table_prom_var, tags_key in new_series)
+        if (not exported and max_flow_series and
+                self._poll_flow_series_count + len(new_series) > max_flow_series):
+            self._poll_flow_series_skipped += len(new_series)
+            return False
+        self._poll_flow_series_count += len(new_series)
+        return True
 
     def update(self, rcv_time, msg):
-        jsondict = msg.to_jsondict()
-        for stats_reply in jsondict['OFPFlowStatsReply']['body']:
-            stats = stats_reply['OFPFlowStats']
-            # TODO: labels based on matches will be dynamic
-            # Work around this by unregistering/registering the entire variable.
-            for var, tags, count in self._parse_flow_stats(stats):
+        # TODO: labels based on matches will be dynamic
+        # Work around this by unregistering/registering the entire variable.
+        for stat in self._flow_stats(msg):
+            flow_series = []
+            for var, tags, count in self._parse_flow_stats(stat):
                 table_id = int(tags['table_id'])
                 table_name = self.dp.table_by_id(table_id).name
                 table_tags = self.prom_client.table_tags[table_name]
@@ -187,10 +292,15 @@ class GaugeFlowTablePrometheusPoller(GaugeFlowTablePoller):
                     missing_tags = table_tags - tags_keys
                     for tag in missing_tags:
                         tags[tag] = ''
+                self._resync_table(table_name)
                 table_prom_var = PROM_PREFIX_DELIM.join((var, table_name))
-                try:
-                    self.prom_client.metrics[table_prom_var].labels(**tags).set(count)
-                except ValueError:
-                    self.logger.error( # pylint: disable=logging-not-lazy
-                        'labels %s versus %s incorrect on %s' % (
-                            tags, table_tags, table_prom_var))
+                flow_series.append((table_prom_var, frozenset(tags.items()), tags, count))
+            if not self._flow_series_admitted(flow_series):
+                continue
+            for table_prom_var, tags_key, tags, count in flow_series:
+                last_count = self.flow_series.get(table_prom_var, {}).get(tags_key, None)
+                self._poll_flow_series[table_prom_var][tags_key] = count
+                if count != last_count:
+                    self._set_flow_series(table_prom_var, tags, count)
+        if not (msg.flags and msg.flags & ofp.OFPMPF_REPLY_MORE):
+            self._remove_stale_flow_series()
@@ -18,27 +18,96 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gzip
+import time
 from urllib.parse import parse_qs
 
+from eventlet import tpool
 from ryu.lib import hub
 from pbr.version import VersionInfo
 from prometheus_client import Gauge as PromGauge
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, REGISTRY
 
 
+class PromExposition:
+    """Cached text exposition of a Prometheus registry.
+
+    The exposition is regenerated at most once every cache_secs (0 regenerates
+    on every scrape), or on the next scrape after being invalidated (e.g. because
+    series were added or removed). Optionally, rendering and compression are
+    done in an OS thread rather than in the eventlet loop.
+    """
+
+    GZIP_LEVEL = 6
+
+    def __init__(self, registry, cache_secs=0, render_thread=False):
+        self.registry = registry
+        self.cache_secs = cache_secs
+        self.render_thread = render_thread
+        self.render_time = None
+        self.output = None
+        self.gzip_output = None
+        self.renders = 0
+
+    def invalidate(self):
+        """Regenerate exposition on next scrape."""
+        self.render_time = None
+
+    def _execute(self, func, *args):
+        if self.render_thread:
+            return tpool.execute(func, *args)
+        return func(*args)
+
+    def _stale(self, now):
+        return (self.output is None or self.render_time is None or
+                now - self.render_time >= self.cache_secs or
+                now < self.render_time)
+
+    def render(self, now, use_gzip=False):
+        """Return exposition, regenerating it if stale.
+
+        Args:
+            now (float): current epoch time.
+            use_gzip (bool): True to return gzip compressed exposition.
+        Returns:
+            bytes: exposition.
+        """
+        if self._stale(now):
+            # Invalidation while rendering in a thread must cause another render.
+            self.render_time = now
+            output = self._execute(generate_latest, self.registry)
+            self.output = output
+            self.gzip_output = None
+            self.renders += 1
+        output = self.output
+        if use_gzip:
+            if self.gzip_output is None:
+                self.gzip_output = self._execute(gzip.compress, output, self.GZIP_LEVEL)
+            output = self.gzip_output
+        return output
+
+
 # Ryu's WSGI implementation doesn't always set QUERY_STRING
-def make_wsgi_app(registry):
+def make_wsgi_app(registry, exposition=None):
     """Create a WSGI app which serves the metrics from a registry."""
 
+    if exposition is None:
+        exposition = PromExposition(registry)
+
     def prometheus_app(environ, start_response):
         query_str = environ.get('QUERY_STRING', '')
         params = parse_qs(query_str)
-        reg = registry
+        use_gzip = 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', '')
         if 'name[]' in params:
-            reg = reg.restricted_registry(params['name[]'])
-        output = generate_latest(reg)
+            output = generate_latest(registry.restricted_registry(params['name[]']))
+            if use_gzip:
+                output = gzip.compress(output, PromExposition.GZIP_LEVEL)
+        else:
+            output = exposition.render(time.time(), use_gzip)
         status = str('200 OK')
         headers = [(str('Content-type'), CONTENT_TYPE_LATEST)]
+        if use_gzip:
+            headers.append((str('Content-Encoding'), str('gzip')))
         start_response(status, headers)
         return [output]
     return prometheus_app
@@ -61,13 +130,17 @@ class PromClient: # pylint: disable=too-few-public-methods
             ['version'],
             registry=self._reg)
         self.faucet_version.labels(version=version).set(1) # pylint: disable=no-member
+        self.exposition = PromExposition(self._reg)
         self.server = None
         self.thread = None
 
-    def start(self, prom_port, prom_addr, use_test_thread=False):
+    def start(self, prom_port, prom_addr, use_test_thread=False,
+              cache_secs=0, render_thread=False):
         """Start webserver."""
         if not self.server:
-            app = make_wsgi_app(self._reg)
+            self.exposition.cache_secs = cache_secs
+            self.exposition.render_thread = render_thread
+            app = make_wsgi_app(self._reg, self.exposition)
             if use_test_thread:
                 from wsgiref.simple_server import make_server, WSGIRequestHandler
                 import threading
@@ -19,6 +19,7 @@
 
 import copy
 import logging
+import time
 
 from collections import defaultdict, deque
 
@@ -28,10 +29,12 @@ from faucet import valve_flood
 from faucet import valve_host
 from faucet import valve_of
 from faucet import valve_packet
+from faucet import valve_packet_in
 from faucet import valve_route
 from faucet import valve_table
 from faucet import valve_util
 from faucet import valve_pipeline
+from faucet.valve_send import ValveSendQueue
 
 from faucet.vlan import NullVLAN, OFVLAN
 
@@ -91,6 +94,7 @@ class Valve:
         '_last_packet_in_sec',
         '_last_pipeline_flows',
         '_packet_in_count_sec',
+        '_packet_in_limiter',
         '_port_highwater',
         '_route_manager_by_eth_type',
         '_route_manager_by_ipv',
@@ -100,6 +104,8 @@ class Valve:
     USE_BARRIERS = True
     STATIC_TABLE_IDS = False
     GROUPS = True
+    SEND_BARRIER_TIMEOUT = 10
+    FLOW_DIFF_TIMEOUT = 10
 
 
     def __init__(self, dp, logname, metrics, notifier, dot1x):
@@ -113,9 +119,15 @@ class Valve:
         self.recent_ofmsgs = deque(maxlen=32)
         self._last_pipeline_flows = []
         self._packet_in_count_sec = None
+        self._packet_in_limiter = None
         self._last_packet_in_sec = None
         self._last_advertise_sec = None
         self._last_fast_advertise_sec = None
+        self._send_queue = ValveSendQueue(0, self.SEND_BARRIER_TIMEOUT)
+        self._flow_diff_time = None
+        self._flow_diff_flowmods = None
+        self._flow_diff_deferred = None
+        self._flow_diff_stats = None
         self.dp_init()
 
     def _port_vlan_labels(self, port, vlan):
@@ -149,9 +161,13 @@ class Valve:
             logging.getLogger(self.logname + '.valve'), self.dp.dp_id, self.dp.name)
         self.ofchannel_logger = None
         self._packet_in_count_sec = 0
+        self._packet_in_limiter = valve_packet_in.ValvePacketInLimiter({
+            valve_packet_in.LEARN: self.dp.packetin_port_learn_pps,
+            valve_packet_in.CONTROL_PLANE: self.dp.packetin_port_control_plane_pps})
         self._last_packet_in_sec = 0
         self._last_advertise_sec = 0
         self._last_fast_advertise_sec = 0
+        self._send_queue.window = self.dp.ofmsg_send_window
         self._route_manager_by_ipv = {}
         self._route_manager_by_eth_type = {}
         self._port_highwater = {}
@@ -177,7 +193,8 @@ class Valve:
                 self.dp.max_host_fib_retry_count,
                 self.dp.max_resolve_backoff_time, proactive_learn,
                 self.DEC_TTL, self.dp.multi_out, fib_table,
-                self.dp.tables['vip'], self.pipeline, self.dp.routers)
+                self.dp.tables['vip'], self.pipeline, self.dp.routers,
+                self.dp.groups, self.dp.multipath_routing)
             self._route_manager_by_ipv[route_manager.IPV] = route_manager
             for vlan in self.dp.vlans.values():
                 if vlan.faucet_vips_by_ipv(route_manager.IPV):
@@ -259,7 +276,8 @@ class Valve:
             valve_of.faucet_async(
                 packet_in=False, notify_flow_removed=False, port_status=False),
             valve_of.desc_stats_request()]
-        ofmsgs.extend(self._delete_all_valve_flows())
+        if not self.dp.diff_cold_start:
+            ofmsgs.extend(self._delete_all_valve_flows())
         return ofmsgs
 
     def ofchannel_log(self, ofmsgs):
@@ -288,7 +306,7 @@ class Valve:
         ofmsgs = [valve_table.wildcard_table.flowdel()]
         if self.dp.meters:
             ofmsgs.append(valve_of.meterdel())
-        if self.dp.group_table:
+        if self.dp.group_table or self.dp.multipath_routing:
             ofmsgs.append(self.dp.groups.delete_all())
         return ofmsgs
 
@@ -360,7 +378,16 @@ class Valve:
         """Delete a configured VLAN."""
         self.logger.info('Delete VLAN %s' % vlan)
         table = valve_table.wildcard_table
-        return [table.flowdel(match=table.match(vlan=vlan))]
+        ofmsgs = [table.flowdel(match=table.match(vlan=vlan))]
+        ofmsgs.extend(self._del_vlan_groups(vlan))
+        return ofmsgs
+
+    def _del_vlan_groups(self, vlan):
+        """Delete groups used by routes on a VLAN."""
+        ofmsgs = []
+        for route_manager in self._route_manager_by_ipv.values():
+            ofmsgs.extend(route_manager.del_vlan(vlan))
+        return ofmsgs
 
     def _del_vlans(self, vlans):
         ofmsgs = []
@@ -608,12 +635,20 @@ class Valve:
                 if not valve.dp.dyn_running:
                     continue
                 ofmsgs_by_valve[valve].extend(valve.get_tunnel_flowmods())
-                for vlan in valve.dp.vlans.values():
-                    ofmsgs_by_valve[valve].extend(valve.flood_manager.add_vlan(vlan))
+                ofmsgs_by_valve[valve].extend(valve.changed_stack_flood_rules())
                 for port in valve.dp.stack_ports:
                     ofmsgs_by_valve[valve].extend(valve.host_manager.del_port(port))
         return ofmsgs_by_valve
 
+    def changed_stack_flood_rules(self):
+        """Return flood rules changed by a stack topology change."""
+        ofmsgs = []
+        for vlan in self.dp.vlans.values():
+            ofmsgs.extend(self.flood_manager.build_changed_flood_rules(vlan))
+        self.metrics.stack_flood_rules_changed.labels( # pylint: disable=no-member
+            **self.dp.base_prom_labels()).observe(len(ofmsgs))
+        return ofmsgs
+
     def update_tunnel_flowrules(self):
         """Update tunnel ACL rules because the stack topology has changed"""
         if self.dp.tunnel_acls:
@@ -638,7 +673,21 @@ class Valve:
                     if age > self.dp.lldp_beacon['send_interval'] * 3:
                         self.logger.info('LLDP for %s inactive after %us' % (port, age))
                         port.dyn_lldp_beacon_recv_state = None
-        return self._update_stack_link_state(self.dp.stack_ports, now, other_valves)
+        expired, drain_secs = self._send_queue.expire_barriers(now)
+        if expired:
+            self.logger.warning('no barrier reply after %us, resuming sending' % (
+                self.SEND_BARRIER_TIMEOUT))
+            self._update_send_queue_metrics(drain_secs)
+        ofmsgs_by_valve = self._update_stack_link_state(self.dp.stack_ports, now, other_valves)
+        if (self._flow_diff_flowmods is not None and
+                now - self._flow_diff_time > self.FLOW_DIFF_TIMEOUT):
+            self.logger.warning('no flow stats after %us, replacing all flows' % (
+                self.FLOW_DIFF_TIMEOUT))
+            ofmsgs_by_valve[self].extend(
+                [valve_table.wildcard_table.flowdel()] +
+                self._flow_diff_flowmods + self._flow_diff_deferred)
+            self._reset_flow_diff()
+        return ofmsgs_by_valve
 
     def _reset_dp_status(self):
         if self.dp.dyn_running:
@@ -664,17 +713,71 @@ class Valve:
         for manager in self._get_managers():
             ofmsgs.extend(manager.initialise_tables())
         ofmsgs.extend(self._add_ports_and_vlans(discovered_up_ports))
-        ofmsgs.append(
+        async_ofmsgs = [
             valve_of.faucet_async(
                 packet_in=True,
                 port_status=True,
-                notify_flow_removed=self.dp.use_idle_timeout))
+                notify_flow_removed=self.dp.use_idle_timeout)]
+        if self.dp.diff_cold_start:
+            ofmsgs = self._start_flow_diff(now, ofmsgs, async_ofmsgs)
+        else:
+            ofmsgs.extend(async_ofmsgs)
         self.dp.dyn_last_coldstart_time = now
         self.dp.dyn_running = True
         self._inc_var('of_dp_connections')
         self._reset_dp_status()
         return ofmsgs
 
+    def _reset_flow_diff(self):
+        self._flow_diff_time = None
+        self._flow_diff_flowmods = None
+        self._flow_diff_deferred = None
+        self._flow_diff_stats = None
+
+    def _start_flow_diff(self, now, ofmsgs, deferred_ofmsgs):
+        """Request flows from DP, deferring flow changes until the flows are received.
+
+        Args:
+            now (float): current epoch time.
+            ofmsgs (list): OpenFlow messages to configure DP from scratch.
+            deferred_ofmsgs (list): OpenFlow messages to send after flow changes.
+        Returns:
+            list: OpenFlow messages to send now.
+        """
+        # Flow deletes in a cold start are to clear the DP, so are not needed.
+        flowmods = [ofmsg for ofmsg in ofmsgs if valve_of.is_flowmod(ofmsg)]
+        self._flow_diff_time = now
+        self._flow_diff_flowmods = [
+            flowmod for flowmod in flowmods if not valve_of.is_flowdel(flowmod)]
+        self._flow_diff_deferred = deferred_ofmsgs
+        self._flow_diff_stats = []
+        self.logger.info('requesting flows for diff cold start')
+        return [ofmsg for ofmsg in ofmsgs if not valve_of.is_flowmod(ofmsg)] + [
+            valve_of.flow_stats_request()]
+
+    def flow_stats_reply(self, now, flow_stats, more):
+        """Handle flows from DP, completing a diff cold start.
+
+        Args:
+            now (float): current epoch time.
+            flow_stats (list): OFPFlowStats from DP.
+            more (bool): True if more flow stats to follow.
+        Returns:
+            list: OpenFlow messages, if any.
+        """
+        if self._flow_diff_flowmods is None:
+            return []
+        self._flow_diff_stats.extend(flow_stats)
+        if more:
+            return []
+        ofmsgs, unchanged = valve_of.flows_diff(
+            self._flow_diff_flowmods, self._flow_diff_stats)
+        self.logger.info('diff cold start changing %u flows, %u unchanged, after %.3fs' % (
+            len(ofmsgs), unchanged, now - self._flow_diff_time))
+        ofmsgs.extend(self._flow_diff_deferred)
+        self._reset_flow_diff()
+        return ofmsgs
+
     def datapath_disconnect(self):
         """Handle Ryu datapath disconnection event."""
         self.logger.warning('datapath down')
@@ -682,6 +785,10 @@ class Valve:
             {'DP_CHANGE': {
                 'reason': 'disconnect'}})
         self.dp.dyn_running = False
+        self._send_queue.reset()
+        self._packet_in_limiter.reset()
+        self._reset_flow_diff()
+        self._update_send_queue_metrics(None)
         self._inc_var('of_dp_disconnections')
         self._reset_dp_status()
 
@@ -1014,7 +1121,9 @@ class Valve:
                 pkt_meta.port.lacp):
             pkt_meta.data = pkt_meta.data[:valve_packet.LACP_SIZE]
             pkt_meta.reparse_all()
-            lacp_pkt = valve_packet.parse_lacp_pkt(pkt_meta.pkt)
+            lacp_pkt = None
+            if pkt_meta.pkt is not None:
+                lacp_pkt = valve_packet.parse_lacp_pkt(pkt_meta.pkt)
             if lacp_pkt:
                 self.logger.debug('receive LACP %s on %s' % (lacp_pkt, pkt_meta.port))
                 age = None
@@ -1096,6 +1205,8 @@ class Valve:
         if pkt_meta.eth_type != valve_of.ether.ETH_TYPE_LLDP:
             return {}
         pkt_meta.reparse_all()
+        if pkt_meta.pkt is None:
+            return {}
         lldp_pkt = valve_packet.parse_lldp(pkt_meta.pkt)
         if not lldp_pkt:
             return {}
@@ -1147,8 +1258,23 @@ class Valve:
             return route_manager.control_plane_handler(now, pkt_meta)
         return []
 
-    def rate_limit_packet_ins(self, now):
-        """Return True if too many packet ins this second."""
+    def rate_limit_packet_ins(self, now, pkt_meta=None):
+        """Return True if too many packet ins this second.
+
+        Protocol keepalives (LACP, LLDP) are never rate limited. Other
+        packet ins are also limited per port and packet class, if configured.
+
+        Args:
+            now (float): current epoch time.
+            pkt_meta (PacketMeta): packet received, if already parsed.
+        Returns:
+            bool: True if packet in should be ignored.
+        """
+        pkt_class = None
+        if pkt_meta is not None:
+            pkt_class = valve_packet_in.packet_in_class(pkt_meta)
+            if pkt_class in valve_packet_in.KEEPALIVE_CLASSES:
+                return False
         if self._last_packet_in_sec != now:
             self._last_packet_in_sec = now
             self._packet_in_count_sec = 0
@@ -1157,6 +1283,12 @@ class Valve:
             if self._packet_in_count_sec % self.dp.ignore_learn_ins == 0:
                 self._inc_var('of_ignored_packet_ins')
                 return True
+        if pkt_class is not None:
+            if not self._packet_in_limiter.allow(now, pkt_meta.port.number, pkt_class):
+                self._inc_var(
+                    'of_dropped_packet_ins',
+                    labels=dict(self.dp.base_prom_labels(), packet_class=pkt_class))
+                return True
         return False
 
     def router_learn_host(self, pkt_meta):
@@ -1220,7 +1352,8 @@ class Valve:
             return learn_flows
         return []
 
-    def parse_rcv_packet(self, in_port, vlan_vid, eth_type, data, orig_len, pkt, eth_pkt, vlan_pkt):
+    def parse_rcv_packet(self, in_port, vlan_vid, eth_type, data, orig_len,
+                         eth_src, eth_dst, pkt=None, eth_pkt=None, vlan_pkt=None):
         """Parse a received packet into a PacketMeta instance.
 
         Args:
@@ -1229,14 +1362,14 @@ class Valve:
             eth_type (int): Ethernet type of packet.
             data (bytes): Raw packet data.
             orig_len (int): Original length of packet.
-            pkt (ryu.lib.packet.packet): parsed packet received.
-            ekt_pkt (ryu.lib.packet.ethernet): parsed Ethernet header.
-            vlan_pkt (ryu.lib.packet.vlan): parsed VLAN Ethernet header.
+            eth_src (str): Ethernet source address.
+            eth_dst (str): Ethernet destination address.
+            pkt (ryu.lib.packet.packet): parsed packet received (if already parsed).
+            ekt_pkt (ryu.lib.packet.ethernet): parsed Ethernet header (if already parsed).
+            vlan_pkt (ryu.lib.packet.vlan): parsed VLAN Ethernet header (if already parsed).
         Returns:
             PacketMeta instance.
         """
-        eth_src = eth_pkt.src
-        eth_dst = eth_pkt.dst
         vlan = None
         if vlan_vid in self.dp.vlans:
             vlan = self.dp.vlans[vlan_vid]
@@ -1272,10 +1405,9 @@ class Valve:
         # Truncate packet in data (OVS > 2.5 does not honor max_len)
         data = msg.data[:valve_of.MAX_PACKET_IN_BYTES]
 
-        # eth/VLAN header only
-        pkt, eth_pkt, eth_type, vlan_pkt, vlan_vid = valve_packet.parse_packet_in_pkt(
-            data, max_len=valve_packet.ETH_VLAN_HEADER_SIZE)
-        if pkt is None or eth_pkt is None:
+        # eth/VLAN header only, rest of packet parsed only as needed.
+        eth_src, eth_dst, eth_type, vlan_vid = valve_packet.parse_packet_in_header(data)
+        if eth_src is None:
             self.logger.info(
                 'unparseable packet from port %u' % in_port)
             return None
@@ -1286,7 +1418,7 @@ class Valve:
                 'packet for unknown VLAN %u' % vlan_vid)
             return None
         pkt_meta = self.parse_rcv_packet(
-            in_port, vlan_vid, eth_type, data, msg.total_len, pkt, eth_pkt, vlan_pkt)
+            in_port, vlan_vid, eth_type, data, msg.total_len, eth_src, eth_dst)
         if not valve_packet.mac_addr_is_unicast(pkt_meta.eth_src):
             self.logger.info(
                 'packet with non-unicast eth_src %s port %u' % (
@@ -1348,6 +1480,10 @@ class Valve:
                     'vlan_neighbors',
                     vlan.neigh_cache_count_by_ipv(ipv),
                     labels=dict(vlan_labels, ipv=ipv))
+                self._set_var(
+                    'vlan_neighbor_resolve_backlog',
+                    vlan.resolve_backlog_by_ipv(ipv),
+                    labels=dict(vlan_labels, ipv=ipv))
             return True
 
         def _update_port(vlan, port):
@@ -1374,6 +1510,18 @@ class Valve:
                 self._set_var('learned_macs', entry.eth_src_int, dict(port_vlan_labels, n=i))
             vlan.dyn_host_cache_stats_stale[port.number] = False
 
+        for route_manager in self._route_manager_by_ipv.values():
+            ipv_labels = dict(self.dp.base_prom_labels(), ipv=route_manager.IPV)
+            learn_caches = (
+                route_manager.proactive_learn_src_cache,
+                route_manager.proactive_learn_dst_cache)
+            self._set_var(
+                'proactive_learn_cache_hits',
+                sum(cache.hits for cache in learn_caches), labels=ipv_labels)
+            self._set_var(
+                'proactive_learn_cache_misses',
+                sum(cache.misses for cache in learn_caches), labels=ipv_labels)
+
         if updated_port:
             for vlan in updated_port.vlans():
                 if _update_vlan(vlan, now, rate_limited):
@@ -1618,6 +1766,10 @@ class Valve:
             ofmsgs.extend(self._del_vlans(deleted_vlans))
         if changed_ports:
             ofmsgs.extend(self.ports_delete(changed_ports))
+        # Changed VLANs are replaced, so release groups the previous VLAN tracked.
+        for vid in changed_vids:
+            if vid in self.dp.vlans:
+                ofmsgs.extend(self._del_vlan_groups(self.dp.vlans[vid]))
 
         self.dp_init(new_dp)
 
@@ -1661,6 +1813,10 @@ class Valve:
                 ofmsgs = None
         elif self.dp.dyn_running and ofmsgs:
             restart_type = 'warm'
+            if self._flow_diff_flowmods is not None:
+                self.logger.info(
+                    'forcing DP reconnection as flows not yet received for diff cold start')
+                ofmsgs = None
         else:
             ofmsgs = []
         if restart_type is not None:
@@ -1791,9 +1947,47 @@ class Valve:
             self.datapath_disconnect()
             ryu_dp.close()
         else:
-            for flow_msg in self.prepare_send_flows(flow_msgs):
-                flow_msg.datapath = ryu_dp
-                ryu_dp.send_msg(flow_msg)
+            flow_msgs = self._defer_during_flow_diff(flow_msgs)
+            if not flow_msgs:
+                return
+            flow_msgs = self.prepare_send_flows(flow_msgs)
+            # Preserve order of any messages still queued if window now disabled.
+            if self.dp.ofmsg_send_window or self._send_queue.depth():
+                self._update_send_queue_metrics(
+                    self._send_queue.send(time.time(), ryu_dp, flow_msgs))
+            else:
+                for flow_msg in flow_msgs:
+                    flow_msg.datapath = ryu_dp
+                    ryu_dp.send_msg(flow_msg)
+
+    def _defer_during_flow_diff(self, flow_msgs):
+        """Return messages to send now, deferring others until a diff cold start completes.
+
+        While the DP's flows are being requested, changes (e.g. from port status)
+        are applied after the diff, so the diff does not delete or revert them.
+        """
+        if self._flow_diff_flowmods is None:
+            return flow_msgs
+        if [ofmsg for ofmsg in flow_msgs if valve_of.is_flow_stats_request(ofmsg)]:
+            # Messages from the cold start itself, that request the flows to diff.
+            return flow_msgs
+        self._flow_diff_deferred.extend(
+            [ofmsg for ofmsg in flow_msgs if not valve_of.is_packetout(ofmsg)])
+        return [ofmsg for ofmsg in flow_msgs if valve_of.is_packetout(ofmsg)]
+
+    def barrier_reply(self, now):
+        """Handle barrier reply from datapath, sending queued messages if any.
+
+        Args:
+            now (float): current epoch time.
+        """
+        self._update_send_queue_metrics(self._send_queue.barrier_reply(now))
+
+    def _update_send_queue_metrics(self, drain_secs):
+        self._set_var('of_send_queue_depth', self._send_queue.depth())
+        if drain_secs is not None:
+            self.metrics.of_send_queue_drain_secs.labels( # pylint: disable=no-member
+                **self.dp.base_prom_labels()).observe(drain_secs)
 
     def flow_timeout(self, now, table_id, match):
         """Call flow timeout message handler:
@@ -68,6 +68,8 @@ class ValveFloodManager(ValveManagerBase):
             self.flood_dsts = self.FLOOD_DSTS + self.RESTRICTED_FLOOD_DISTS
         else:
             self.flood_dsts = self.FLOOD_DSTS
+        # Per VLAN, fingerprint of flood rule inputs and state set by flood rules last built.
+        self._flood_rules_by_vid = {}
 
     def initialise_tables(self):
         """Initialise the flood table with filtering flows."""
@@ -250,15 +252,16 @@ class ValveFloodManager(ValveManagerBase):
                 unicast_eth_dst, exclude_restricted_bcast_arpnd, command))
         return ofmsgs
 
-    def _build_group_flood_rules(self, vlan, modify, command):
-        """Build flooding rules for a VLAN using groups."""
+    def _build_group_flood_rules(self, vlan, command):
+        """Build flooding rules for a VLAN using groups.
+
+        VLANs with the same flood buckets share a group, so the group table
+        decides whether a group must be added, modified or deleted.
+        """
         _, vlan_flood_acts = self._build_flood_rule_for_vlan(
             vlan, None, None, None, False, command)
-        group_id = vlan.vid
-        group = self.groups.get_entry(
-            group_id, valve_of.build_group_flood_buckets(vlan_flood_acts))
-        groups_by_unicast_eth = {False: group, True: group}
-        ofmsgs = []
+        vlan_buckets = valve_of.build_group_flood_buckets(vlan_flood_acts)
+        buckets_by_unicast_eth = {False: vlan_buckets, True: vlan_buckets}
 
         # Only configure unicast flooding group if has different output
         # actions to non unicast flooding.
@@ -268,16 +271,19 @@ class ValveFloodManager(ValveManagerBase):
             unicast_eth_vlan_flood_acts)
         vlan_flood_acts, vlan_output_ports, _ = self._output_non_output_actions(vlan_flood_acts)
         if unicast_output_ports != vlan_output_ports:
-            group_id += valve_of.VLAN_GROUP_OFFSET
-            group = self.groups.get_entry(
-                group_id, valve_of.build_group_flood_buckets(unicast_eth_vlan_flood_acts))
-            groups_by_unicast_eth[True] = group
-
-        for group in groups_by_unicast_eth.values():
-            if modify:
-                ofmsgs.append(group.modify())
-            else:
-                ofmsgs.extend(group.add())
+            buckets_by_unicast_eth[True] = valve_of.build_group_flood_buckets(
+                unicast_eth_vlan_flood_acts)
+
+        ofmsgs = []
+        groups_by_unicast_eth = {}
+        for unicast_eth_dst, buckets in buckets_by_unicast_eth.items():
+            group_id = vlan.vid
+            if unicast_eth_dst:
+                group_id += valve_of.VLAN_GROUP_OFFSET
+            group, group_ofmsgs = self.groups.get_shared_entry(
+                (vlan.vid, unicast_eth_dst), group_id, buckets)
+            groups_by_unicast_eth[unicast_eth_dst] = group
+            ofmsgs.extend(group_ofmsgs)
 
         for unicast_eth_dst, eth_type, eth_dst, eth_dst_mask in self.flood_dsts:
             if unicast_eth_dst and not vlan.unicast_flood:
@@ -286,9 +292,10 @@ class ValveFloodManager(ValveManagerBase):
             match = self.flood_table.match(
                 vlan=vlan, eth_type=eth_type, eth_dst=eth_dst, eth_dst_mask=eth_dst_mask)
             flood_priority = self._vlan_flood_priority(eth_type, eth_dst_mask)
+            # Always add, as deleting a previous group also deleted flows using it.
             ofmsgs.append(self.flood_table.flowmod(
                 match=match,
-                command=command,
+                command=valve_of.ofp.OFPFC_ADD,
                 inst=[valve_of.apply_actions([valve_of.group_act(group.group_id)])],
                 priority=flood_priority))
         return ofmsgs
@@ -297,11 +304,46 @@ class ValveFloodManager(ValveManagerBase):
         return self.build_flood_rules(vlan)
 
     def del_vlan(self, vlan):
-        return [self.flood_table.flowdel(self.flood_table.match(vlan=vlan.vid))]
+        self._flood_rules_by_vid.pop(vlan.vid, None)
+        ofmsgs = [self.flood_table.flowdel(self.flood_table.match(vlan=vlan.vid))]
+        if self.use_group_table:
+            for unicast_eth_dst in (False, True):
+                ofmsgs.extend(self.groups.release_shared_entry((vlan.vid, unicast_eth_dst)))
+        return ofmsgs
 
     def update_vlan(self, vlan):
         return self.build_flood_rules(vlan, modify=True)
 
+    def _stack_flood_fingerprint(self):
+        """Return stack state that flood rules depend on."""
+        return None
+
+    def _flood_fingerprint(self, vlan):
+        """Return all port and stack state that flood rules for a VLAN depend on."""
+        return (
+            self._stack_flood_fingerprint(),
+            tuple([port.number for port in vlan.tagged]),
+            tuple([port.number for port in vlan.untagged + vlan.dot1x_untagged]),
+            tuple([(port.number, port.dyn_phys_up, port.dyn_lacp_up)
+                   for port in vlan.get_ports()]),
+            frozenset([port.number for port in vlan.exclude_native_if_dot1x()]))
+
+    @staticmethod
+    def _flood_rules_state(ofmsgs):
+        """Return dict of datapath flow state that flood rules will set."""
+        rules_state = {}
+        for ofmsg in ofmsgs:
+            # The group table already tracks group state.
+            if valve_of.is_groupmod(ofmsg):
+                continue
+            key, val = valve_of.ofmsg_state_key(ofmsg)
+            # Deletes are sent first, so do not override an add.
+            if val is None:
+                rules_state.setdefault(key, val)
+            else:
+                rules_state[key] = val
+        return rules_state
+
     def build_flood_rules(self, vlan, modify=False):
         """Add flows to flood packets to unknown destinations on a VLAN."""
         command = valve_of.ofp.OFPFC_ADD
@@ -309,7 +351,34 @@ class ValveFloodManager(ValveManagerBase):
             command = valve_of.ofp.OFPFC_MODIFY_STRICT
         ofmsgs = self._build_multiout_flood_rules(vlan, command)
         if self.use_group_table:
-            ofmsgs.extend(self._build_group_flood_rules(vlan, modify, command))
+            ofmsgs.extend(self._build_group_flood_rules(vlan, command))
+        self._flood_rules_by_vid[vlan.vid] = (
+            self._flood_fingerprint(vlan), self._flood_rules_state(ofmsgs))
+        return ofmsgs
+
+    def build_changed_flood_rules(self, vlan):
+        """Return only flood rules for a VLAN that changed since last built.
+
+        Rules are not rebuilt at all if no state they depend on changed.
+        Changed flows are sent as strict modifies, so counters are preserved.
+        Group changes are always sent, as the group table sends only changes.
+        """
+        if vlan.vid not in self._flood_rules_by_vid:
+            return self.build_flood_rules(vlan)
+        fingerprint, rules_state = self._flood_rules_by_vid[vlan.vid]
+        if fingerprint == self._flood_fingerprint(vlan):
+            return []
+        ofmsgs = []
+        for ofmsg in self.build_flood_rules(vlan, modify=True):
+            if not valve_of.is_groupmod(ofmsg):
+                key, val = valve_of.ofmsg_state_key(ofmsg)
+                if key in rules_state:
+                    if rules_state[key] == val:
+                        continue
+                # Cannot modify a flow that does not exist yet.
+                elif ofmsg.command == valve_of.ofp.OFPFC_MODIFY_STRICT:
+                    ofmsg.command = valve_of.ofp.OFPFC_ADD
+            ofmsgs.append(ofmsg)
         return ofmsgs
 
     @staticmethod
@@ -446,6 +515,19 @@ class ValveFloodStackManagerBase(ValveFloodManager):
     def _canonical_stack_up_ports(self, ports):
         return self.canonical_port_order([port for port in ports if port.is_stack_up()])
 
+    def _stack_flood_fingerprint(self):
+        def _port_numbers(ports):
+            return frozenset([port.number for port in ports])
+
+        return (
+            _port_numbers(self.all_towards_root_stack_ports),
+            _port_numbers(self.towards_root_stack_ports),
+            _port_numbers(self.away_from_root_stack_ports),
+            _port_numbers(self._inactive_away_stack_ports()),
+            tuple([(port.number, port.dyn_phys_up, port.is_stack_up())
+                   for port in self.stack_ports]),
+            self.is_stack_edge())
+
     def _build_mask_flood_rules(self, vlan, eth_type, eth_dst, eth_dst_mask,  # pylint: disable=too-many-arguments
                                 exclude_unicast, exclude_restricted_bcast_arpnd, command):
         # Stack ports aren't in VLANs, so need special rules to cause flooding from them.
@@ -20,6 +20,8 @@
 import ipaddress
 import random
 
+from operator import attrgetter, itemgetter
+
 from ryu.lib import mac
 from ryu.lib import ofctl_v1_3 as ofctl
 from ryu.lib.ofctl_utils import (
@@ -252,6 +254,28 @@ def is_packetout(ofmsg):
     """
     return isinstance(ofmsg, parser.OFPPacketOut)
 
+
+def is_flow_stats_request(ofmsg):
+    """Return True if OF message is a FlowStatsRequest
+
+    Args:
+        ofmsg: ryu.ofproto.ofproto_v1_3_parser message.
+    Returns:
+        bool: True if is a FlowStatsRequest
+    """
+    return isinstance(ofmsg, parser.OFPFlowStatsRequest)
+
+
+def is_barrier(ofmsg):
+    """Return True if OF message is a BarrierRequest
+
+    Args:
+        ofmsg: ryu.ofproto.ofproto_v1_3_parser message.
+    Returns:
+        bool: True if is a BarrierRequest
+    """
+    return isinstance(ofmsg, parser.OFPBarrierRequest)
+
 def is_output(ofmsg):
     """Return True if flow message is an action output message.
 
@@ -855,8 +879,18 @@ _MSG_KINDS = {
 }
 
 
+_FLOWDEL_COMMANDS = frozenset([ofp.OFPFC_DELETE, ofp.OFPFC_DELETE_STRICT])
+
+
 def _msg_kind(ofmsg):
     ofmsg_type = type(ofmsg)
+    # FlowMods are by far the most common, so classify them directly.
+    if ofmsg_type is parser.OFPFlowMod:
+        if ofmsg.command in _FLOWDEL_COMMANDS:
+            if ofmsg.table_id == ofp.OFPTT_ALL and not ofmsg.match.items():
+                return 'deleteglobal'
+            return 'delete'
+        return 'other'
     ofmsg_kind = _MSG_KINDS_TYPES.get(ofmsg_type, None)
     if ofmsg_kind:
         return ofmsg_kind
@@ -868,19 +902,83 @@ def _msg_kind(ofmsg):
     return 'other'
 
 
+def _ofobj_key(ofobj):
+    """Return hashable key for an OF instruction or action."""
+    return (type(ofobj),) + tuple(
+        (attr, tuple([_ofobj_key(sub_ofobj) for sub_ofobj in val])
+               if isinstance(val, list) else val)
+        for attr, val in vars(ofobj).items())
+
+
+def _ofmsg_key(ofmsg):
+    """Return hashable key, equal for OF messages that would serialize the same."""
+    if type(ofmsg) is parser.OFPFlowMod: # pylint: disable=unidiomatic-typecheck
+        return (
+            ofmsg.command, ofmsg.table_id, ofmsg.priority,
+            ofmsg.cookie, ofmsg.cookie_mask, ofmsg.idle_timeout, ofmsg.hard_timeout,
+            ofmsg.flags, ofmsg.out_port, ofmsg.out_group, ofmsg.buffer_id,
+            tuple(ofmsg.match.items()),
+            tuple([_ofobj_key(instruction) for instruction in ofmsg.instructions]))
+    # Built in comparison doesn't work until serialized() called
+    return str(ofmsg)
+
+
+def buckets_key(buckets):
+    """Return hashable key, equal for group buckets that would serialize the same."""
+    return tuple([_ofobj_key(bucket) for bucket in buckets])
+
+
+def ofmsg_state_key(ofmsg):
+    """Return (key, value) for the datapath state an OF message sets.
+
+    OF messages with the same key set the same flow or group. If the values
+    are also equal, sending the later message would not change datapath state.
+    Deletes have a value of None.
+
+    Args:
+        ofmsg: ryu.ofproto.ofproto_v1_3_parser message.
+    Returns:
+        tuple: (key, value).
+    """
+    ofmsg_type = type(ofmsg)
+    if ofmsg_type is parser.OFPFlowMod:
+        key = (
+            ofmsg_type, ofmsg.table_id, ofmsg.priority,
+            tuple(sorted(ofmsg.match.items(), key=itemgetter(0))))
+        if ofmsg.command in _FLOWDEL_COMMANDS:
+            return (key, None)
+        return (key, (
+            ofmsg.cookie, ofmsg.idle_timeout, ofmsg.hard_timeout, ofmsg.flags,
+            tuple([_ofobj_key(instruction) for instruction in ofmsg.instructions])))
+    if ofmsg_type is parser.OFPGroupMod:
+        key = (ofmsg_type, ofmsg.group_id)
+        if ofmsg.command == ofp.OFPGC_DELETE:
+            return (key, None)
+        return (key, (ofmsg.type, buckets_key(ofmsg.buckets)))
+    return (str(ofmsg), str(ofmsg))
+
+
+def _dedupe_add(deduped_ofmsgs, ofmsg):
+    try:
+        deduped_ofmsgs[_ofmsg_key(ofmsg)] = ofmsg
+    except TypeError:
+        # Not hashable (e.g. match value is a list), so fall back to string form.
+        deduped_ofmsgs[str(ofmsg)] = ofmsg
+
+
 def _partition_ofmsgs(input_ofmsgs):
-    """Partition input ofmsgs by kind."""
+    """Partition input ofmsgs by kind, deduplicating within each kind."""
     by_kind = {}
     for ofmsg in input_ofmsgs:
-        by_kind.setdefault(_msg_kind(ofmsg), []).append(ofmsg)
-    return by_kind
+        _dedupe_add(by_kind.setdefault(_msg_kind(ofmsg), {}), ofmsg)
+    return {kind: list(deduped_ofmsgs.values()) for kind, deduped_ofmsgs in by_kind.items()}
 
 
 def dedupe_ofmsgs(input_ofmsgs):
     """Return deduplicated ofmsg list."""
-    # Built in comparison doesn't work until serialized() called
-    # Can't use dict or json comparison as may be nested
-    deduped_input_ofmsgs = {str(ofmsg): ofmsg for ofmsg in input_ofmsgs}
+    deduped_input_ofmsgs = {}
+    for ofmsg in input_ofmsgs:
+        _dedupe_add(deduped_input_ofmsgs, ofmsg)
     return list(deduped_input_ofmsgs.values())
 
 
@@ -911,16 +1009,21 @@ def valve_flowreorder(input_ofmsgs, use_barriers=True):
         by_kind['delete'] = []
 
     for kind, random_order, suggest_barrier in _OFMSG_ORDER:
-        ofmsgs = dedupe_ofmsgs(by_kind.get(kind, []))
+        ofmsgs = by_kind.get(kind, [])
         if ofmsgs:
             if random_order:
                 random.shuffle(ofmsgs)
             else:
-                with_priorities = [ofmsg for ofmsg in ofmsgs if hasattr(ofmsg, 'priority')]
+                with_priorities = []
+                without_priorities = []
+                for ofmsg in ofmsgs:
+                    if hasattr(ofmsg, 'priority'):
+                        with_priorities.append(ofmsg)
+                    else:
+                        without_priorities.append(ofmsg)
                 # If priority present, send highest priority first.
                 if with_priorities:
-                    with_priorities.sort(key=lambda ofmsg: ofmsg.priority, reverse=True)
-                    without_priorities = [ofmsg for ofmsg in ofmsgs if not hasattr(ofmsg, 'priority')]
+                    with_priorities.sort(key=attrgetter('priority'), reverse=True)
                     ofmsgs = without_priorities + with_priorities
             output_ofmsgs.extend(ofmsgs)
             if use_barriers and suggest_barrier:
@@ -988,3 +1091,48 @@ def faucet_async(datapath=None, notify_flow_removed=False, packet_in=True, port_
 def desc_stats_request(datapath=None):
     """Query switch description."""
     return parser.OFPDescStatsRequest(datapath, 0)
+
+
+def flow_stats_request(datapath=None):
+    """Query all flows in all tables."""
+    return parser.OFPFlowStatsRequest(
+        datapath, 0, ofp.OFPTT_ALL, ofp.OFPP_ANY, ofp.OFPG_ANY, 0, 0, parser.OFPMatch())
+
+
+def _flow_diff_key(flow):
+    return (flow.table_id, flow.priority, tuple(sorted(flow.match.items(), key=itemgetter(0))))
+
+
+def _flow_diff_val(flow):
+    # Compare instructions serialized, as parsed and constructed instructions differ.
+    buf = bytearray()
+    for instruction in flow.instructions:
+        instruction.serialize(buf, len(buf))
+    return (flow.cookie, flow.idle_timeout, flow.hard_timeout, flow.flags, bytes(buf))
+
+
+def flows_diff(flowmods, flow_stats):
+    """Return flowmods to change flows present on a DP, to the flows expected.
+
+    Args:
+        flowmods (list): flow adds for flows expected to be present.
+        flow_stats (list): OFPFlowStats, for flows present.
+    Returns:
+        tuple: (list of flow deletes and adds, number of flows unchanged).
+    """
+    expected_flows = {_flow_diff_key(expected): expected for expected in flowmods}
+    ofmsgs = []
+    unchanged = 0
+    for flow_stat in flow_stats:
+        expected = expected_flows.pop(_flow_diff_key(flow_stat), None)
+        if expected is None:
+            ofmsgs.append(flowmod(
+                cookie=0, command=ofp.OFPFC_DELETE_STRICT, table_id=flow_stat.table_id,
+                priority=flow_stat.priority, out_port=ofp.OFPP_ANY, out_group=ofp.OFPG_ANY,
+                match_fields=flow_stat.match, inst=[], hard_timeout=0, idle_timeout=0))
+        elif _flow_diff_val(expected) != _flow_diff_val(flow_stat):
+            ofmsgs.append(expected)
+        else:
+            unchanged += 1
+    ofmsgs.extend(expected_flows.values())
+    return (ofmsgs, unchanged)
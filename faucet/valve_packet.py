@@ -65,6 +65,11 @@ LLDP_FAUCET_STACK_STATE = 2
 
 LACP_SIZE = 124
 
+ETH_HEADER_STRUCT = struct.Struct('!6s6sH')
+VLAN_HEADER_STRUCT = struct.Struct('!HH')
+VLAN_VID_MASK = 0xfff
+MAC_STR_FMT = ':'.join(['%02x'] * 6)
+
 EUI_BITS = len(EUI(0).packed*8)
 MAC_MASK_BITMAP = {(2**EUI_BITS - 2**i): (EUI_BITS - i) for i in range(0, EUI_BITS + 1)}
 
@@ -81,6 +86,28 @@ def int_from_mac(mac):
     return (int_hi << 8) + int_lo
 
 
+def mac_addr_to_int(mac_addr):
+    """Return a MAC address as a 48 bit integer.
+
+    Args:
+        mac_addr (str): MAC address.
+    Returns:
+        int: MAC address as an integer.
+    """
+    return int(mac_addr.replace(':', ''), 16)
+
+
+def int_to_mac_addr(mac_int):
+    """Return a 48 bit integer as a MAC address.
+
+    Args:
+        mac_int (int): MAC address as an integer.
+    Returns:
+        str: MAC address.
+    """
+    return MAC_STR_FMT % tuple(mac_int.to_bytes(6, 'big'))
+
+
 def int_in_mac(mac, to_int):
     int_mac = mac.split(':')[:4] + [
         '%x' % (to_int >> 8), '%x' % (to_int & 0xff)]
@@ -189,6 +216,33 @@ def parse_packet_in_pkt(data, max_len, eth_pkt=None, vlan_pkt=None):
     return (pkt, eth_pkt, eth_type, vlan_pkt, vlan_vid)
 
 
+def parse_packet_in_header(data):
+    """Parse only the Ethernet/VLAN header of a packet from the dataplane.
+
+    Header fields are read directly from the packet data, without building
+    a ryu.lib.packet.packet (see parse_packet_in_pkt() for a full parse).
+
+    Args:
+        data (bytearray): packet data from dataplane.
+    Returns:
+        str: Ethernet source address (or None if unparseable).
+        str: Ethernet destination address.
+        int: Ethernet type of packet (inside VLAN)
+        int: VLAN VID (or None if no VLAN)
+    """
+    data_view = memoryview(data)
+    if len(data_view) < ETH_HEADER_SIZE:
+        return (None, None, None, None)
+    eth_dst, eth_src, eth_type = ETH_HEADER_STRUCT.unpack_from(data_view)
+    vlan_vid = None
+    if eth_type == valve_of.ether.ETH_TYPE_8021Q:
+        if len(data_view) < ETH_VLAN_HEADER_SIZE:
+            return (None, None, None, None)
+        vlan_tci, eth_type = VLAN_HEADER_STRUCT.unpack_from(data_view, ETH_HEADER_SIZE)
+        vlan_vid = vlan_tci & VLAN_VID_MASK
+    return (MAC_STR_FMT % tuple(eth_src), MAC_STR_FMT % tuple(eth_dst), eth_type, vlan_vid)
+
+
 def mac_addr_all_zeros(mac_addr):
     """Returns True if mac_addr is all zeros.
 
@@ -688,7 +742,11 @@ def router_advert(vid, eth_src, eth_dst, src_ip, dst_ip,
 
 
 class PacketMeta:
-    """Original, and parsed Ethernet packet metadata."""
+    """Original, and parsed Ethernet packet metadata.
+
+    pkt/eth_pkt/vlan_pkt may be None until reparse() is called, if only
+    the Ethernet/VLAN header fields were parsed.
+    """
 
     __slots__ = [
         'data',
@@ -787,6 +845,8 @@ class PacketMeta:
                     return
             parse_limit = header_size + payload
             self.reparse(parse_limit)
+            if self.pkt is None:
+                return
             self.l3_pkt = self.pkt.get_protocol(pkt_parser)
             if self.l3_pkt:
                 if hasattr(self.l3_pkt, 'src'):
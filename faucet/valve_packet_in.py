@@ -0,0 +1,105 @@
+"""Classify and rate limit packet ins from a datapath."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Education Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from faucet import valve_of
+from faucet import valve_packet
+
+
+LACP = 'lacp'
+LLDP = 'lldp'
+CONTROL_PLANE = 'control_plane'
+LEARN = 'learn'
+
+# Protocol keepalives are never rate limited, and are processed first.
+KEEPALIVE_CLASSES = frozenset([LACP, LLDP])
+PACKET_IN_CLASS_PRIORITY = {
+    LACP: 0,
+    LLDP: 0,
+    CONTROL_PLANE: 1,
+    LEARN: 2,
+}
+
+_KEEPALIVE_ETH_TYPES = {
+    valve_of.ether.ETH_TYPE_SLOW: LACP,
+    valve_of.ether.ETH_TYPE_LLDP: LLDP,
+}
+_CONTROL_PLANE_ETH_TYPES = frozenset([
+    valve_of.ether.ETH_TYPE_ARP,
+    valve_of.ether.ETH_TYPE_IP,
+    valve_of.ether.ETH_TYPE_IPV6])
+
+
+def packet_in_class(pkt_meta):
+    """Return class of a packet in, for rate limiting and prioritization.
+
+    Args:
+        pkt_meta (PacketMeta): packet received.
+    Returns:
+        str: packet class.
+    """
+    keepalive_class = _KEEPALIVE_ETH_TYPES.get(pkt_meta.eth_type, None)
+    if keepalive_class is not None:
+        return keepalive_class
+    vlan = pkt_meta.vlan
+    if (vlan is not None and vlan.faucet_vips and
+            pkt_meta.eth_type in _CONTROL_PLANE_ETH_TYPES and
+            (pkt_meta.eth_dst == vlan.faucet_mac or
+             not valve_packet.mac_addr_is_unicast(pkt_meta.eth_dst))):
+        return CONTROL_PLANE
+    return LEARN
+
+
+class ValvePacketInLimiter:
+    """Token bucket rate limiter for packet ins, per port and packet class.
+
+    Each port has one bucket per packet class, refilled at that class' rate
+    up to one second's worth of packets. Classes without a rate (including
+    protocol keepalives) are never limited.
+    """
+
+    def __init__(self, class_pps):
+        self.class_pps = {
+            pkt_class: pps for pkt_class, pps in class_pps.items()
+            if pps and pkt_class not in KEEPALIVE_CLASSES}
+        self.buckets = {}
+
+    def reset(self):
+        """Discard all bucket state."""
+        self.buckets = {}
+
+    def allow(self, now, port_no, pkt_class):
+        """Return True if a packet in of this class from this port may be processed.
+
+        Args:
+            now (float): current epoch time.
+            port_no (int): port packet in was received on.
+            pkt_class (str): packet class.
+        Returns:
+            bool: True if packet in should be processed.
+        """
+        pps = self.class_pps.get(pkt_class, None)
+        if pps is None:
+            return True
+        bucket_key = (port_no, pkt_class)
+        tokens, last_time = self.buckets.get(bucket_key, (pps, now))
+        tokens = min(pps, tokens + max(now - last_time, 0) * pps)
+        if tokens < 1:
+            self.buckets[bucket_key] = (tokens, now)
+            return False
+        self.buckets[bucket_key] = (tokens - 1, now)
+        return True
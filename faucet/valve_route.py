@@ -17,7 +17,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict, deque
+from collections import OrderedDict
+import heapq
+import itertools
 import random
 import time
 
@@ -30,6 +32,10 @@ from faucet import valve_packet
 from faucet.valve_manager_base import ValveManagerBase
 
 
+# Orders nexthops due for resolution at the same time, oldest scheduled first.
+_RESOLVE_SEQ = itertools.count()
+
+
 class AnonVLAN:
 
     def __init__(self, vid):
@@ -82,6 +88,15 @@ class NextHop:
             return True
         return False
 
+    def resolution_due_time(self, max_age):
+        """Return time from which this nexthop is due to be re resolved/retried."""
+        due_time = self.next_retry_time
+        if self.eth_src is not None:
+            expire_time = self.cache_time + max_age
+            if due_time is None or expire_time > due_time:
+                due_time = expire_time
+        return due_time
+
     def __str__(self):
         return '%s' % [self.eth_src, self.port]
 
@@ -89,6 +104,68 @@ class NextHop:
         return self.__str__()
 
 
+class NextHopGroup:
+    """Describes a select group, shared by all routes via the same set of nexthops."""
+
+    __slots__ = [
+        'entry',
+        'ip_dsts',
+    ]
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.ip_dsts = set()
+
+
+class RecentlyLearnedCache:
+    """Time bounded LRU cache of recently learned keys (e.g. VLAN and host IP)."""
+
+    __slots__ = [
+        '_cache',
+        'hits',
+        'max_age',
+        'max_size',
+        'misses',
+    ]
+
+    def __init__(self, max_size, max_age):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def recent(self, now, key, value=None):
+        """Return True if key was learned with value less than max_age ago.
+
+        Otherwise, key is learned with value now.
+        """
+        learned = self._cache.get(key, None)
+        if learned is not None:
+            learned_value, learned_time = learned
+            if learned_value == value and now - learned_time < self.max_age:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return True
+            del self._cache[key]
+        self.misses += 1
+        self._cache[key] = (value, now)
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return False
+
+    def forget(self, key):
+        """Forget key, if learned."""
+        self._cache.pop(key, None)
+
+    def clear(self):
+        """Forget all keys."""
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
 class ValveRouteManager(ValveManagerBase):
     """Base class to implement RIB/FIB."""
 
@@ -98,13 +175,17 @@ class ValveRouteManager(ValveManagerBase):
         'dec_ttl',
         'fib_table',
         'pipeline',
+        'proactive_learn_dst_cache',
+        'proactive_learn_src_cache',
         'multi_out',
         'global_vlan',
         'global_routing',
+        'groups',
         'logger',
         'max_host_fib_retry_count',
         'max_hosts_per_resolve_cycle',
         'max_resolve_backoff_time',
+        'multipath_routing',
         'proactive_learn',
         'route_priority',
         'routers',
@@ -117,12 +198,14 @@ class ValveRouteManager(ValveManagerBase):
     ICMP_SIZE = valve_of.MAX_PACKET_IN_BYTES
     CONTROL_ETH_TYPES = () # type: ignore
     IP_PKT = None
+    PROACTIVE_LEARN_CACHE_SIZE = 1024
+    PROACTIVE_LEARN_CACHE_SECS = 2
 
 
     def __init__(self, logger, global_vlan, neighbor_timeout,
                  max_hosts_per_resolve_cycle, max_host_fib_retry_count,
                  max_resolve_backoff_time, proactive_learn, dec_ttl, multi_out,
-                 fib_table, vip_table, pipeline, routers):
+                 fib_table, vip_table, pipeline, routers, groups, multipath_routing):
         self.logger = logger
         self.global_vlan = AnonVLAN(global_vlan)
         self.neighbor_timeout = neighbor_timeout
@@ -137,6 +220,14 @@ class ValveRouteManager(ValveManagerBase):
         self.pipeline = pipeline
         self.route_priority = self._LPM_PRIORITY
         self.routers = routers
+        self.groups = groups
+        self.multipath_routing = multipath_routing
+        # Sources and destinations are cached separately, so that a host
+        # sweeping many destinations cannot evict learned sources.
+        self.proactive_learn_src_cache = RecentlyLearnedCache(
+            self.PROACTIVE_LEARN_CACHE_SIZE, self.PROACTIVE_LEARN_CACHE_SECS)
+        self.proactive_learn_dst_cache = RecentlyLearnedCache(
+            self.PROACTIVE_LEARN_CACHE_SIZE, self.PROACTIVE_LEARN_CACHE_SECS)
         self.active = False
         self.global_routing = self._global_routing()
         if self.global_routing:
@@ -226,6 +317,10 @@ class ValveRouteManager(ValveManagerBase):
         """Return vlan neighbour cache"""
         return vlan.neigh_cache_by_ipv(self.IPV)
 
+    def _vlan_route_groups(self, vlan):
+        """Return vlan select groups, by set of nexthops"""
+        return vlan.dyn_route_groups_by_ipv[self.IPV]
+
     def expire_port_nexthops(self, port):
         """Expire all hosts on a port"""
         ofmsgs = []
@@ -292,7 +387,7 @@ class ValveRouteManager(ValveManagerBase):
 
     @staticmethod
     def _stateful_gw(vlan, dst_ip):
-        return not dst_ip.is_link_local or vlan.ip_dsts_for_ip_gw(dst_ip)
+        return not dst_ip.is_link_local or vlan.is_ip_gw(dst_ip)
 
     def _global_routing(self):
         """Return true if global routing is enabled"""
@@ -365,8 +460,23 @@ class ValveRouteManager(ValveManagerBase):
     def _add_faucet_vip_nd(self, vlan, priority, faucet_vip, faucet_vip_host):
         raise NotImplementedError # pragma: no cover
 
-    def add_vlan(self, vlan):
+    def del_vlan(self, vlan):
+        """Return ofmsgs deleting select groups used by routes on this VLAN."""
         ofmsgs = []
+        route_groups = self._vlan_route_groups(vlan)
+        for route_group in route_groups.values():
+            # Groups already removed (e.g. by a cold start) need no delete.
+            if self.groups.entries.get(route_group.entry.group_id, None) is route_group.entry:
+                ofmsgs.append(route_group.entry.delete())
+        route_groups.clear()
+        return ofmsgs
+
+    def add_vlan(self, vlan):
+        # VLAN caches are reset, so release groups that were tracked by them.
+        ofmsgs = self.del_vlan(vlan)
+        # VLAN caches are reset, so hosts must be learned again.
+        self.proactive_learn_src_cache.clear()
+        self.proactive_learn_dst_cache.clear()
         # add controller IPs if configured.
         for faucet_vip in vlan.faucet_vips_by_ipv(self.IPV):
             max_prefixlen = faucet_vip.ip.max_prefixlen
@@ -399,13 +509,143 @@ class ValveRouteManager(ValveManagerBase):
                 in_match, priority=self._route_priority(ip_dst), inst=inst))
         return ofmsgs
 
+    def _multipath_gws(self, vlan, ip_dst):
+        """Return nexthops for ip_dst if routed via a select group, otherwise None"""
+        if self.multipath_routing:
+            ip_gws = vlan.route_gws(ip_dst)
+            if len(ip_gws) > 1:
+                return ip_gws
+        return None
+
+    def _route_group_buckets(self, vlan, ip_gws):
+        """Return select group buckets, one per resolved nexthop.
+
+        If no nexthop is resolved, there are no buckets and the group
+        (and so the route) drops packets until a nexthop is resolved again.
+        """
+        buckets = []
+        for ip_gw in sorted(ip_gws):
+            nexthop = self._vlan_nexthop_cache_entry(vlan, ip_gw)
+            if nexthop is None or nexthop.eth_src is None or nexthop.port is None:
+                continue
+            actions = self._nexthop_actions(nexthop.eth_src, vlan)
+            actions.extend(vlan.output_port(nexthop.port))
+            buckets.append(valve_of.bucket(weight=1, actions=actions))
+        return buckets
+
+    def _update_route_group(self, vlan, ip_gws):
+        """Add or update the select group for ip_gws.
+
+        Args:
+            vlan (vlan): VLAN containing this RIB/FIB.
+            ip_gws (frozenset): IP addresses of nexthops.
+        Returns:
+            tuple: (NextHopGroup, list of OpenFlow messages).
+        """
+        route_groups = self._vlan_route_groups(vlan)
+        buckets = self._route_group_buckets(vlan, ip_gws)
+        route_group = route_groups.get(ip_gws, None)
+        if route_group is None:
+            entry, ofmsgs = self.groups.add_entry(
+                valve_of.ROUTE_GROUP_OFFSET, buckets, valve_of.ofp.OFPGT_SELECT)
+            route_group = NextHopGroup(entry)
+            route_groups[ip_gws] = route_group
+            return (route_group, ofmsgs)
+        if valve_of.buckets_key(buckets) == route_group.entry.buckets_key:
+            return (route_group, [])
+        route_group.entry.update_buckets(buckets)
+        return (route_group, [route_group.entry.modify()])
+
+    def _update_gw_route_groups(self, vlan, ip_gw):
+        """Return ofmsgs updating existing select groups that include ip_gw"""
+        ofmsgs = []
+        for ip_gws in list(self._vlan_route_groups(vlan)):
+            if ip_gw in ip_gws:
+                ofmsgs.extend(self._update_route_group(vlan, ip_gws)[1])
+        return ofmsgs
+
+    def _add_multipath_routes(self, vlan, multipath_routes):
+        """Return ofmsgs routing each destination via its select group.
+
+        Each select group is updated once, and FIB flows are added only for
+        destinations not already routed via their group.
+
+        Args:
+            vlan (vlan): VLAN containing this RIB/FIB.
+            multipath_routes (list): (ip_dst, ip_gws) tuples.
+        Returns:
+            list: OpenFlow messages.
+        """
+        ofmsgs = []
+        updated_route_groups = {}
+        for ip_dst, ip_gws in multipath_routes:
+            route_group = updated_route_groups.get(ip_gws, None)
+            if route_group is None:
+                route_group, group_ofmsgs = self._update_route_group(vlan, ip_gws)
+                updated_route_groups[ip_gws] = route_group
+                ofmsgs.extend(group_ofmsgs)
+            if ip_dst in route_group.ip_dsts:
+                continue
+            route_group.ip_dsts.add(ip_dst)
+            self.logger.info(
+                'Adding new route %s via %s (group %u) on VLAN %u' % (
+                    ip_dst, sorted(ip_gws), route_group.entry.group_id, vlan.vid))
+            inst = [valve_of.apply_actions([valve_of.group_act(route_group.entry.group_id)])]
+            for routed_vlan in self._routed_vlans(vlan):
+                in_match = self._route_match(routed_vlan, ip_dst)
+                ofmsgs.append(self.fib_table.flowmod(
+                    in_match, priority=self._route_priority(ip_dst), inst=inst))
+        return ofmsgs
+
+    def _release_route_group(self, vlan, ip_dst, ip_gws):
+        """Return ofmsgs removing ip_dst from the select group for ip_gws (deleting it if unused)"""
+        route_groups = self._vlan_route_groups(vlan)
+        route_group = route_groups.get(ip_gws, None)
+        if route_group is None or ip_dst not in route_group.ip_dsts:
+            return []
+        route_group.ip_dsts.remove(ip_dst)
+        if route_group.ip_dsts:
+            return []
+        del route_groups[ip_gws]
+        return [route_group.entry.delete()]
+
     def _update_nexthop_cache(self, now, vlan, eth_src, port, ip_gw):
         """Add information to the nexthop cache and return the new object"""
         nexthop = NextHop(eth_src, port, now)
         nexthop_cache = self._vlan_nexthop_cache(vlan)
         nexthop_cache[ip_gw] = nexthop
+        self._schedule_nexthop(vlan, ip_gw, nexthop)
         return nexthop
 
+    def _vlan_resolve_queue(self, vlan, route_gws):
+        """Return vlan queue of gateways (or hosts) by resolution due time"""
+        if route_gws:
+            return vlan.dyn_route_gw_resolve_queue[self.IPV]
+        return vlan.dyn_host_gw_resolve_queue[self.IPV]
+
+    def _schedule_nexthop(self, vlan, ip_gw, nexthop):
+        """Queue nexthop to be re/resolved when due.
+
+        Queued entries are not removed when a nexthop is updated or
+        expired; they are skipped when dequeued, if they do not match the
+        nexthop cache, and compacted if they outnumber the nexthop cache.
+        """
+        queue = self._vlan_resolve_queue(
+            vlan, ip_gw in vlan.dyn_route_gws_by_ipv[self.IPV])
+        due_time = nexthop.resolution_due_time(self.neighbor_timeout)
+        heapq.heappush(queue, (due_time, next(_RESOLVE_SEQ), ip_gw))
+        nexthop_cache = self._vlan_nexthop_cache(vlan)
+        if len(queue) > 2 * len(nexthop_cache) + 1:
+            current = {}
+            for queued in queue:
+                due_time, _, queued_ip_gw = queued
+                entry = nexthop_cache.get(queued_ip_gw, None)
+                if (entry is not None and
+                        entry.resolution_due_time(self.neighbor_timeout) == due_time):
+                    current[queued_ip_gw] = queued
+            queue[:] = list(current.values())
+            heapq.heapify(queue)
+
     def _update_nexthop(self, now, vlan, port, eth_src, resolved_ip_gw):
         """Update routes where nexthop is newly resolved or changed.
 
@@ -420,43 +660,27 @@ class ValveRouteManager(ValveManagerBase):
         """
         ofmsgs = []
         cached_eth_dst = self._cached_nexthop_eth_dst(vlan, resolved_ip_gw)
+        cached_port = None
+        if cached_eth_dst is not None:
+            cached_port = self._vlan_nexthop_cache_entry(vlan, resolved_ip_gw).port
+        # Select group buckets are built from the cache, so update it first.
+        self._update_nexthop_cache(now, vlan, eth_src, port, resolved_ip_gw)
 
-        if cached_eth_dst != eth_src:
+        if cached_eth_dst != eth_src or cached_port is not port:
             is_updated = cached_eth_dst is not None
+            routes = self._vlan_routes(vlan)
+            multipath_routes = []
             for ip_dst in vlan.ip_dsts_for_ip_gw(resolved_ip_gw):
-                ofmsgs.extend(self._add_resolved_route(
-                    vlan, resolved_ip_gw, ip_dst, eth_src, is_updated))
+                ip_gws = self._multipath_gws(vlan, ip_dst)
+                if ip_gws is not None:
+                    multipath_routes.append((ip_dst, ip_gws))
+                elif cached_eth_dst != eth_src and routes[ip_dst] == resolved_ip_gw:
+                    ofmsgs.extend(self._add_resolved_route(
+                        vlan, resolved_ip_gw, ip_dst, eth_src, is_updated))
+            ofmsgs.extend(self._add_multipath_routes(vlan, multipath_routes))
 
-        self._update_nexthop_cache(now, vlan, eth_src, port, resolved_ip_gw)
         return ofmsgs
 
-    def _vlan_unresolved_nexthops(self, vlan, ip_gws, now):
-        """Return unresolved or expired IP gateways, never tried/oldest first.
-
-        Args:
-           vlan (vlan): VLAN containing this RIB/FIB.
-           ip_gws (list): tuple, IP gateway and controller IP in same subnet.
-           now (float): seconds since epoch.
-        Returns:
-           list: prioritized list of gateways.
-        """
-        vlan_nexthop_cache = self._vlan_nexthop_cache(vlan)
-        nexthop_entries = [
-            (ip_gw, vlan_nexthop_cache.get(ip_gw, None)) for ip_gw in ip_gws]
-        not_fresh_nexthops = [
-            (ip_gw, entry) for ip_gw, entry in nexthop_entries
-            if entry is None or entry.resolution_due(now, self.neighbor_timeout)]
-        unresolved_nexthops_by_retries = defaultdict(list)
-        for ip_gw, entry in not_fresh_nexthops:
-            if entry is None:
-                entry = self._update_nexthop_cache(now, vlan, None, None, ip_gw)
-            unresolved_nexthops_by_retries[entry.resolve_retries].append(ip_gw)
-        unresolved_nexthops = deque()
-        for _retries, nexthops in sorted(unresolved_nexthops_by_retries.items()):
-            random.shuffle(nexthops)
-            unresolved_nexthops.extend(nexthops)
-        return unresolved_nexthops
-
     def advertise(self, vlan):
         raise NotImplementedError # pragma: no cover
 
@@ -469,6 +693,7 @@ class ValveRouteManager(ValveManagerBase):
         resolve_flows = []
         last_retry_time = nexthop_cache_entry.last_retry_time
         nexthop_cache_entry.next_retry(now, self.max_resolve_backoff_time)
+        self._schedule_nexthop(vlan, ip_gw, nexthop_cache_entry)
         if (vlan.targeted_gw_resolution and
                 last_retry_time is None and nexthop_cache_entry.port is not None):
             port = nexthop_cache_entry.port
@@ -499,10 +724,13 @@ class ValveRouteManager(ValveManagerBase):
                 ip_gw, nexthop_cache_entry.age(now), vlan))
         port = nexthop_cache_entry.port
         self._del_vlan_nexthop_cache_entry(vlan, ip_gw)
+        self.proactive_learn_src_cache.forget((vlan.vid, ip_gw))
+        self.proactive_learn_dst_cache.forget((vlan.vid, ip_gw))
         expire_flows = self._del_host_fib_route(
             vlan, ipaddress.ip_network(ip_gw.exploded))
         if port is None:
             expire_flows = []
+        expire_flows.extend(self._update_gw_route_groups(vlan, ip_gw))
         return expire_flows
 
     def _resolve_expire_gateway_flows(self, ip_gw, nexthop_cache_entry, vlan, now):
@@ -512,24 +740,58 @@ class ValveRouteManager(ValveManagerBase):
             return self._expire_gateway_flows(ip_gw, nexthop_cache_entry, vlan, now)
         return self._resolve_gateway_flows(ip_gw, nexthop_cache_entry, vlan, now)
 
-    def _resolve_gateways_flows(self, resolve_handler, vlan, now,
-                                unresolved_nexthops, remaining_attempts):
-        """Resolve for nexthops using the resolve_handler
-        Return packet-out ofmsgs using V4 ARP/V6 ND to resolve nexthops
+    def _resolve_due_nexthops(self, resolve_handler, vlan, now, route_gws, max_attempts):
+        """Resolve nexthops that are due, using the resolve_handler.
+
+        Nexthops are dequeued in order of when they became due, so only
+        nexthops that are due are visited. At most max_attempts nexthops
+        are resolved; the remainder stay queued for later calls, and are
+        counted as the resolve backlog.
+
+        Args:
+            resolve_handler (callable): returns resolve ofmsgs for a nexthop.
+            vlan (vlan): VLAN containing this RIB/FIB.
+            now (float): seconds since epoch.
+            route_gws (bool): True to resolve route gateways, False for hosts.
+            max_attempts (int): maximum nexthops to resolve.
+        Returns:
+            list: OpenFlow messages.
         """
         ofmsgs = []
-        for ip_gw in unresolved_nexthops:
-            if remaining_attempts == 0:
-                break
-            entry = self._vlan_nexthop_cache_entry(vlan, ip_gw)
-            if entry is None:
+        if route_gws:
+            ip_gws = vlan.dyn_route_gws_by_ipv[self.IPV]
+            other_ip_gws = vlan.dyn_host_gws_by_ipv[self.IPV]
+        else:
+            ip_gws = vlan.dyn_host_gws_by_ipv[self.IPV]
+            other_ip_gws = vlan.dyn_route_gws_by_ipv[self.IPV]
+        queue = self._vlan_resolve_queue(vlan, route_gws)
+        nexthop_cache = self._vlan_nexthop_cache(vlan)
+        not_due = []
+        backlog = []
+        while queue and queue[0][0] <= now:
+            queued = heapq.heappop(queue)
+            due_time, _, ip_gw = queued
+            entry = nexthop_cache.get(ip_gw, None)
+            if (entry is None or
+                    entry.resolution_due_time(self.neighbor_timeout) != due_time):
+                continue
+            if ip_gw not in ip_gws:
+                if ip_gw in other_ip_gws:
+                    heapq.heappush(self._vlan_resolve_queue(vlan, not route_gws), queued)
                 continue
             if not entry.resolution_due(now, self.neighbor_timeout):
+                not_due.append(queued)
+                continue
+            if max_attempts == 0:
+                backlog.append(queued)
                 continue
             resolve_flows = resolve_handler(ip_gw, entry, vlan, now)
             if resolve_flows:
                 ofmsgs.extend(resolve_flows)
-                remaining_attempts -= 1
+                max_attempts -= 1
+        for queued in not_due + backlog:
+            heapq.heappush(queue, queued)
+        vlan.dyn_resolve_backlog_by_ipv[self.IPV][route_gws] = len(backlog)
         return ofmsgs
 
     def resolve_gateways(self, vlan, now, resolve_all=True):
@@ -538,21 +800,22 @@ class ValveRouteManager(ValveManagerBase):
         Args:
             vlan (vlan): VLAN containing this RIB/FIB.
             now (float): seconds since epoch.
-            resolve_all (bool): attempt to resolve all unresolved gateways.
+            resolve_all (bool): attempt to resolve up to max_hosts_per_resolve_cycle gateways.
         Returns:
             list: OpenFlow messages.
         """
-        unresolved_gateways = []
+        max_attempts = 1
         if resolve_all:
-            unresolved_gateways = self._vlan_unresolved_nexthops(
-                vlan, vlan.dyn_route_gws_by_ipv[self.IPV], now)
-            vlan.dyn_unresolved_route_ip_gws[self.IPV] = unresolved_gateways
-        else:
-            if vlan.dyn_unresolved_route_ip_gws[self.IPV]:
-                unresolved_gateways = [vlan.dyn_unresolved_route_ip_gws[self.IPV].popleft()]
-        return self._resolve_gateways_flows(
-            self._resolve_gateway_flows, vlan, now,
-            unresolved_gateways, self.max_hosts_per_resolve_cycle)
+            max_attempts = self.max_hosts_per_resolve_cycle
+            # Static and BGP routes add gateways without a cache entry.
+            nexthop_cache = self._vlan_nexthop_cache(vlan)
+            new_ip_gws = [
+                ip_gw for ip_gw in vlan.dyn_route_gws_by_ipv[self.IPV]
+                if ip_gw not in nexthop_cache]
+            for ip_gw in new_ip_gws:
+                self._update_nexthop_cache(now, vlan, None, None, ip_gw)
+        return self._resolve_due_nexthops(
+            self._resolve_gateway_flows, vlan, now, True, max_attempts)
 
     def resolve_expire_hosts(self, vlan, now, resolve_all=True):
         """Re/resolve hosts.
@@ -560,21 +823,15 @@ class ValveRouteManager(ValveManagerBase):
         Args:
             vlan (vlan): VLAN containing this RIB/FIB.
             now (float): seconds since epoch.
-            resolve_all (bool): attempt to resolve all unresolved gateways.
+            resolve_all (bool): attempt to resolve up to max_hosts_per_resolve_cycle hosts.
         Returns:
             list: OpenFlow messages.
         """
-        unresolved_gateways = []
+        max_attempts = 1
         if resolve_all:
-            unresolved_gateways = self._vlan_unresolved_nexthops(
-                vlan, vlan.dyn_host_gws_by_ipv[self.IPV], now)
-            vlan.dyn_unresolved_host_ip_gws[self.IPV] = unresolved_gateways
-        else:
-            if vlan.dyn_unresolved_host_ip_gws[self.IPV]:
-                unresolved_gateways = [vlan.dyn_unresolved_host_ip_gws[self.IPV].popleft()]
-        return self._resolve_gateways_flows(
-            self._resolve_expire_gateway_flows, vlan, now,
-            unresolved_gateways, self.max_hosts_per_resolve_cycle)
+            max_attempts = self.max_hosts_per_resolve_cycle
+        return self._resolve_due_nexthops(
+            self._resolve_expire_gateway_flows, vlan, now, False, max_attempts)
 
     def _cached_nexthop_eth_dst(self, vlan, ip_gw):
         """Return nexthop cache entry eth_dst for the ip_gw"""
@@ -608,10 +865,12 @@ class ValveRouteManager(ValveManagerBase):
                     faucet_vip.ip != dst_ip and self._stateful_gw(vlan, dst_ip)):
                 limit = self._vlan_nexthop_cache_limit(vlan)
                 if limit is None or len(self._vlan_nexthop_cache(vlan)) < limit:
-                    # TODO: avoid relearning L3 source if same L3 source tries
-                    # multiple L3 destinations quickly.
                     ofmsgs.extend(self.add_host_fib_route_from_pkt(now, pkt_meta))
                     resolution_in_progress = dst_ip in vlan.dyn_host_gws_by_ipv[self.IPV]
+                    # Don't reinstall blackhole flows for a destination recently tried.
+                    if (self.proactive_learn_dst_cache.recent(now, (vlan.vid, dst_ip)) and
+                            resolution_in_progress):
+                        return ofmsgs
                     ofmsgs.extend(self._add_host_fib_route(vlan, dst_ip, blackhole=True))
                     nexthop_cache_entry = self._update_nexthop_cache(
                         now, vlan, None, None, dst_ip)
@@ -658,8 +917,8 @@ class ValveRouteManager(ValveManagerBase):
             return ofmsgs
         if vlan.is_faucet_vip(ip_dst):
             return ofmsgs
-        routes = self._vlan_routes(vlan)
-        if routes.get(ip_dst, None) == ip_gw:
+        old_ip_gws = vlan.route_gws(ip_dst)
+        if old_ip_gws == frozenset([ip_gw]):
             return ofmsgs
 
         vlan.add_route(ip_dst, ip_gw)
@@ -671,6 +930,7 @@ class ValveRouteManager(ValveManagerBase):
                 ip_dst=ip_dst,
                 eth_dst=cached_eth_dst,
                 is_updated=False))
+        ofmsgs.extend(self._release_route_group(vlan, ip_dst, old_ip_gws))
         return ofmsgs
 
     def _add_host_fib_route(self, vlan, host_ip, blackhole=False):
@@ -734,11 +994,16 @@ class ValveRouteManager(ValveManagerBase):
         if (src_ip and pkt_meta.vlan.ip_in_vip_subnet(src_ip) and
                 self._stateful_gw(pkt_meta.vlan, src_ip)):
             ip_pkt = self._ip_pkt(pkt_meta.pkt)
-            if ip_pkt:
-                ofmsgs.extend(
-                    self._add_host_fib_route(pkt_meta.vlan, src_ip, blackhole=False))
-                ofmsgs.extend(self._update_nexthop(
-                    now, pkt_meta.vlan, pkt_meta.port, pkt_meta.eth_src, src_ip))
+            if not ip_pkt:
+                return ofmsgs
+            # Don't relearn a source that tries many destinations quickly.
+            if self.proactive_learn_src_cache.recent(
+                    now, (pkt_meta.vlan.vid, src_ip), (pkt_meta.eth_src, pkt_meta.port.number)):
+                return ofmsgs
+            ofmsgs.extend(
+                self._add_host_fib_route(pkt_meta.vlan, src_ip, blackhole=False))
+            ofmsgs.extend(self._update_nexthop(
+                now, pkt_meta.vlan, pkt_meta.port, pkt_meta.eth_src, src_ip))
         return ofmsgs
 
     def _del_route_flows(self, vlan, ip_dst):
@@ -767,8 +1032,10 @@ class ValveRouteManager(ValveManagerBase):
             return ofmsgs
         routes = self._vlan_routes(vlan)
         if ip_dst in routes:
+            ip_gws = vlan.route_gws(ip_dst)
             vlan.del_route(ip_dst)
             ofmsgs.extend(self._del_route_flows(vlan, ip_dst))
+            ofmsgs.extend(self._release_route_group(vlan, ip_dst, ip_gws))
         return ofmsgs
 
     def control_plane_handler(self, now, pkt_meta):
@@ -0,0 +1,139 @@
+"""Pace sending of OpenFlow messages to a datapath."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Education Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+
+from faucet import valve_of
+
+
+class ValveSendQueue:
+    """Send OpenFlow messages to a datapath, at most window messages in flight.
+
+    Messages are in flight from when they are sent until a reply to a
+    subsequent barrier request is received. Barrier requests are added only
+    when the window is full, so a datapath keeping up with the controller
+    sees few extra barriers. Packet outs (including LLDP and LACP) do not
+    change datapath state, so are sent immediately, ahead of queued messages.
+    A window of 0 means messages are sent without waiting for barrier replies.
+    """
+
+    def __init__(self, window, barrier_timeout):
+        self.window = window
+        self.barrier_timeout = barrier_timeout
+        self.ryu_dp = None
+        self.queue = deque()
+        self.barriers = deque()
+        self.in_flight = 0
+        self.unbarriered = 0
+        self.queued_time = None
+
+    def reset(self, ryu_dp=None):
+        """Discard all state (e.g. datapath has reconnected)."""
+        self.ryu_dp = ryu_dp
+        self.queue = deque()
+        self.barriers = deque()
+        self.in_flight = 0
+        self.unbarriered = 0
+        self.queued_time = None
+
+    def depth(self):
+        """Return number of messages waiting to be sent."""
+        return len(self.queue)
+
+    def _send(self, ofmsg):
+        ofmsg.datapath = self.ryu_dp
+        self.ryu_dp.send_msg(ofmsg)
+
+    def _send_barrier(self, now, ofmsg=None):
+        if ofmsg is None:
+            ofmsg = valve_of.barrier()
+        self._send(ofmsg)
+        self.barriers.append((now, self.unbarriered))
+        self.unbarriered = 0
+
+    def _drain(self, now):
+        """Send queued messages while window allows.
+
+        Returns:
+            float: seconds taken to empty the queue, if it was just emptied.
+        """
+        if not self.queue:
+            return None
+        while self.queue and (not self.window or self.in_flight < self.window):
+            ofmsg = self.queue.popleft()
+            if valve_of.is_barrier(ofmsg):
+                self._send_barrier(now, ofmsg)
+                continue
+            self._send(ofmsg)
+            self.in_flight += 1
+            self.unbarriered += 1
+        if self.queue:
+            if self.unbarriered:
+                self._send_barrier(now)
+            return None
+        drain_secs = now - self.queued_time
+        self.queued_time = None
+        return drain_secs
+
+    def send(self, now, ryu_dp, ofmsgs):
+        """Send messages or queue them until the window allows.
+
+        Args:
+            now (float): current epoch time.
+            ryu_dp (ryu.controller.controller.Datapath): datapath.
+            ofmsgs (list): OpenFlow messages to send.
+        Returns:
+            float: seconds taken to empty the queue, if it was just emptied.
+        """
+        if ryu_dp is not self.ryu_dp:
+            self.reset(ryu_dp)
+        for ofmsg in ofmsgs:
+            if valve_of.is_packetout(ofmsg):
+                self._send(ofmsg)
+            else:
+                self.queue.append(ofmsg)
+        if self.queue and self.queued_time is None:
+            self.queued_time = now
+        return self._drain(now)
+
+    def barrier_reply(self, now):
+        """Datapath has processed messages up to the oldest outstanding barrier.
+
+        Args:
+            now (float): current epoch time.
+        Returns:
+            float: seconds taken to empty the queue, if it was just emptied.
+        """
+        if self.barriers:
+            _, acked = self.barriers.popleft()
+            self.in_flight -= acked
+        return self._drain(now)
+
+    def expire_barriers(self, now):
+        """Assume all outstanding barriers replied to, if oldest overdue.
+
+        Args:
+            now (float): current epoch time.
+        Returns:
+            tuple: (True if barriers were expired, seconds taken to empty the queue or None).
+        """
+        if self.barriers and now - self.barriers[0][0] > self.barrier_timeout:
+            self.barriers = deque()
+            self.in_flight = self.unbarriered
+            return (True, self._drain(now))
+        return (False, None)
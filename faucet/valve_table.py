@@ -191,21 +191,24 @@ class ValveTable: # pylint: disable=too-many-arguments,too-many-instance-attribu
 class ValveGroupEntry:
     """Abstraction for a single OpenFlow group entry."""
 
-    def __init__(self, table, group_id, buckets):
+    def __init__(self, table, group_id, buckets, group_type=valve_of.ofp.OFPGT_ALL):
         self.table = table
         self.group_id = group_id
+        self.group_type = group_type
+        self.refs = set()
         self.update_buckets(buckets)
 
     def update_buckets(self, buckets):
         """Update entry with new buckets."""
         self.buckets = tuple(buckets)
+        self.buckets_key = valve_of.buckets_key(self.buckets)
 
     def add(self):
         """Return flows to add this entry to the group table."""
         ofmsgs = []
         ofmsgs.append(self.delete())
         ofmsgs.append(valve_of.groupadd(
-            group_id=self.group_id, buckets=self.buckets))
+            type_=self.group_type, group_id=self.group_id, buckets=self.buckets))
         self.table.entries[self.group_id] = self
         return ofmsgs
 
@@ -213,7 +216,8 @@ class ValveGroupEntry:
         """Return flow to modify an existing group entry."""
         assert self.group_id in self.table.entries
         self.table.entries[self.group_id] = self
-        return valve_of.groupmod(group_id=self.group_id, buckets=self.buckets)
+        return valve_of.groupmod(
+            type_=self.group_type, group_id=self.group_id, buckets=self.buckets)
 
     def delete(self):
         """Return flow to delete an existing group entry."""
@@ -226,11 +230,28 @@ class ValveGroupTable:
     """Wrap access to group table."""
 
     entries = None # type: dict
-
+    shared_entries = None # type: dict
+    shared_refs = None # type: dict
 
     def __init__(self):
         """Constructs a new object"""
         self.entries = {}
+        self.shared_entries = {}
+        self.shared_refs = {}
+
+    def clone_state(self, prev_groups):
+        """Inherit groups already present on the datapath (e.g. on warm reload)."""
+        self.entries = prev_groups.entries
+        self.shared_entries = prev_groups.shared_entries
+        self.shared_refs = prev_groups.shared_refs
+        for entry in self.entries.values():
+            entry.table = self
+
+    def _free_group_id(self, group_id):
+        """Return group_id if not in use, otherwise the next unused group ID."""
+        while group_id in self.entries:
+            group_id += 1
+        return group_id
 
     @staticmethod
     def group_id_from_str(key_str):
@@ -239,18 +260,62 @@ class ValveGroupTable:
         digest = hashlib.sha256(key_str.encode('utf-8')).digest()
         return struct.unpack('<L', digest[:4])[0]
 
-    def get_entry(self, group_id, buckets):
-        """Update entry with group_id with buckets, and return the entry."""
-        if group_id in self.entries:
-            self.entries[group_id].update_buckets(buckets)
-        else:
-            self.entries[group_id] = ValveGroupEntry(
-                self, group_id, buckets)
-        return self.entries[group_id]
+    def add_entry(self, group_id, buckets, group_type=valve_of.ofp.OFPGT_ALL):
+        """Add a new entry with group_id, or the next unused group ID.
+
+        Returns:
+            tuple: (ValveGroupEntry, list of OF messages to add the entry).
+        """
+        entry = ValveGroupEntry(self, self._free_group_id(group_id), buckets, group_type)
+        return (entry, entry.add())
+
+    def get_shared_entry(self, ref, group_id, buckets):
+        """Return an entry shared by all refs with the same buckets.
+
+        Args:
+            ref: hashable reference to the entry (e.g. VLAN ID).
+            group_id (int): group ID to use for a new entry, if not in use.
+            buckets (list): group buckets.
+        Returns:
+            tuple: (ValveGroupEntry, list of OF messages to update the group table).
+        """
+        buckets_key = valve_of.buckets_key(buckets)
+        prev_entry = self.shared_refs.get(ref, None)
+        entry = self.shared_entries.get(buckets_key, None)
+        if entry is not None and entry is prev_entry:
+            return (entry, [])
+        if entry is None and prev_entry is not None and prev_entry.refs == {ref}:
+            # Only this ref uses the previous entry, so modify it in place.
+            del self.shared_entries[prev_entry.buckets_key]
+            prev_entry.update_buckets(buckets)
+            self.shared_entries[prev_entry.buckets_key] = prev_entry
+            return (prev_entry, [prev_entry.modify()])
+        ofmsgs = []
+        if entry is None:
+            entry = ValveGroupEntry(self, self._free_group_id(group_id), buckets)
+            self.shared_entries[entry.buckets_key] = entry
+            ofmsgs.extend(entry.add())
+        ofmsgs.extend(self.release_shared_entry(ref))
+        entry.refs.add(ref)
+        self.shared_refs[ref] = entry
+        return (entry, ofmsgs)
+
+    def release_shared_entry(self, ref):
+        """Release a reference to a shared entry, deleting the entry if no longer used."""
+        entry = self.shared_refs.pop(ref, None)
+        if entry is None:
+            return []
+        entry.refs.discard(ref)
+        if entry.refs:
+            return []
+        del self.shared_entries[entry.buckets_key]
+        return [entry.delete()]
 
     def delete_all(self):
         """Delete all groups."""
         self.entries = {}
+        self.shared_entries = {}
+        self.shared_refs = {}
         return valve_of.groupdel()
 
 
@@ -77,9 +77,14 @@ DEFAULTS = {
     'FAUCET_LOG_LEVEL': 'INFO',
     'FAUCET_LOG': _PREFIX + '/var/log/faucet/faucet.log',
     'FAUCET_EVENT_SOCK': '',  # Special-case, see get_setting().
+    'FAUCET_EVENT_SOCK_HISTORY': '1024',
     'FAUCET_EXCEPTION_LOG': _PREFIX + '/var/log/faucet/faucet_exception.log',
     'FAUCET_PROMETHEUS_PORT': '9302',
     'FAUCET_PROMETHEUS_ADDR': '0.0.0.0',
+    'FAUCET_PROMETHEUS_CACHE_SECS': '0',
+    'FAUCET_PROMETHEUS_RENDER_THREAD': False,
+    'FAUCET_SHARD': '0',
+    'FAUCET_SHARDS': '1',
     'GAUGE_CONFIG': ''.join((
         _PREFIX,
         '/etc/faucet/gauge.yaml',
@@ -22,11 +22,42 @@ from collections import defaultdict
 from faucet.conf import InvalidConfigError
 from faucet.config_parser_util import config_changed, CONFIG_HASH_FUNC
 from faucet.config_parser import dp_parser, dp_preparsed_parser
+from faucet import valve_packet_in
 from faucet.valve import valve_factory, SUPPORTED_HARDWARE
 from faucet.valve_util import dpid_log, stat_config_files
 
 STACK_ROOT_STATE_UPDATE_TIME = 10
 STACK_ROOT_DOWN_TIME = STACK_ROOT_STATE_UPDATE_TIME * 3
+# Minimum delay before processing packet in batches again.
+PACKET_IN_BATCH_UPDATE_TIME = 0.005
+
+
+def dp_shards(dps, shards):
+    """Return DPs by shard, sharded by DP ID.
+
+    All stacked DPs are in the same shard, as stack state is shared by all of them.
+
+    Args:
+        dps (list): DPs to shard.
+        shards (int): number of shards.
+    Returns:
+        dict: list of DPs, by shard.
+    """
+    by_shard = defaultdict(list)
+    stack_dp_ids = [dp.dp_id for dp in dps if dp.stack is not None]
+    for dp in dps:
+        shard_dp_id = dp.dp_id
+        if dp.stack is not None:
+            shard_dp_id = min(stack_dp_ids)
+        by_shard[shard_dp_id % shards].append(dp)
+    return by_shard
+
+
+def dp_shard_by_id(dps, shards):
+    """Return shard of each DP, by DP ID."""
+    return {
+        dp.dp_id: shard
+        for shard, shard_dps in dp_shards(dps, shards).items() for dp in shard_dps}
 
 
 class MetaDPState:
@@ -80,7 +111,7 @@ class ValvesManager:
     valves = None # type: dict
 
     def __init__(self, logname, logger, metrics, notifier, bgp,
-                 dot1x, config_auto_revert, send_flows_to_dp_by_id):
+                 dot1x, config_auto_revert, send_flows_to_dp_by_id, shard=0, shards=1):
         """Initialize ValvesManager.
 
         Args:
@@ -91,6 +122,8 @@ class ValvesManager:
             bgp (FaucetBgp): BGP instance.
             config_auto_revert (bool): True if FAUCET should attempt to revert bad configs.
             send_flows_to_dp_by_id: callable, two args - DP ID and list of flows to send to DP.
+            shard (int): this instance controls only DPs in this shard.
+            shards (int): number of instances DPs are sharded across.
         """
         self.logname = logname
         self.logger = logger
@@ -100,10 +133,15 @@ class ValvesManager:
         self.dot1x = dot1x
         self.config_auto_revert = config_auto_revert
         self.send_flows_to_dp_by_id = send_flows_to_dp_by_id
+        self.shard = shard
+        self.shards = shards
+        self.dp_shard_by_id = {}
         self.valves = {}
         self.config_applied = {}
         self.config_watcher = ConfigWatcher()
         self.meta_dp_state = MetaDPState()
+        self.dp_cache = {}
+        self._packet_in_batches = defaultdict(list)
 
     def _stack_root_healthy(self, now, candidate_dp):
         """Return True if a candidate DP is healthy."""
@@ -192,7 +230,8 @@ class ValvesManager:
         self.metrics.faucet_config_hash_func.labels(algorithm=CONFIG_HASH_FUNC)
         try:
             new_conf_hashes, new_config_content, new_dps, top_conf = dp_parser(
-                new_config_file, self.logname, self.meta_dp_state)
+                new_config_file, self.logname, self.meta_dp_state, self.dp_cache)
+            self._check_dp_shards(new_dps)
             new_present_conf_hashes = [
                 (conf_file, conf_hash) for conf_file, conf_hash in sorted(new_conf_hashes.items())
                 if conf_hash is not None]
@@ -216,6 +255,35 @@ class ValvesManager:
             new_dps = None
         return new_dps
 
+    def _check_dp_shards(self, new_dps):
+        """Raise InvalidConfigError if new_dps would move a DP to another shard.
+
+        A DP connects to only its own shard, so could not be controlled by another.
+        Every shard rejects the same configs, so shards always agree on DP placement.
+        """
+        if self.shards < 2 or not self.dp_shard_by_id:
+            return
+        new_dp_shard_by_id = dp_shard_by_id(new_dps, self.shards)
+        moved_dpids = [
+            dpid_log(dp_id) for dp_id, shard in sorted(new_dp_shard_by_id.items())
+            if self.dp_shard_by_id.get(dp_id, shard) != shard]
+        if moved_dpids:
+            raise InvalidConfigError(
+                'config moves DPs %s to another shard (restart FAUCET to move them)' % (
+                    ', '.join(moved_dpids)))
+
+    def datapath_wrong_shard(self, dp_id):
+        """Return True if dp_id is controlled by another shard (logging an error)."""
+        shard = self.dp_shard_by_id.get(dp_id, None)
+        if shard is None or shard == self.shard:
+            return False
+        self.logger.error(
+            'datapath %s connected to shard %u, but is controlled by shard %u',
+            dpid_log(dp_id), self.shard, shard)
+        self.metrics.of_dp_wrong_shard_connections.labels( # pylint: disable=no-member
+            dp_id=hex(dp_id), shard=shard).inc()
+        return True
+
     def new_valve(self, new_dp):
         valve_cl = valve_factory(new_dp)
         if valve_cl is not None:
@@ -231,13 +299,22 @@ class ValvesManager:
         self.update_config_applied(reset=True)
         if new_dps is None:
             return False
+        if self.shards > 1:
+            self.dp_shard_by_id = dp_shard_by_id(new_dps, self.shards)
+            new_dps = dp_shards(new_dps, self.shards)[self.shard]
+            self.logger.info(
+                'controlling %u DPs in shard %u of %u', len(new_dps), self.shard, self.shards)
         deleted_dpids = {v for v in self.valves} - {dp.dp_id for dp in new_dps}
         sent = {}
         for new_dp in new_dps:
             dp_id = new_dp.dp_id
             if dp_id in self.valves:
-                self.logger.info('Reconfiguring existing datapath %s', dpid_log(dp_id))
                 valve = self.valves[dp_id]
+                if new_dp is valve.dp:
+                    self.logger.info('Datapath %s config unchanged', dpid_log(dp_id))
+                    sent[dp_id] = True
+                    continue
+                self.logger.info('Reconfiguring existing datapath %s', dpid_log(dp_id))
                 ofmsgs = valve.reload_config(now, new_dp)
                 self.send_flows_to_dp_by_id(valve, ofmsgs)
                 sent[dp_id] = True
@@ -252,6 +329,12 @@ class ValvesManager:
             for deleted_dp in deleted_dpids:
                 delete_dp(deleted_dp)
                 del self.valves[deleted_dp]
+                self._packet_in_batches.pop(deleted_dp, None)
+        # Only reuse DPs that Valves are still using.
+        valve_dps = {id(valve.dp) for valve in self.valves.values()}
+        self.dp_cache = {
+            dp_key: cache_entry for dp_key, cache_entry in self.dp_cache.items()
+            if id(cache_entry[1]) in valve_dps}
         self.bgp.reset(self.valves)
         self.dot1x.reset(self.valves)
         self.update_config_applied(sent)
@@ -314,23 +397,132 @@ class ValvesManager:
             msg.desc.port_no, msg.reason, msg.desc.state, self._other_running_valves(valve))
         self._send_ofmsgs_by_valve(ofmsgs_by_valve)
 
-    def valve_packet_in(self, now, valve, msg):
-        """Time a call to Valve packet in handler."""
-        self.metrics.of_packet_ins.labels( # pylint: disable=no-member
-            **valve.dp.base_prom_labels()).inc()
-        if valve.rate_limit_packet_ins(now):
-            return
+    def _parse_packet_in(self, now, valve, msg):
+        """Parse one packet in, unless unexpected or rate limited.
+
+        Returns:
+            PacketMeta: packet to process, or None if packet in ignored.
+        """
         pkt_meta = valve.parse_pkt_meta(msg)
         if pkt_meta is None:
             self.metrics.of_unexpected_packet_ins.labels( # pylint: disable=no-member
                 **valve.dp.base_prom_labels()).inc()
-            return
+            return None
+        if valve.rate_limit_packet_ins(now, pkt_meta):
+            return None
+        return pkt_meta
+
+    def _process_packet_in(self, now, valve, msg, ofmsgs_by_valve):
+        """Process one packet in, accumulating any flows to send by Valve.
+
+        Returns:
+            Port: port that packet in was received on, if flows resulted.
+        """
+        pkt_meta = self._parse_packet_in(now, valve, msg)
+        if pkt_meta is None:
+            return None
+        return self._rcv_packet_in(now, valve, pkt_meta, ofmsgs_by_valve)
+
+    def _rcv_packet_in(self, now, valve, pkt_meta, ofmsgs_by_valve):
+        """Handle one parsed packet in, accumulating any flows to send by Valve.
+
+        Returns:
+            Port: port that packet in was received on, if flows resulted.
+        """
         with self.metrics.faucet_packet_in_secs.labels( # pylint: disable=no-member
                 **valve.dp.base_prom_labels()).time():
-            ofmsgs_by_valve = valve.rcv_packet(now, self._other_running_valves(valve), pkt_meta)
-        if ofmsgs_by_valve:
+            rcv_ofmsgs_by_valve = valve.rcv_packet(now, self._other_running_valves(valve), pkt_meta)
+        if rcv_ofmsgs_by_valve:
+            for rcv_valve, ofmsgs in rcv_ofmsgs_by_valve.items():
+                ofmsgs_by_valve[rcv_valve].extend(ofmsgs)
+            return pkt_meta.port
+        return None
+
+    def valve_packet_in(self, now, valve, msg):
+        """Time a call to Valve packet in handler."""
+        self.metrics.of_packet_ins.labels( # pylint: disable=no-member
+            **valve.dp.base_prom_labels()).inc()
+        if valve.dp.packetin_batch_size > 1:
+            self._batch_packet_in(now, valve, msg)
+            return
+        ofmsgs_by_valve = defaultdict(list)
+        updated_port = self._process_packet_in(now, valve, msg, ofmsgs_by_valve)
+        if updated_port is not None:
             self._send_ofmsgs_by_valve(ofmsgs_by_valve)
-            valve.update_metrics(now, pkt_meta.port, rate_limited=True)
+            valve.update_metrics(now, updated_port, rate_limited=True)
+
+    def _batch_packet_in(self, now, valve, msg):
+        """Queue a packet in, processing the queue if full or too old."""
+        batch = self._packet_in_batches[valve.dp.dp_id]
+        batch.append((now, msg))
+        batch_age = now - batch[0][0]
+        if (len(batch) >= valve.dp.packetin_batch_size or
+                batch_age * 1e3 >= valve.dp.packetin_batch_window_ms):
+            self._valve_packet_in_batch(now, valve)
+
+    def _valve_packet_in_batch(self, now, valve):
+        """Process all queued packet ins for a Valve and send flows once."""
+        batch = self._packet_in_batches.pop(valve.dp.dp_id, None)
+        if not batch:
+            return
+        batch_labels = valve.dp.base_prom_labels()
+        self.metrics.faucet_packet_in_batch_size.labels( # pylint: disable=no-member
+            **batch_labels).observe(len(batch))
+        self.metrics.faucet_packet_in_batch_latency_secs.labels( # pylint: disable=no-member
+            **batch_labels).observe(max(now - batch[0][0], 0))
+        ofmsgs_by_valve = defaultdict(list)
+        updated_ports = {}
+        pkts_seen = set()
+        pkts = []
+        for pkt_in_time, msg in batch:
+            pkt_meta = self._parse_packet_in(pkt_in_time, valve, msg)
+            if pkt_meta is None:
+                continue
+            pkt_class = valve_packet_in.packet_in_class(pkt_meta)
+            # An identical packet only for learning from the same port in the
+            # same batch cannot cause any new state. Control plane packets
+            # (e.g. ARP/ND retries) are always processed, as each needs a reply.
+            if pkt_class == valve_packet_in.LEARN and pkt_meta.data:
+                pkt_key = (pkt_meta.port.number, bytes(pkt_meta.data))
+                if pkt_key in pkts_seen:
+                    continue
+                pkts_seen.add(pkt_key)
+            pkt_priority = valve_packet_in.PACKET_IN_CLASS_PRIORITY[pkt_class]
+            pkts.append((pkt_priority, pkt_in_time, pkt_meta))
+        # Serve protocol keepalives first, otherwise in order of arrival.
+        pkts.sort(key=lambda pkt: pkt[0])
+        for _, pkt_in_time, pkt_meta in pkts:
+            updated_port = self._rcv_packet_in(pkt_in_time, valve, pkt_meta, ofmsgs_by_valve)
+            if updated_port is not None:
+                updated_ports[updated_port.number] = updated_port
+        if updated_ports:
+            self._send_ofmsgs_by_valve(ofmsgs_by_valve)
+            for updated_port in updated_ports.values():
+                valve.update_metrics(now, updated_port, rate_limited=True)
+
+    def packet_in_batch_due_secs(self, now):
+        """Return seconds until a queued packet in batch reaches its maximum age, or None if none queued."""
+        due_secs = None
+        for dp_id, batch in self._packet_in_batches.items():
+            batch_due_secs = 0
+            valve = self.valves.get(dp_id, None)
+            if valve is not None:
+                batch_due_secs = max(
+                    batch[0][0] + valve.dp.packetin_batch_window_ms / 1e3 - now, 0)
+            if due_secs is None or batch_due_secs < due_secs:
+                due_secs = batch_due_secs
+        return due_secs
+
+    def valve_packet_in_batches(self, now):
+        """Process any packet in batches that have reached their maximum age."""
+        for dp_id, batch in list(self._packet_in_batches.items()):
+            valve = self.valves.get(dp_id, None)
+            if valve is None:
+                del self._packet_in_batches[dp_id]
+                continue
+            batch_age = now - batch[0][0]
+            if batch_age * 1e3 >= valve.dp.packetin_batch_window_ms:
+                self._valve_packet_in_batch(now, valve)
 
     def update_config_applied(self, sent=None, reset=False):
         """Update faucet_config_applied from {dpid: sent} dict,
@@ -349,3 +541,9 @@ class ValvesManager:
         """Handle connection from DP."""
         self.meta_dp_state.dp_last_live_time[valve.dp.name] = now
         return valve.datapath_connect(now, discovered_up_ports)
+
+    def datapath_disconnect(self, valve):
+        """Handle disconnection of DP."""
+        # Packet ins queued from the old connection are stale.
+        self._packet_in_batches.pop(valve.dp.dp_id, None)
+        valve.datapath_disconnect()
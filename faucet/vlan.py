@@ -17,13 +17,14 @@
 # limitations under the License.
 
 import collections
+import heapq
 import ipaddress
 import random
 import netaddr
 
 from faucet import valve_of
 from faucet.conf import Conf, test_config_condition, InvalidConfigError
-from faucet.valve_packet import FAUCET_MAC
+from faucet.valve_packet import FAUCET_MAC, int_to_mac_addr, mac_addr_to_int
 
 
 class OFVLAN:
@@ -52,17 +53,22 @@ class HostCacheEntry:
     """Association of a host with a port."""
 
     __slots__ = [
+        'cache_seq',
         'cache_time',
-        'eth_src',
         'eth_src_int',
         'port',
     ]
 
-    def __init__(self, eth_src, port, cache_time):
-        self.eth_src = eth_src
+    def __init__(self, eth_src_int, port, cache_time, cache_seq=0):
+        self.eth_src_int = eth_src_int
         self.port = port
         self.cache_time = cache_time
-        self.eth_src_int = int(eth_src.replace(':', ''), 16)
+        self.cache_seq = cache_seq
+
+    @property
+    def eth_src(self):
+        """Return MAC address of host."""
+        return int_to_mac_addr(self.eth_src_int)
 
     def __hash__(self):
         return hash((self.eth_src_int, self.port.number))
@@ -80,6 +86,61 @@ class HostCacheEntry:
         return self.__hash__() < other.__hash__()
 
 
+class RIB:
+    """Routes for one IP version on a VLAN.
+
+    Routes are indexed by destination and by gateway, so all routes via a
+    gateway are found in time proportional to the number of those routes
+    rather than the size of the RIB. A route may have more than one gateway
+    (multipath); routes maps each destination to the lowest of its gateways.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.gws_by_dst = {}
+        self.dsts_by_gw = {}
+
+    def __len__(self):
+        return len(self.routes)
+
+    def add(self, ip_dst, ip_gws):
+        """Add or replace route to ip_dst via ip_gws, returning previous gateways (if any)."""
+        ip_gws = frozenset(ip_gws)
+        old_ip_gws = self.gws_by_dst.get(ip_dst, frozenset())
+        for ip_gw in old_ip_gws - ip_gws:
+            self._del_gw_dst(ip_gw, ip_dst)
+        for ip_gw in ip_gws - old_ip_gws:
+            if ip_gw not in self.dsts_by_gw:
+                self.dsts_by_gw[ip_gw] = set()
+            self.dsts_by_gw[ip_gw].add(ip_dst)
+        ip_gw = min(ip_gws)
+        self.routes[ip_dst] = ip_gw
+        self.gws_by_dst[ip_dst] = ip_gws
+        return old_ip_gws
+
+    def remove(self, ip_dst):
+        """Remove route to ip_dst, returning its gateways."""
+        del self.routes[ip_dst]
+        ip_gws = self.gws_by_dst.pop(ip_dst)
+        for ip_gw in ip_gws:
+            self._del_gw_dst(ip_gw, ip_dst)
+        return ip_gws
+
+    def _del_gw_dst(self, ip_gw, ip_dst):
+        ip_dsts = self.dsts_by_gw[ip_gw]
+        ip_dsts.remove(ip_dst)
+        if not ip_dsts:
+            del self.dsts_by_gw[ip_gw]
+
+    def dsts_for_gw(self, ip_gw):
+        """Return destinations routed via ip_gw."""
+        return self.dsts_by_gw.get(ip_gw, ())
+
+    def gws_for_dst(self, ip_dst):
+        """Return gateways for route to ip_dst."""
+        return self.gws_by_dst.get(ip_dst, frozenset())
+
+
 class VLAN(Conf):
     """Contains state for one VLAN, including its configuration."""
 
@@ -170,14 +231,18 @@ class VLAN(Conf):
         self.dyn_host_cache = None
         self.dyn_host_cache_by_port = None
         self.dyn_host_cache_stats_stale = None
+        self.dyn_host_cache_expiry = None
+        self.dyn_host_cache_seq = 0
         self.dyn_last_time_hosts_expired = None
         self.dyn_learn_ban_count = 0
         self.dyn_neigh_cache_by_ipv = None
-        self.dyn_oldest_host_time = None
+        self.dyn_route_groups_by_ipv = None
+        self.dyn_route_gw_resolve_queue = None
+        self.dyn_host_gw_resolve_queue = None
+        self.dyn_resolve_backlog_by_ipv = None
         self.dyn_last_updated_metrics_sec = None
 
-        self.dyn_routes_by_ipv = collections.defaultdict(dict)
-        self.dyn_gws_by_ipv = collections.defaultdict(dict)
+        self.dyn_rib_by_ipv = {ipv: RIB() for ipv in (4, 6)}
         self.dyn_host_gws_by_ipv = collections.defaultdict(set)
         self.dyn_route_gws_by_ipv = collections.defaultdict(set)
         self.reset_caches()
@@ -237,12 +302,17 @@ class VLAN(Conf):
                 test_config_condition(not isinstance(route, dict), 'invalid VLAN route format')
                 test_config_condition('ip_gw' not in route, 'missing ip_gw in VLAN route')
                 test_config_condition('ip_dst' not in route, 'missing ip_dst in VLAN route')
-                ip_gw = self._check_ip_str(route['ip_gw'])
+                ip_gws = route['ip_gw']
+                if not isinstance(ip_gws, list):
+                    ip_gws = [ip_gws]
+                test_config_condition(not ip_gws, 'missing ip_gw in VLAN route')
+                ip_gws = [self._check_ip_str(ip_gw) for ip_gw in ip_gws]
                 ip_dst = self._check_ip_str(route['ip_dst'], ip_method=ipaddress.ip_network)
-                test_config_condition(
-                    ip_gw.version != ip_dst.version,
-                    'ip_gw version does not match the ip_dst version')
-                self.add_route(ip_dst, ip_gw)
+                for ip_gw in ip_gws:
+                    test_config_condition(
+                        ip_gw.version != ip_dst.version,
+                        'ip_gw version does not match the ip_dst version')
+                self.add_multipath_route(ip_dst, ip_gws)
 
     @staticmethod
     def vid_valid(vid):
@@ -254,9 +324,12 @@ class VLAN(Conf):
         self.dyn_host_cache = {}
         self.dyn_host_cache_by_port = {}
         self.dyn_host_cache_stats_stale = {}
+        self.dyn_host_cache_expiry = []
         self.dyn_neigh_cache_by_ipv = collections.defaultdict(dict)
-        self.dyn_unresolved_route_ip_gws = collections.defaultdict(list)
-        self.dyn_unresolved_host_ip_gws = collections.defaultdict(list)
+        self.dyn_route_groups_by_ipv = collections.defaultdict(dict)
+        self.dyn_route_gw_resolve_queue = collections.defaultdict(list)
+        self.dyn_host_gw_resolve_queue = collections.defaultdict(list)
+        self.dyn_resolve_backlog_by_ipv = collections.defaultdict(dict)
 
     def reset_ports(self, ports):
         """Reset tagged and untagged port lists."""
@@ -269,30 +342,41 @@ class VLAN(Conf):
 
     def add_cache_host(self, eth_src, port, cache_time):
         """Add/update a host to the cache on a port at at time."""
-        existing_entry = self.cached_host(eth_src)
+        eth_src_int = mac_addr_to_int(eth_src)
+        existing_entry = self.dyn_host_cache.get(eth_src_int, None)
         if existing_entry is None:
             self.dyn_host_cache_stats_stale[port.number] = True
+            cache_seq = self.dyn_host_cache_seq
+            self.dyn_host_cache_seq += 1
         else:
-            self.dyn_host_cache_by_port[existing_entry.port.number].remove(
-                existing_entry)
-        entry = HostCacheEntry(eth_src, port, cache_time)
+            # Reuse the existing key, so the port index shares it.
+            eth_src_int = existing_entry.eth_src_int
+            self.dyn_host_cache_by_port[existing_entry.port.number].remove(eth_src_int)
+            cache_seq = existing_entry.cache_seq
+        entry = HostCacheEntry(eth_src_int, port, cache_time, cache_seq)
         if port.number not in self.dyn_host_cache_by_port:
             self.dyn_host_cache_by_port[port.number] = set()
-        self.dyn_host_cache_by_port[port.number].add(entry)
-        self.dyn_host_cache[eth_src] = entry
+        self.dyn_host_cache_by_port[port.number].add(eth_src_int)
+        self.dyn_host_cache[eth_src_int] = entry
+        # Hosts on permanent learn ports never expire, so need not be indexed.
+        if not port.permanent_learn:
+            heapq.heappush(self.dyn_host_cache_expiry, (cache_time, cache_seq, entry))
+
+    def _expire_cache_host_int(self, eth_src_int):
+        entry = self.dyn_host_cache.pop(eth_src_int, None)
+        if entry is not None:
+            self.dyn_host_cache_stats_stale[entry.port.number] = True
+            self.dyn_host_cache_by_port[entry.port.number].remove(eth_src_int)
 
     def expire_cache_host(self, eth_src):
         """Expire a host from caches."""
-        entry = self.cached_host(eth_src)
-        if entry is not None:
-            self.dyn_host_cache_stats_stale[entry.port.number] = True
-            self.dyn_host_cache_by_port[entry.port.number].remove(entry)
-            del self.dyn_host_cache[eth_src]
+        self._expire_cache_host_int(mac_addr_to_int(eth_src))
 
     def cached_hosts_on_port(self, port):
         """Return all hosts learned on a port."""
         if port.number in self.dyn_host_cache_by_port:
-            return list(self.dyn_host_cache_by_port[port.number])
+            return [self.dyn_host_cache[eth_src_int]
+                    for eth_src_int in self.dyn_host_cache_by_port[port.number]]
         return []
 
     def cached_hosts_count_on_port(self, port):
@@ -304,7 +388,7 @@ class VLAN(Conf):
 
     def cached_host(self, eth_src):
         """Return host from cache or None."""
-        return self.dyn_host_cache.get(eth_src, None)
+        return self.dyn_host_cache.get(mac_addr_to_int(eth_src), None)
 
     def cached_host_on_port(self, eth_src, port):
         """Return host cache entry if host in cache and on specified port."""
@@ -315,24 +399,36 @@ class VLAN(Conf):
 
     def clear_cache_hosts_on_port(self, port):
         """Clear all hosts learned on a port."""
-        for entry in self.cached_hosts_on_port(port):
-            self.expire_cache_host(entry.eth_src)
+        if port.number in self.dyn_host_cache_by_port:
+            for eth_src_int in list(self.dyn_host_cache_by_port[port.number]):
+                self._expire_cache_host_int(eth_src_int)
+
+    def _host_cache_expiry_current(self, index_entry):
+        entry = index_entry[-1]
+        return self.dyn_host_cache.get(entry.eth_src_int, None) is entry
 
     def expire_cache_hosts(self, now, learn_timeout):
         """Expire stale host entries."""
         expired_hosts = []
         min_cache_time = now - learn_timeout
-
-        if self.dyn_oldest_host_time is None or self.dyn_oldest_host_time < min_cache_time:
-            expired_hosts = [
-                entry for entry in self.dyn_host_cache.values()
-                if entry.cache_time < min_cache_time and not entry.port.permanent_learn]
-            for entry in expired_hosts:
-                self.expire_cache_host(entry.eth_src)
-            self.dyn_oldest_host_time = now
-            if self.dyn_host_cache:
-                self.dyn_oldest_host_time = min(
-                    [entry.cache_time for entry in self.dyn_host_cache.values()])
+        expiry = self.dyn_host_cache_expiry
+
+        # Entries are indexed by the time they were cached. An index entry is
+        # stale (and just discarded) if the host has since been updated or removed.
+        while expiry and expiry[0][0] < min_cache_time:
+            index_entry = heapq.heappop(expiry)
+            if self._host_cache_expiry_current(index_entry):
+                expired_hosts.append(index_entry[-1])
+        # Return expired hosts in the order they were first cached.
+        expired_hosts.sort(key=lambda entry: entry.cache_seq)
+        for entry in expired_hosts:
+            self._expire_cache_host_int(entry.eth_src_int)
+        # Rebuild index if mostly stale entries.
+        if len(expiry) > 2 * len(self.dyn_host_cache) + 64:
+            self.dyn_host_cache_expiry = [
+                index_entry for index_entry in expiry
+                if self._host_cache_expiry_current(index_entry)]
+            heapq.heapify(self.dyn_host_cache_expiry)
         return expired_hosts
 
     def faucet_vips_by_ipv(self, ipv):
@@ -352,11 +448,11 @@ class VLAN(Conf):
 
     def routes_by_ipv(self, ipv):
         """Return route table for specified IP version on this VLAN."""
-        return self.dyn_routes_by_ipv[ipv]
+        return self.dyn_rib_by_ipv[ipv].routes
 
     def route_count_by_ipv(self, ipv):
         """Return route table count for specified IP version on this VLAN."""
-        return len(self.dyn_routes_by_ipv[ipv])
+        return len(self.dyn_rib_by_ipv[ipv])
 
     def is_host_fib_route(self, host_ip):
         """Return True if IP destination is a host FIB route.
@@ -366,53 +462,62 @@ class VLAN(Conf):
         Returns:
             True if a host FIB route (and not used as a gateway).
         """
-        ip_dsts = self.ip_dsts_for_ip_gw(host_ip)
-        if (len(ip_dsts) == 1 and
-                ip_dsts[0].prefixlen == ip_dsts[0].max_prefixlen and
-                ip_dsts[0].network_address == host_ip):
-            return True
+        ip_dsts = self.dyn_rib_by_ipv[host_ip.version].dsts_for_gw(host_ip)
+        if len(ip_dsts) == 1:
+            ip_dst = next(iter(ip_dsts))
+            return (ip_dst.prefixlen == ip_dst.max_prefixlen and
+                    ip_dst.network_address == host_ip)
         return False
 
     def _update_gw_types(self, ip_gw):
         """Update dyn host/route gw information to a different ip version"""
         if self.is_host_fib_route(ip_gw):
             self.dyn_host_gws_by_ipv[ip_gw.version].add(ip_gw)
-            self.dyn_route_gws_by_ipv[ip_gw.version] -= set([ip_gw])
+            self.dyn_route_gws_by_ipv[ip_gw.version].discard(ip_gw)
         else:
             self.dyn_route_gws_by_ipv[ip_gw.version].add(ip_gw)
-            self.dyn_host_gws_by_ipv[ip_gw.version] -= set([ip_gw])
+            self.dyn_host_gws_by_ipv[ip_gw.version].discard(ip_gw)
 
     def add_route(self, ip_dst, ip_gw):
         """Add an IP route."""
-        self.dyn_routes_by_ipv[ip_gw.version][ip_dst] = ip_gw
-        if ip_gw not in self.dyn_gws_by_ipv[ip_gw.version]:
-            self.dyn_gws_by_ipv[ip_gw.version][ip_gw] = set()
-        self.dyn_gws_by_ipv[ip_gw.version][ip_gw].add(ip_dst)
-        self._update_gw_types(ip_gw)
+        self.add_multipath_route(ip_dst, (ip_gw,))
+
+    def add_multipath_route(self, ip_dst, ip_gws):
+        """Add an IP route via one or more gateways."""
+        ip_gws = frozenset(ip_gws)
+        old_ip_gws = self.dyn_rib_by_ipv[ip_dst.version].add(ip_dst, ip_gws)
+        for ip_gw in old_ip_gws | ip_gws:
+            self._update_gw_types(ip_gw)
 
     def del_route(self, ip_dst):
         """Delete an IP route."""
-        ip_gw = self.dyn_routes_by_ipv[ip_dst.version][ip_dst]
-        del self.dyn_routes_by_ipv[ip_dst.version][ip_dst]
-        self.dyn_gws_by_ipv[ip_gw.version][ip_gw].remove(ip_dst)
-        if not self.dyn_gws_by_ipv[ip_gw.version][ip_gw]:
-            del self.dyn_gws_by_ipv[ip_gw.version][ip_gw]
-        self._update_gw_types(ip_gw)
+        for ip_gw in self.dyn_rib_by_ipv[ip_dst.version].remove(ip_dst):
+            self._update_gw_types(ip_gw)
+
+    def route_gws(self, ip_dst):
+        """Return gateways for route to IP destination (empty if no route)."""
+        return self.dyn_rib_by_ipv[ip_dst.version].gws_for_dst(ip_dst)
 
     def ip_dsts_for_ip_gw(self, ip_gw):
         """Return list of IP destinations, for specified gateway."""
-        if ip_gw in self.dyn_gws_by_ipv[ip_gw.version]:
-            return list(self.dyn_gws_by_ipv[ip_gw.version][ip_gw])
-        return []
+        return list(self.dyn_rib_by_ipv[ip_gw.version].dsts_for_gw(ip_gw))
+
+    def is_ip_gw(self, ip_gw):
+        """Return True if IP address is a gateway for any route."""
+        return ip_gw in self.dyn_rib_by_ipv[ip_gw.version].dsts_by_gw
 
     def all_ip_gws(self, ipv):
         """Return all IP gateways for specified IP version."""
-        return frozenset(self.dyn_gws_by_ipv[ipv].keys())
+        return frozenset(self.dyn_rib_by_ipv[ipv].dsts_by_gw.keys())
 
     def neigh_cache_by_ipv(self, ipv):
         """Return neighbor cache for specified IP version on this VLAN."""
         return self.dyn_neigh_cache_by_ipv[ipv]
 
+    def resolve_backlog_by_ipv(self, ipv):
+        """Return count of neighbors due for resolution but deferred to a later cycle."""
+        return sum(self.dyn_resolve_backlog_by_ipv[ipv].values())
+
     def neigh_cache_count_by_ipv(self, ipv):
         """Return number of hosts in neighbor cache for specified IP version on this VLAN."""
         return len(self.neigh_cache_by_ipv(ipv))
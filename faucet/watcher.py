@@ -18,6 +18,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import json
 import gzip
 
@@ -142,18 +143,34 @@ class GaugeFlowTableLogger(GaugeFlowTablePoller):
     config for this watcher
     """
 
-    def _update(self, rcv_time, msg):
-        # TODO: it might be good to aggregate all OFFlowStatsReplies somehow
-        rcv_time_str = self._rcv_time(rcv_time)
+    _BODY_JSON = '"body": []'
+
+    def _write_flows(self, outfile, rcv_time, msg):
+        """Write reply as JSON, encoding one flow at a time."""
+        reply_head = copy.copy(msg)
+        reply_head.body = []
         jsondict = {
-            'time': rcv_time_str,
+            'time': self._rcv_time(rcv_time),
             'ref': '-'.join((self.dp.name, 'flowtables')),
-            'msg': msg.to_jsondict()}
+            'msg': reply_head.to_jsondict()}
+        head, _, tail = json.dumps(jsondict).rpartition(self._BODY_JSON)
+        outfile.write('---\n')
+        outfile.write(head)
+        outfile.write(self._BODY_JSON[:-1])
+        for i, stat in enumerate(self._flow_stats(msg)):
+            if i:
+                outfile.write(', ')
+            outfile.write(json.dumps(stat.to_jsondict()))
+        outfile.write(self._BODY_JSON[-1:])
+        outfile.write(tail)
+        outfile.write('\n')
+
+    def _update(self, rcv_time, msg):
+        # TODO: it might be good to aggregate all OFFlowStatsReplies somehow
         filename = self.conf.file
-        outstr = '---\n{}\n'.format(json.dumps(jsondict))
         if self.conf.compress:
             with gzip.open(filename, 'at') as outfile:
-                outfile.write(outstr)
+                self._write_flows(outfile, rcv_time, msg)
         else:
             with open(filename, 'a') as outfile:
-                outfile.write(outstr)
+                self._write_flows(outfile, rcv_time, msg)
@@ -40,6 +40,10 @@ The following elements can be configured for each watcher, at the level of
  * db (string): The db that will be used to store the data once it is retreived.
  * interval (int): if this watcher requires polling the switch, it will \
        monitor at this interval.
+ * tables (list): for flow_table watchers, export flows only from these \
+       tables (by name). Defaults to all tables.
+ * flow_sample (int): for flow_table watchers, export only a consistent \
+       sample of 1 in this many flows. Defaults to 1 (all flows).
 
 The config for a db should be created in the gauge config file under the dbs
 config block.
@@ -69,12 +73,22 @@ For influx:
        Defaults to 10.
  * influx_retries (int): The number of times to retry connecting to influxdb \
        after failure. Defaults to 3.
+ * influx_batch_points (int): The maximum number of points to write to influxdb \
+       in one request (at least 1). Points are written once this many are \
+       buffered. Defaults to 1000.
+ * influx_batch_secs (int): Write any buffered points to influxdb at least \
+       this often, in seconds. Defaults to 1.
+ * influx_buffer_points (int): The maximum number of points to buffer while \
+       influxdb is unreachable (oldest points are dropped first). Must be at \
+       least influx_batch_points. Defaults to 100000.
 
 For Prometheus:
  * prometheus_port (int): The port used to export prometheus data. Defaults to \
        9303.
  * prometheus_addr (ip addr str): The address used to export prometheus data. \
        Defaults to '127.0.0.1'.
+ * prometheus_max_flow_series (int): The maximum number of flow table series \
+       a flow_table watcher exports (0 for no limit). Defaults to 100000.
 """
 
     db_defaults = {
@@ -95,10 +109,18 @@ For Prometheus:
         # timeout on influx requests
         'influx_retries': 3,
         # attempts to retry influx request
+        'influx_batch_points': 1000,
+        # max points per influx request
+        'influx_batch_secs': 1,
+        # write buffered points to influx at least this often
+        'influx_buffer_points': 100000,
+        # max points buffered while influx unreachable
         # prometheus config
         'prometheus_port': 9303,
         'prometheus_addr': '0.0.0.0',
         'prometheus_test_thread': False,
+        'prometheus_max_flow_series': 100000,
+        # max flow table series exported per watcher
     }
 
     db_defaults_types = {
@@ -112,9 +134,13 @@ For Prometheus:
         'influx_pwd': str,
         'influx_timeout': int,
         'influx_retries': int,
+        'influx_batch_points': int,
+        'influx_batch_secs': int,
+        'influx_buffer_points': int,
         'prometheus_port': int,
         'prometheus_addr': str,
         'prometheus_test_thread': bool,
+        'prometheus_max_flow_series': int,
     }
 
     defaults = {
@@ -123,6 +149,8 @@ For Prometheus:
         'dps': None,
         'all_dps': False,
         'interval': 30,
+        'tables': None,
+        'flow_sample': 1,
         'db': None,
         'dbs': None,
         'db_type': 'text',
@@ -134,6 +162,8 @@ For Prometheus:
         'dps': list,
         'all_dps': bool,
         'interval': int,
+        'tables': list,
+        'flow_sample': int,
         'db': str,
         'dbs': list,
         'db_type': str,
@@ -146,6 +176,8 @@ For Prometheus:
         self.all_dps = None
         self.type = None
         self.interval = None
+        self.tables = None
+        self.flow_sample = None
         self.db_type = None
         self.dps = None
         self.compress = None
@@ -157,10 +189,14 @@ For Prometheus:
         self.influx_pwd = None
         self.influx_timeout = None
         self.influx_retries = None
+        self.influx_batch_points = None
+        self.influx_batch_secs = None
+        self.influx_buffer_points = None
         self.name = None
         self.prometheus_port = None
         self.prometheus_addr = None
         self.prometheus_test_thread = None
+        self.prometheus_max_flow_series = None
         self.defaults.update(self.db_defaults)
         self.defaults_types.update(self.db_defaults_types)
         super(WatcherConf, self).__init__(_id, dp_id, conf)
@@ -174,6 +210,7 @@ For Prometheus:
         db_type = db_conf.pop('type')
         db_conf['db_type'] = db_type
         self.update(db_conf)
+        self.check_config()
         test_config_condition(
             self.file is not None and not
             (os.path.dirname(self.file) and os.access(os.path.dirname(self.file), os.W_OK)),
@@ -182,6 +219,10 @@ For Prometheus:
     def add_dp(self, dp): # pylint: disable=invalid-name
         """Add a datapath to this watcher."""
         self.dp = dp # pylint: disable=invalid-name
+        if self.tables:
+            unknown_tables = set(self.tables) - set(dp.tables)
+            test_config_condition(
+                unknown_tables, 'unknown tables %s on %s' % (unknown_tables, dp.name))
 
     def check_config(self):
         super(WatcherConf, self).check_config()
@@ -194,3 +235,10 @@ For Prometheus:
         test_config_condition(
             self.type not in valid_types,
             'type %s not one of %s' % (self.type, valid_types))
+        test_config_condition(
+            self.flow_sample < 1, 'flow_sample must be >= 1')
+        test_config_condition(
+            self.influx_batch_points < 1, 'influx_batch_points must be >= 1')
+        test_config_condition(
+            self.influx_buffer_points < self.influx_batch_points,
+            'influx_buffer_points must be >= influx_batch_points')
@@ -179,6 +179,8 @@ class FakeOFTable:
                 continue
             if isinstance(ofmsg, parser.OFPDescStatsRequest):
                 continue
+            if isinstance(ofmsg, parser.OFPFlowStatsRequest):
+                continue
             if isinstance(ofmsg, parser.OFPMeterMod):
                 # TODO: handle OFPMeterMod
                 continue
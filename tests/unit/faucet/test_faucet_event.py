@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""Test FAUCET event notification."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Innovation Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import unittest
+
+import msgpack
+
+from prometheus_client import CollectorRegistry
+
+from faucet import faucet_event
+from faucet import faucet_metrics
+
+
+class FaucetEventNotifierTestCase(unittest.TestCase): # pytype: disable=module-attr
+    """Test FaucetEventNotifier."""
+
+    HISTORY = 8
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.registry = CollectorRegistry()
+        self.metrics = faucet_metrics.FaucetMetrics(reg=self.registry)  # pylint: disable=unexpected-keyword-arg
+        self.notifier = faucet_event.FaucetEventNotifier(
+            os.path.join(self.tmpdir, 'event.sock'), self.metrics,
+            logging.getLogger('test_faucet_event'), history=self.HISTORY)
+        self.notifier.start()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _connect(self, request=None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(self.notifier.socket_path)
+        if request is not None:
+            sock.sendall(json.dumps(request).encode('UTF-8'))
+        self.socks.append(sock)
+        return sock
+
+    def _notify(self, count):
+        for _ in range(count):
+            self.notifier.notify(1, 'dp1', {'TEST': {}})
+
+    @staticmethod
+    def _recv_bytes(sock, size):
+        buf = b''
+        while len(buf) < size:
+            data = sock.recv(size - len(buf))
+            if not data:
+                break
+            buf += data
+        return buf
+
+    def _recv_json(self, sock, count):
+        buf = b''
+        while buf.count(b'\n') < count:
+            buf += self._recv_bytes(sock, 1)
+        return [json.loads(line) for line in buf.decode('UTF-8').splitlines()]
+
+    def _recv_msgpack(self, sock, count):
+        events = []
+        for _ in range(count):
+            size = struct.unpack('!I', self._recv_bytes(sock, 4))[0]
+            events.append(msgpack.unpackb(self._recv_bytes(sock, size), raw=False))
+        return events
+
+    @staticmethod
+    def _event_ids(events):
+        return [event['event_id'] for event in events]
+
+    def test_events_before_connect(self):
+        """Test client without a request receives events not yet sent to any client."""
+        self._notify(3)
+        sock = self._connect()
+        self.assertEqual([1, 2, 3], self._event_ids(self._recv_json(sock, 3)))
+        self._notify(1)
+        self.assertEqual([4], self._event_ids(self._recv_json(sock, 1)))
+
+    def test_multiple_clients(self):
+        """Test all clients receive all events, encoded once."""
+        socks = [self._connect({'resume_from': 1}) for _ in range(3)]
+        self._notify(5)
+        for sock in socks:
+            self.assertEqual([1, 2, 3, 4, 5], self._event_ids(self._recv_json(sock, 5)))
+        self.assertEqual(3, self.registry.get_sample_value('faucet_event_clients'))
+        for event in self.notifier.history:
+            self.assertEqual(
+                [faucet_event.JSON_FRAMING], list(event._encoded)) # pylint: disable=protected-access
+
+    def test_resume(self):
+        """Test client can resume from an event ID."""
+        self._notify(5)
+        sock = self._connect({'resume_from': 3})
+        self.assertEqual([3, 4, 5], self._event_ids(self._recv_json(sock, 3)))
+
+    def test_msgpack(self):
+        """Test client can select length prefixed msgpack framing."""
+        self._notify(2)
+        sock = self._connect({'resume_from': 1, 'framing': 'msgpack'})
+        events = self._recv_msgpack(sock, 2)
+        self.assertEqual([1, 2], self._event_ids(events))
+        self.assertEqual('dp1', events[0]['dp_name'])
+
+    def test_slow_client(self):
+        """Test client that falls behind the history loses only its oldest events."""
+        self._notify(self.HISTORY + 4)
+        sock = self._connect({'resume_from': 1})
+        self.assertEqual(
+            list(range(5, self.HISTORY + 5)),
+            self._event_ids(self._recv_json(sock, self.HISTORY)))
+        self.assertEqual(4, self.registry.get_sample_value('faucet_event_client_dropped_total'))
+
+    def test_notify_no_encode(self):
+        """Test notify does not encode events."""
+        self._notify(3)
+        for event in self.notifier.history:
+            self.assertFalse(event._encoded) # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    unittest.main() # pytype: disable=module-attr
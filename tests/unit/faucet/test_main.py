@@ -22,7 +22,7 @@ import unittest
 
 # pylint: disable=no-name-in-module
 # pylint: disable=import-error
-from faucet.__main__ import parse_args, build_ryu_args
+from faucet.__main__ import parse_args, build_ryu_args, build_shard_ryu_args
 
 
 class MainTestCase(unittest.TestCase): # pytype: disable=module-attr
@@ -38,6 +38,18 @@ class MainTestCase(unittest.TestCase): # pytype: disable=module-attr
         self.assertTrue(build_ryu_args(['faucet', '--use-stderr', '--use-syslog', '--verbose']))
         self.assertFalse(build_ryu_args(['faucet', '--version']))
 
+    def test_build_shard_ryu_args(self):
+        """Test build_shard_ryu_args() gives each shard its own OpenFlow port."""
+        ryu_args = build_ryu_args(['faucet', '--shards=2', '--ryu-ofp-tcp-listen-port=6000'])
+        shard_ryu_args = build_shard_ryu_args(ryu_args, 2)
+        self.assertEqual(2, len(shard_ryu_args))
+        for shard, args in enumerate(shard_ryu_args):
+            self.assertEqual('ryu-manager', args[0])
+            self.assertEqual(
+                ['--ofp-tcp-listen-port=%u' % (6000 + shard)],
+                [arg for arg in args if arg.startswith('--ofp-tcp-listen-port')])
+            self.assertIn('faucet.faucet', args)
+
 
 if __name__ == "__main__":
     unittest.main() # pytype: disable=module-attr
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""Test FAUCET prom_client."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Innovation Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import unittest
+
+from prometheus_client import CollectorRegistry, Gauge
+
+from faucet.prom_client import PromExposition, make_wsgi_app
+
+
+class PromExpositionTestCase(unittest.TestCase): # pytype: disable=module-attr
+    """Test PromExposition."""
+
+    CACHE_SECS = 10
+
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        self.gauge = Gauge('test_gauge', '', ['port'], registry=self.registry) # pylint: disable=unexpected-keyword-arg
+        self.gauge.labels(port='1').set(1)
+        self.exposition = PromExposition(self.registry, cache_secs=self.CACHE_SECS)
+
+    def test_cached(self):
+        """Test exposition regenerated only when older than cache_secs."""
+        output = self.exposition.render(100)
+        self.gauge.labels(port='1').set(2)
+        for now in range(100, 100 + self.CACHE_SECS):
+            self.assertEqual(output, self.exposition.render(now))
+        self.assertEqual(1, self.exposition.renders)
+        self.assertIn(b'test_gauge{port="1"} 2.0', self.exposition.render(100 + self.CACHE_SECS))
+        self.assertEqual(2, self.exposition.renders)
+
+    def test_invalidate(self):
+        """Test invalidated exposition regenerated on next scrape."""
+        self.exposition.render(100)
+        self.gauge.labels(port='2').set(1)
+        self.exposition.invalidate()
+        self.assertIn(b'test_gauge{port="2"} 1.0', self.exposition.render(101))
+
+    def test_no_cache(self):
+        """Test exposition regenerated every scrape if cache_secs is 0."""
+        self.exposition.cache_secs = 0
+        for _ in range(3):
+            self.exposition.render(100)
+        self.assertEqual(3, self.exposition.renders)
+
+    def test_gzip(self):
+        """Test gzip exposition compressed once per render."""
+        output = self.exposition.render(100)
+        gzip_output = self.exposition.render(100, use_gzip=True)
+        self.assertEqual(output, gzip.decompress(gzip_output))
+        self.assertIs(gzip_output, self.exposition.render(101, use_gzip=True))
+
+
+class PromWSGIAppTestCase(unittest.TestCase): # pytype: disable=module-attr
+    """Test Prometheus WSGI app."""
+
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        Gauge('test_gauge', '', registry=self.registry).set(1) # pylint: disable=unexpected-keyword-arg
+        Gauge('other_gauge', '', registry=self.registry).set(1) # pylint: disable=unexpected-keyword-arg
+        self.app = make_wsgi_app(self.registry)
+        self.headers = None
+
+    def _scrape(self, environ):
+        def start_response(_status, headers):
+            self.headers = dict(headers)
+        return b''.join(self.app(environ, start_response))
+
+    def test_gzip(self):
+        """Test gzip encoding negotiated with scraper."""
+        plain = self._scrape({})
+        self.assertNotIn('Content-Encoding', self.headers)
+        compressed = self._scrape({'HTTP_ACCEPT_ENCODING': 'gzip, deflate'})
+        self.assertEqual('gzip', self.headers['Content-Encoding'])
+        self.assertEqual(plain, gzip.decompress(compressed))
+
+    def test_restricted(self):
+        """Test scrape of only some variables."""
+        output = self._scrape({'QUERY_STRING': 'name[]=test_gauge'})
+        self.assertIn(b'test_gauge', output)
+        self.assertNotIn(b'other_gauge', output)
+
+
+if __name__ == "__main__":
+    unittest.main() # pytype: disable=module-attr
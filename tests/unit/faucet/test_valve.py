@@ -18,16 +18,19 @@
 # limitations under the License.
 
 
+from functools import partial
+import heapq
+import ipaddress
 import unittest
 from ryu.lib import mac
-from ryu.lib.packet import slow
+from ryu.lib.packet import arp, slow
 from ryu.ofproto import ether
 from ryu.ofproto import ofproto_v1_3 as ofp
 from ryu.ofproto import ofproto_v1_3_parser as parser
 from faucet import valve_of
 from valve_test_lib import (
-    CONFIG, DP1_CONFIG, FAUCET_MAC, GROUP_DP1_CONFIG, IDLE_DP1_CONFIG,
-    ValveTestBases)
+    BASE_DP1_CONFIG, CONFIG, DP1_CONFIG, FAUCET_MAC, GROUP_DP1_CONFIG, IDLE_DP1_CONFIG,
+    ValveTestBases, benchmark, benchmark_test)
 
 
 class ValveTestCase(ValveTestBases.ValveTestBig):
@@ -131,6 +134,247 @@ dps:
         self.assertTrue(self.table.is_output(match, port=3))
 
 
+class ValvePacketInBatchTestCase(ValveTestBases.ValveTestSmall):
+    """Test packet ins are processed in batches."""
+
+    CONFIG = """
+dps:
+    s1:
+        packetin_batch_size: 3
+        packetin_batch_window_ms: 1000
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: v100
+            p2:
+                number: 2
+                native_vlan: v100
+            p3:
+                number: 3
+                native_vlan: v100
+vlans:
+    v100:
+        vid: 0x100
+        faucet_vips: ['10.0.0.254/24']
+""" % DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def _rcv_host_packet(self, port):
+        return self.rcv_packet(port, 0x100, {
+            'eth_src': '00:00:00:01:00:%02x' % port,
+            'eth_dst': self.UNKNOWN_MAC,
+            'ipv4_src': '10.0.0.%u' % port,
+            'ipv4_dst': '10.0.0.99'})
+
+    def test_batch_size(self):
+        """Test packet ins are queued until batch is full."""
+        vlan = self.valve.dp.vlans[0x100]
+        for port in (1, 2):
+            self.assertFalse(self._rcv_host_packet(port))
+        self.assertEqual(0, vlan.hosts_count())
+        self.assertTrue(self._rcv_host_packet(3))
+        self.assertEqual(3, vlan.hosts_count())
+        self.assertEqual(1, self.get_prom('faucet_packet_in_batch_size_count'))
+        self.assertEqual(3, self.get_prom('faucet_packet_in_batch_size_sum'))
+
+    def test_batch_window(self):
+        """Test packet in batch is processed when old enough."""
+        vlan = self.valve.dp.vlans[0x100]
+        self.assertFalse(self._rcv_host_packet(1))
+        self.assertIsNotNone(self.valves_manager.packet_in_batch_due_secs(self.mock_time(0)))
+        self.valves_manager.valve_packet_in_batches(self.mock_time(0))
+        self.assertEqual(0, vlan.hosts_count())
+        self.assertEqual(0, self.valves_manager.packet_in_batch_due_secs(self.mock_time(2)))
+        self.valves_manager.valve_packet_in_batches(self.mock_time(2))
+        self.assertIsNone(self.valves_manager.packet_in_batch_due_secs(self.mock_time(2)))
+        self.assertEqual(1, vlan.hosts_count())
+
+    def _packets_processed(self):
+        return self.get_prom('faucet_packet_in_secs_count')
+
+    def test_batch_dedupe(self):
+        """Test identical learn packets are processed once, but control plane packets are not."""
+        for _ in range(3):
+            self._rcv_host_packet(1)
+        self.assertEqual(1, self._packets_processed())
+        for _ in range(3):
+            self.rcv_packet(1, 0x100, {
+                'eth_src': self.P1_V100_MAC,
+                'eth_dst': mac.BROADCAST_STR,
+                'arp_code': arp.ARP_REQUEST,
+                'arp_source_ip': '10.0.0.1',
+                'arp_target_ip': '10.0.0.254'})
+        self.assertEqual(4, self._packets_processed())
+
+    def test_batch_disconnect(self):
+        """Test packet ins queued are discarded when the DP disconnects."""
+        vlan = self.valve.dp.vlans[0x100]
+        self.assertFalse(self._rcv_host_packet(1))
+        self.valves_manager.datapath_disconnect(self.valve)
+        self.assertIsNone(self.valves_manager.packet_in_batch_due_secs(self.mock_time(2)))
+        self.valves_manager.valve_packet_in_batches(self.mock_time(2))
+        self.assertEqual(0, vlan.hosts_count())
+
+
+class ValvePacketInClassRateLimitTestCase(ValveTestBases.ValveTestSmall):
+    """Test packet ins are rate limited per port and packet class."""
+
+    CONFIG = """
+dps:
+    s1:
+        ignore_learn_ins: 0
+        packetin_port_learn_pps: 2
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: 0x100
+            p2:
+                number: 2
+                native_vlan: 0x100
+""" % DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def _rcv_host_packet(self, port, host):
+        return self.rcv_packet(port, 0x100, {
+            'eth_src': '00:00:00:01:%02x:%02x' % (port, host),
+            'eth_dst': self.UNKNOWN_MAC,
+            'ipv4_src': '10.0.%u.%u' % (port, host),
+            'ipv4_dst': '10.0.0.99'})
+
+    def test_learn_rate_limit(self):
+        """Test learning packet ins dropped per port once over rate."""
+        vlan = self.valve.dp.vlans[0x100]
+        for host in range(3):
+            self._rcv_host_packet(1, host)
+        self.assertEqual(2, vlan.hosts_count())
+        self.assertEqual(
+            1, self.get_prom('of_dropped_packet_ins_total', labels={'packet_class': 'learn'}))
+        self._rcv_host_packet(2, 1)
+        self.assertEqual(3, vlan.hosts_count())
+        self.mock_time(1)
+        self._rcv_host_packet(1, 3)
+        self.assertEqual(4, vlan.hosts_count())
+
+
+class ValveDiffColdStartTestCase(ValveTestBases.ValveTestSmall):
+    """Test diff cold start changes only flows that differ."""
+
+    CONFIG = """
+dps:
+    s1:
+        diff_cold_start: True
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: 0x100
+            p2:
+                number: 2
+                native_vlan: 0x100
+""" % DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    @staticmethod
+    def _flow_stats(flowmods):
+        return [
+            parser.OFPFlowStats(
+                table_id=flowmod.table_id, duration_sec=0, duration_nsec=0,
+                priority=flowmod.priority, idle_timeout=flowmod.idle_timeout,
+                hard_timeout=flowmod.hard_timeout, flags=flowmod.flags,
+                cookie=flowmod.cookie, packet_count=0, byte_count=0,
+                match=flowmod.match, instructions=flowmod.instructions)
+            for flowmod in flowmods]
+
+    @staticmethod
+    def _flowmods(ofmsgs):
+        return [ofmsg for ofmsg in ofmsgs if valve_of.is_flowmod(ofmsg)]
+
+    def _reconnect(self):
+        self.valve.datapath_disconnect()
+        ofmsgs = self.connect_dp()
+        self.assertFalse(self._flowmods(ofmsgs))
+        self.assertTrue([
+            ofmsg for ofmsg in ofmsgs if isinstance(ofmsg, parser.OFPFlowStatsRequest)])
+
+    def test_diff_cold_start(self):
+        """Test only missing, extra or changed flows are sent."""
+        # DP had no flows, so all are added.
+        flowmods = self._flowmods(
+            self.valve.flow_stats_reply(self.mock_time(10), [], False))
+        self.assertTrue(flowmods)
+        self.assertFalse([flowmod for flowmod in flowmods if valve_of.is_flowdel(flowmod)])
+        # DP has all flows, so none changed.
+        self._reconnect()
+        self.assertFalse(self._flowmods(self.valve.flow_stats_reply(
+            self.mock_time(20), self._flow_stats(flowmods), False)))
+        # DP is missing a flow, and has an unexpected flow.
+        self._reconnect()
+        extra_flowmod = valve_of.flowmod(
+            cookie=self.valve.dp.cookie, command=ofp.OFPFC_ADD,
+            table_id=flowmods[0].table_id, priority=1, out_port=0, out_group=0,
+            match_fields=valve_of.match({'in_port': 99}), inst=[],
+            hard_timeout=0, idle_timeout=0)
+        flow_stats = self._flow_stats(flowmods[1:] + [extra_flowmod])
+        self.assertFalse(self.valve.flow_stats_reply(
+            self.mock_time(30), flow_stats[:1], True))
+        diff_flowmods = self._flowmods(self.valve.flow_stats_reply(
+            self.mock_time(30), flow_stats[1:], False))
+        self.assertEqual(2, len(diff_flowmods), msg=diff_flowmods)
+        flowdels = [flowmod for flowmod in diff_flowmods if valve_of.is_flowdel(flowmod)]
+        self.assertEqual(1, len(flowdels))
+        self.assertEqual(ofp.OFPFC_DELETE_STRICT, flowdels[0].command)
+        self.assertIn(str(flowmods[0]), [str(flowmod) for flowmod in diff_flowmods])
+
+    def test_flow_change_during_diff(self):
+        """Test flow changes while flows are requested are sent after the diff."""
+
+        class FakeRyuDp: # pylint: disable=too-few-public-methods
+            """Record messages sent to a datapath."""
+
+            def __init__(self):
+                self.sent = []
+
+            def send_msg(self, ofmsg):
+                """Record a sent message."""
+                self.sent.append(ofmsg)
+
+        flowmods = self._flowmods(
+            self.valve.flow_stats_reply(self.mock_time(10), [], False))
+        self._reconnect()
+        port_ofmsgs = self.valve.port_status_handler(
+            2, ofp.OFPPR_DELETE, ofp.OFPPS_LINK_DOWN, [])[self.valve]
+        port_flowmods = self._flowmods(port_ofmsgs)
+        self.assertTrue(port_flowmods)
+        ryu_dp = FakeRyuDp()
+        self.valve.send_flows(ryu_dp, port_ofmsgs)
+        self.assertFalse(self._flowmods(ryu_dp.sent))
+        ofmsgs = self.valve.flow_stats_reply(
+            self.mock_time(20), self._flow_stats(flowmods), False)
+        self.assertEqual(
+            [str(flowmod) for flowmod in port_flowmods],
+            [str(flowmod) for flowmod in self._flowmods(ofmsgs)])
+        self.valve.send_flows(ryu_dp, ofmsgs)
+        self.assertEqual(
+            sorted({str(flowmod) for flowmod in port_flowmods}),
+            sorted({str(flowmod) for flowmod in self._flowmods(ryu_dp.sent)}))
+
+    def test_flow_stats_timeout(self):
+        """Test all flows replaced if DP does not send flows."""
+        ofmsgs_by_valve = self.valve.fast_state_expire(
+            self.mock_time(self.valve.FLOW_DIFF_TIMEOUT + 1), [])
+        flowmods = self._flowmods(ofmsgs_by_valve[self.valve])
+        self.assertTrue([flowmod for flowmod in flowmods if valve_of.is_global_flowdel(flowmod)])
+        self.assertFalse(self.valve.flow_stats_reply(self.mock_time(30), [], False))
+
+
 class ValveOFErrorTestCase(ValveTestBases.ValveTestSmall):
     """Test decoding of OFErrors."""
 
@@ -220,6 +464,337 @@ vlans:
         self.verify_flooding(matches)
 
 
+class ValveSharedGroupTestCase(ValveTestBases.ValveTestSmall):
+    """Tests for VLANs sharing flood groups."""
+
+    CONFIG = """
+dps:
+    s1:
+%s
+        interfaces:
+            p1:
+                number: 1
+                tagged_vlans: [v100, v200]
+            p2:
+                number: 2
+                tagged_vlans: [v100, v200]
+            p3:
+                number: 3
+                tagged_vlans: [v100, v200]
+vlans:
+    v100:
+        vid: 0x100
+    v200:
+        vid: 0x200
+""" % GROUP_DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def test_shared_group(self):
+        """Test VLANs with the same flood ports share a group."""
+        groups = self.valve.dp.groups
+        self.assertEqual(1, len(groups.entries))
+        group = groups.shared_refs[(0x100, False)]
+        self.assertIs(group, groups.shared_refs[(0x200, False)])
+        self.assertEqual({(0x100, False), (0x100, True), (0x200, False), (0x200, True)}, group.refs)
+        for vid in (0x100, 0x200):
+            match = {'in_port': 1, 'vlan_vid': vid | ofp.OFPVID_PRESENT}
+            for port in (2, 3):
+                self.assertTrue(
+                    self.table.is_output(match, port=port, vid=vid),
+                    msg='not flooded to port %u on VLAN %u' % (port, vid))
+
+    def test_unchanged_group(self):
+        """Test no group messages if flood buckets unchanged."""
+        vlan = self.valve.dp.vlans[0x100]
+        ofmsgs = self.valve.flood_manager.update_vlan(vlan)
+        self.assertFalse([ofmsg for ofmsg in ofmsgs if valve_of.is_groupmod(ofmsg)])
+
+    def test_release_group(self):
+        """Test shared group deleted only when no VLAN uses it."""
+        group_id = self.valve.dp.groups.shared_refs[(0x100, False)].group_id
+        ofmsgs = self.valve.flood_manager.del_vlan(self.valve.dp.vlans[0x100])
+        self.assertFalse([ofmsg for ofmsg in ofmsgs if valve_of.is_groupdel(ofmsg)])
+        ofmsgs = self.valve.flood_manager.del_vlan(self.valve.dp.vlans[0x200])
+        self.assertEqual(
+            [group_id], [ofmsg.group_id for ofmsg in ofmsgs if valve_of.is_groupdel(ofmsg)])
+        self.assertFalse(self.valve.dp.groups.entries)
+
+
+class ValveMultipathRouteTestCase(ValveTestBases.ValveTestSmall):
+    """Tests for routes via more than one gateway."""
+
+    P2_V100_MAC = '00:00:00:01:00:02'
+    CONFIG = """
+dps:
+    s1:
+        multipath_routing: True
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: v100
+            p2:
+                number: 2
+                native_vlan: v100
+            p3:
+                number: 3
+                tagged_vlans: [v100]
+vlans:
+    v100:
+        vid: 0x100
+        faucet_vips: ['10.0.0.254/24']
+        routes:
+            - route:
+                ip_dst: 10.99.99.0/24
+                ip_gw: [10.0.0.1, 10.0.0.2]
+            - route:
+                ip_dst: 10.99.98.0/24
+                ip_gw: [10.0.0.2, 10.0.0.1]
+""" % BASE_DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def _resolve_gw(self, port, eth_src, ip_gw):
+        return self.rcv_packet(port, 0x100, {
+            'eth_src': eth_src,
+            'eth_dst': FAUCET_MAC,
+            'arp_code': arp.ARP_REPLY,
+            'arp_source_ip': ip_gw,
+            'arp_target_ip': '10.0.0.254'})
+
+    def _route_group(self):
+        vlan = self.valve.dp.vlans[0x100]
+        route_groups = vlan.dyn_route_groups_by_ipv[4]
+        self.assertEqual(1, len(route_groups))
+        return list(route_groups.values())[0]
+
+    def _routed_to(self, ipv4_dst, port):
+        match = {
+            'in_port': 3, 'vlan_vid': self.V100, 'eth_type': 0x800,
+            'eth_dst': FAUCET_MAC, 'ipv4_dst': ipv4_dst}
+        return self.table.is_output(match, port=port)
+
+    def test_multipath_route(self):
+        """Test routes with the same gateways share a select group with a bucket per gateway."""
+        self._resolve_gw(1, self.P1_V100_MAC, '10.0.0.1')
+        self._resolve_gw(2, self.P2_V100_MAC, '10.0.0.2')
+        route_group = self._route_group()
+        self.assertEqual(
+            {ipaddress.ip_network('10.99.99.0/24'), ipaddress.ip_network('10.99.98.0/24')},
+            route_group.ip_dsts)
+        self.assertEqual(valve_of.ofp.OFPGT_SELECT, route_group.entry.group_type)
+        self.assertEqual(2, len(route_group.entry.buckets))
+        for ipv4_dst in ('10.99.99.1', '10.99.98.1'):
+            for port in (1, 2):
+                self.assertTrue(
+                    self._routed_to(ipv4_dst, port),
+                    msg='%s not routed to port %u' % (ipv4_dst, port))
+
+    def test_nexthop_change(self):
+        """Test nexthop changes update only the group, not each route."""
+        self._resolve_gw(1, self.P1_V100_MAC, '10.0.0.1')
+        self._resolve_gw(2, self.P2_V100_MAC, '10.0.0.2')
+        route_manager = self.valve._route_manager_by_ipv[4] # pylint: disable=protected-access
+        fib_table_id = self.valve.dp.tables['ipv4_fib'].table_id
+        prefix_priority = route_manager.route_priority + 24
+        ofmsgs = self._resolve_gw(1, '00:00:00:01:00:03', '10.0.0.1')
+        self.assertEqual(1, len([ofmsg for ofmsg in ofmsgs if valve_of.is_groupmod(ofmsg)]))
+        self.assertFalse([
+            ofmsg for ofmsg in ofmsgs
+            if valve_of.is_flowmod(ofmsg) and ofmsg.table_id == fib_table_id and
+            ofmsg.priority == prefix_priority])
+        ofmsgs = route_manager.expire_port_nexthops(self.valve.dp.ports[2])
+        self.apply_ofmsgs(ofmsgs)
+        self.assertEqual(1, len(self._route_group().entry.buckets))
+        self.assertFalse(self._routed_to('10.99.99.1', 2))
+        self.assertTrue(self._routed_to('10.99.99.1', 1))
+
+    def test_all_nexthops_expired(self):
+        """Test route drops via an empty group when no nexthop is resolved."""
+        self._resolve_gw(1, self.P1_V100_MAC, '10.0.0.1')
+        self._resolve_gw(2, self.P2_V100_MAC, '10.0.0.2')
+        route_manager = self.valve._route_manager_by_ipv[4] # pylint: disable=protected-access
+        for port_no in (1, 2):
+            self.apply_ofmsgs(route_manager.expire_port_nexthops(self.valve.dp.ports[port_no]))
+        route_group = self._route_group()
+        self.assertEqual(0, len(route_group.entry.buckets))
+        self.assertIn(route_group.entry.group_id, self.valve.dp.groups.entries)
+        for port_no in (1, 2):
+            self.assertFalse(self._routed_to('10.99.99.1', port_no))
+
+    def test_warm_reload_vlan_change(self):
+        """Test groups of a changed VLAN are deleted on warm reload."""
+        self._resolve_gw(1, self.P1_V100_MAC, '10.0.0.1')
+        old_group_id = self._route_group().entry.group_id
+        self.update_config(
+            self.CONFIG.replace('        vid: 0x100\n', '        vid: 0x100\n        description: changed\n'),
+            reload_type='warm')
+        self.assertFalse(self.valve.dp.vlans[0x100].dyn_route_groups_by_ipv[4])
+        self.assertFalse([
+            group_id for group_id in self.valve.dp.groups.entries
+            if group_id >= valve_of.ROUTE_GROUP_OFFSET])
+        self.assertIn(old_group_id, [
+            ofmsg.group_id for ofmsg in self.last_flows_to_dp[self.DP_ID]
+            if valve_of.is_groupdel(ofmsg)])
+        self._resolve_gw(1, self.P1_V100_MAC, '10.0.0.1')
+        self.assertEqual(
+            [self._route_group().entry.group_id],
+            [group_id for group_id in self.valve.dp.groups.entries
+             if group_id >= valve_of.ROUTE_GROUP_OFFSET])
+
+    def test_del_route(self):
+        """Test group deleted when no route uses it."""
+        self._resolve_gw(1, self.P1_V100_MAC, '10.0.0.1')
+        group_id = self._route_group().entry.group_id
+        vlan = self.valve.dp.vlans[0x100]
+        self.valve.del_route(vlan, ipaddress.ip_network('10.99.99.0/24'))
+        ofmsgs = self.valve.del_route(vlan, ipaddress.ip_network('10.99.98.0/24'))
+        self.assertEqual(
+            [group_id], [ofmsg.group_id for ofmsg in ofmsgs if valve_of.is_groupdel(ofmsg)])
+        self.assertFalse(vlan.dyn_route_groups_by_ipv[4])
+
+
+class ValveResolveScheduleTestCase(ValveTestBases.ValveTestSmall):
+    """Tests for bounded gateway resolution per cycle."""
+
+    CONFIG = """
+dps:
+    s1:
+        max_hosts_per_resolve_cycle: 2
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: v100
+vlans:
+    v100:
+        vid: 0x100
+        faucet_vips: ['10.0.0.254/24']
+        routes:%s
+""" % (BASE_DP1_CONFIG, ''.join([
+    """
+            - route:
+                ip_dst: 10.99.%u.0/24
+                ip_gw: 10.0.0.%u""" % (i, i) for i in range(1, 6)]))
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def _resolving(self):
+        nexthop_cache = self.valve.dp.vlans[0x100].neigh_cache_by_ipv(4)
+        return len([entry for entry in nexthop_cache.values() if entry.last_retry_time is not None])
+
+    def _backlog(self):
+        self.valve.update_metrics(self.mock_time(0))
+        return self.get_prom(
+            'vlan_neighbor_resolve_backlog', labels={'vlan': str(0x100), 'ipv': '4'})
+
+    def test_resolve_cycle_limit(self):
+        """Test gateways due beyond the per cycle limit are resolved in later cycles."""
+        self.assertFalse(self.valve.resolve_gateways(self.mock_time(0), None))
+        self.assertEqual(0, self._resolving())
+        for resolving, backlog in ((2, 3), (4, 1), (5, 0)):
+            self.assertTrue(self.valve.resolve_gateways(self.mock_time(1), None))
+            self.assertEqual(resolving, self._resolving())
+            self.assertEqual(backlog, self._backlog())
+
+    def test_resolve_backlog_stale(self):
+        """Test superseded queued gateways are not counted in the resolve backlog."""
+        self.assertFalse(self.valve.resolve_gateways(self.mock_time(0), None))
+        vlan = self.valve.dp.vlans[0x100]
+        now = self.mock_time(1)
+        for ip_gw in list(vlan.neigh_cache_by_ipv(4)):
+            heapq.heappush(vlan.dyn_route_gw_resolve_queue[4], (now, 2**62, ip_gw))
+        self.assertTrue(self.valve.resolve_gateways(now, None))
+        self.assertEqual(2, self._resolving())
+        self.assertEqual(3, self._backlog())
+
+
+class ValveProactiveLearnScanTestCase(ValveTestBases.ValveTestSmall):
+    """Test proactive learning from one host sweeping a /16."""
+
+    SCAN_DSTS = 256
+    CONFIG = """
+dps:
+    s1:
+        dp_id: 1
+        hardware: 'GenericTFM'
+        ignore_learn_ins: 0
+        ofchannel_log: '/dev/null'
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: v100
+            p2:
+                number: 2
+                native_vlan: v100
+vlans:
+    v100:
+        vid: 0x100
+        faucet_vips: ['10.0.0.254/16']
+"""
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def _scan(self, dsts=None):
+        if dsts is None:
+            dsts = ['10.0.%u.%u' % (1 + i // 254, 1 + i % 254) for i in range(self.SCAN_DSTS)]
+        fib_table_id = self.valve.dp.tables['ipv4_fib'].table_id
+        fib_flowmods = 0
+        for dst in dsts:
+            ofmsgs = self.rcv_packet(1, 0x100, {
+                'eth_src': self.P1_V100_MAC,
+                'eth_dst': FAUCET_MAC,
+                'ipv4_src': '10.0.0.1',
+                'ipv4_dst': dst})
+            fib_flowmods += len([
+                ofmsg for ofmsg in ofmsgs
+                if valve_of.is_flowmod(ofmsg) and ofmsg.table_id == fib_table_id])
+        return fib_flowmods
+
+    def _cache_stat(self, stat):
+        return self.get_prom('proactive_learn_cache_%s' % stat, labels={'ipv': '4'})
+
+    def test_scan(self):
+        """Test source learned once, and destinations tried again not reinstalled."""
+        self.assertLessEqual(self.SCAN_DSTS, self._scan())
+        self.assertEqual(self.SCAN_DSTS + 1, self._cache_stat('misses'))
+        self.assertLessEqual(self.SCAN_DSTS - 1, self._cache_stat('hits'))
+        self.assertEqual(0, self._scan())
+        self.assertEqual(self.SCAN_DSTS + 1, self._cache_stat('misses'))
+
+    def test_non_ip_not_learned(self):
+        """Test ARP not for a VIP does not prevent learning the source from IP."""
+        self.rcv_packet(1, 0x100, {
+            'eth_src': self.P1_V100_MAC,
+            'eth_dst': mac.BROADCAST_STR,
+            'arp_code': arp.ARP_REQUEST,
+            'arp_source_ip': '10.0.0.1',
+            'arp_target_ip': '10.0.0.2'})
+        self.assertEqual(0, self._cache_stat('misses'))
+        self.assertLess(0, self._scan(['10.0.1.1']))
+        # Source and destination both learned from the IP packet.
+        self.assertEqual(2, self._cache_stat('misses'))
+        self.assertEqual(0, self._cache_stat('hits'))
+
+    @benchmark_test
+    def test_benchmark_scan(self):
+        """Benchmark one host sweeping the whole /16, then sweeping it again."""
+        dsts = [
+            str(dst) for dst in ipaddress.ip_network('10.0.0.0/16').hosts()
+            if str(dst) not in ('10.0.0.1', '10.0.0.254')]
+        for desc in ('first', 'repeat'):
+            benchmark('%s /16 sweep (%u destinations)' % (desc, len(dsts)),
+                      partial(self._scan, dsts))
+            self.valve.update_metrics(self.mock_time(0))
+            print('proactive learn cache hits %u misses %u' % (
+                self._cache_stat('hits'), self._cache_stat('misses')))
+
+
 class ValveIdleLearnTestCase(ValveTestBases.ValveTestSmall):
     """Smoke test for idle-flow based learning. This feature is not currently reliable."""
 
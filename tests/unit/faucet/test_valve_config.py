@@ -17,12 +17,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 from functools import partial
 import hashlib
+import logging
 import unittest
 from ryu.ofproto import ofproto_v1_3 as ofp
 from faucet import config_parser_util
-from valve_test_lib import CONFIG, DP1_CONFIG, FAUCET_MAC, ValveTestBases
+from faucet.conf import Conf
+from faucet.config_parser import dp_preparsed_parser
+from valve_test_lib import (
+    CONFIG, DP1_CONFIG, FAUCET_MAC, ValveTestBases, benchmark, benchmark_test)
 
 
 class ValveIncludeTestCase(ValveTestBases.ValveTestSmall):
@@ -778,6 +783,111 @@ dps:
         self.assertLessEqual(total_tt_prop, 50, msg=pstats_text)
 
 
+class ValveGetConfigChangesCacheTestCase(ValveTestBases.ValveTestSmall):
+    """Test config change detection on a large config reuses cached keys."""
+
+    PORTS = 96
+
+    CONFIG = """
+acls:
+%s
+dps:
+    s1:
+%s
+        interfaces:
+%s
+""" % (''.join(["""
+    acl%u:
+        - rule:
+            dl_type: 0x800
+            ipv4_dst: 10.0.%u.0/24
+            actions:
+                allow: 0
+        - rule:
+            actions:
+                allow: 1
+""" % (i, i) for i in range(1, PORTS + 1)]), DP1_CONFIG, ''.join(["""
+            p%u:
+                number: %u
+                native_vlan: %u
+                acls_in: [acl%u]
+""" % (i, i, 0x100 + (i % 8), i) for i in range(1, PORTS + 1)]))
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    @staticmethod
+    def _uncache_hashes(dp):
+        for conf in [dp] + list(dp.ports.values()) + list(
+                dp.vlans.values()) + list(dp.acls.values()):
+            conf.dyn_hash = None
+            conf.dyn_conf_keys_cache = None
+
+    def _changed_top_conf(self):
+        top_conf = self.valves_manager.meta_dp_state.top_conf
+        new_top_conf = copy.deepcopy(top_conf)
+        new_top_conf['dps']['s1']['interfaces']['p1']['description'] = 'changed'
+        return new_top_conf
+
+    def test_get_config_changes_cached(self):
+        """Test config change detection computes config keys only once."""
+        old_dp = self.valve.dp
+        new_dp = dp_preparsed_parser(self._changed_top_conf(), None)[0]
+        logger = logging.getLogger('test')
+
+        def get_changes():
+            return old_dp.get_config_changes(logger, new_dp)
+
+        conf_keys = Conf._conf_keys # pylint: disable=protected-access
+        conf_keys_calls = []
+
+        def counted_conf_keys(*args, **kwargs):
+            conf_keys_calls.append(args[0])
+            return conf_keys(*args, **kwargs)
+
+        self._uncache_hashes(old_dp)
+        self._uncache_hashes(new_dp)
+        Conf._conf_keys = staticmethod(counted_conf_keys) # pylint: disable=protected-access
+        try:
+            changes = get_changes()
+            uncached_calls = len(conf_keys_calls)
+            del conf_keys_calls[:]
+            cached_changes = get_changes()
+        finally:
+            Conf._conf_keys = staticmethod(conf_keys) # pylint: disable=protected-access
+        _, changed_ports, _, _, _, all_ports_changed = changes
+        self.assertEqual({1}, changed_ports)
+        self.assertFalse(all_ports_changed)
+        self.assertEqual(changes, cached_changes)
+        self.assertTrue(uncached_calls)
+        self.assertFalse(conf_keys_calls)
+        self.assertTrue(old_dp.ports[1].dyn_conf_keys_cache)
+        self.assertTrue(new_dp.ports[1].dyn_conf_keys_cache)
+
+    @benchmark_test
+    def test_get_config_changes_benchmark(self):
+        """Benchmark DP parsing, and config change detection with and without cached hashes."""
+        new_top_conf = self._changed_top_conf()
+        old_dp = self.valve.dp
+        new_dp = dp_preparsed_parser(new_top_conf, None)[0]
+        logger = logging.getLogger('test')
+
+        def get_changes():
+            return old_dp.get_config_changes(logger, new_dp)
+
+        def get_changes_uncached():
+            self._uncache_hashes(old_dp)
+            self._uncache_hashes(new_dp)
+            return get_changes()
+
+        count = 5
+        benchmark(
+            'parse DP with %u ports' % self.PORTS,
+            partial(dp_preparsed_parser, new_top_conf, None), count)
+        benchmark('uncached config changes', get_changes_uncached, count)
+        benchmark('cached config changes', get_changes, count)
+
+
 class ValveTestConfigHash(ValveTestBases.ValveTestSmall):
     """Verify faucet_config_hash_info update after config change"""
 
@@ -938,6 +1048,45 @@ dps:
         self.assertEqual(self.get_prom('faucet_config_applied', bare=True), 1.0)
 
 
+class ValveTestConfigReuseDP(ValveTestBases.ValveTestSmall):
+    """Test unchanged DPs are not reparsed on reload."""
+
+    CONFIG = """
+dps:
+    s1:
+        dp_id: 0x1
+        hardware: 'GenericTFM'
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: 0x100
+    s2:
+        dp_id: 0x2
+        hardware: 'GenericTFM'
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: 0x100
+"""
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def test_reuse_unchanged_dp(self):
+        """Test only the changed DP is reparsed."""
+        dp1 = self.valves_manager.valves[0x1].dp
+        dp2 = self.valves_manager.valves[0x2].dp
+        # Add a port to s2 only.
+        self.update_config(self.CONFIG + """
+            p2:
+                number: 2
+                native_vlan: 0x100
+""", reload_expected=False)
+        self.assertIs(dp1, self.valves_manager.valves[0x1].dp)
+        self.assertIsNot(dp2, self.valves_manager.valves[0x2].dp)
+        self.assertEqual(2, len(self.valves_manager.valves[0x2].dp.ports))
+
+
 class ValveReloadConfigTestCase(ValveTestBases.ValveTestBig):
     """Repeats the tests after a config reload."""
 
@@ -22,6 +22,7 @@ import unittest
 
 from faucet import valve_of
 
+from valve_test_lib import DP1_CONFIG, ValveTestBases, benchmark, benchmark_test
 
 
 class ValveOfTestCase(unittest.TestCase): # pytype: disable=module-attr
@@ -59,6 +60,62 @@ class ValveOfTestCase(unittest.TestCase): # pytype: disable=module-attr
         # with regular flow last
         self.assertEqual(str(flow), reordered_str[-1], msg=reordered)
 
+    def test_dedupe_flowmods(self):
+        """Test equal flowmods are deduplicated, and unequal are not."""
+        def _flowmod(port, priority=1):
+            return valve_of.flowmod(
+                cookie=0, hard_timeout=0, idle_timeout=0, match_fields=valve_of.match({'in_port': 1}),
+                out_port=valve_of.ofp.OFPP_ANY, table_id=1,
+                inst=[valve_of.apply_actions([valve_of.output_port(port)])], priority=priority,
+                command=valve_of.ofp.OFPFC_ADD, out_group=valve_of.ofp.OFPG_ANY)
+        flows = [_flowmod(2), _flowmod(2), _flowmod(3), _flowmod(2, priority=2)]
+        deduped = valve_of.dedupe_ofmsgs(flows)
+        self.assertEqual(
+            sorted({str(flow) for flow in flows}), sorted([str(flow) for flow in deduped]))
+
+
+class ValveOfDedupeColdStartTestCase(ValveTestBases.ValveTestSmall):
+    """Test deduplication of cold start flows."""
+
+    CONFIG = """
+dps:
+    s1:
+%s
+        interfaces:
+""" % DP1_CONFIG + ''.join(["""
+            p%u:
+                number: %u
+                native_vlan: 0x100
+""" % (i, i) for i in range(1, 49)])
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def test_dedupe_cold_start(self):
+        """Test deduplicating cold start flows by key is the same as by string."""
+        flows = self.valve.datapath_connect(self.mock_time(10), set(self.valve.dp.ports.keys()))
+        flows = flows + flows
+        str_deduped = list({str(flow): flow for flow in flows}.values())
+        self.assertEqual(
+            [str(flow) for flow in str_deduped],
+            [str(flow) for flow in valve_of.dedupe_ofmsgs(flows)])
+        self.assertEqual(
+            sorted([str(flow) for flow in valve_of.valve_flowreorder(str_deduped)]),
+            sorted([str(flow) for flow in valve_of.valve_flowreorder(flows)]))
+
+    @benchmark_test
+    def test_dedupe_cold_start_benchmark(self):
+        """Benchmark reordering cold start flows against deduplicating by string."""
+        flows = self.valve.datapath_connect(self.mock_time(10), set(self.valve.dp.ports.keys()))
+        flows = flows + flows
+        count = 5
+        benchmark(
+            'dedupe %u flows by string' % len(flows),
+            lambda: list({str(flow): flow for flow in flows}.values()), count)
+        benchmark(
+            'reorder %u flows' % len(flows),
+            lambda: valve_of.valve_flowreorder(flows), count)
+
 
 if __name__ == "__main__":
     unittest.main() # pytype: disable=module-attr
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""Test FAUCET valve_packet."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Innovation Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from faucet import valve_packet
+
+from valve_test_lib import benchmark, benchmark_test, build_pkt
+
+
+class ValvePacketTestCase(unittest.TestCase): # pytype: disable=module-attr
+    """Test valve_packet functions."""
+
+    ETH_SRC = '0e:00:00:00:00:aa'
+    ETH_DST = '0e:00:00:00:00:bb'
+
+    def _ipv4_pkt(self, vid=None):
+        pkt = {
+            'eth_src': self.ETH_SRC,
+            'eth_dst': self.ETH_DST,
+            'ipv4_src': '10.0.0.1',
+            'ipv4_dst': '10.0.0.2'}
+        if vid is not None:
+            pkt['vid'] = vid
+        return build_pkt(pkt).data
+
+    def _parse_header_slow(self, data):
+        _, eth_pkt, eth_type, _, vlan_vid = valve_packet.parse_packet_in_pkt(
+            data, max_len=valve_packet.ETH_VLAN_HEADER_SIZE)
+        return (eth_pkt.src, eth_pkt.dst, eth_type, vlan_vid)
+
+    def test_parse_header(self):
+        """Test header only parsing is the same as full parsing."""
+        for vid in (None, 0x100, 0xfff):
+            data = self._ipv4_pkt(vid)
+            self.assertEqual(
+                self._parse_header_slow(data),
+                valve_packet.parse_packet_in_header(data))
+
+    def test_parse_header_short(self):
+        """Test header only parsing rejects truncated headers."""
+        self.assertEqual(
+            (None, None, None, None), valve_packet.parse_packet_in_header(b'1234'))
+        data = self._ipv4_pkt(0x100)[:valve_packet.ETH_VLAN_HEADER_SIZE - 1]
+        self.assertEqual(
+            (None, None, None, None), valve_packet.parse_packet_in_header(data))
+
+    @benchmark_test
+    def test_parse_header_benchmark(self):
+        """Benchmark header only parsing against full parsing."""
+        data = self._ipv4_pkt(0x100)
+        count = 10000
+        benchmark('full parse', lambda: self._parse_header_slow(data), count)
+        benchmark(
+            'header parse', lambda: valve_packet.parse_packet_in_header(data), count)
+
+
+if __name__ == "__main__":
+    unittest.main() # pytype: disable=module-attr
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""Test FAUCET valve_packet_in."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Innovation Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import namedtuple
+import unittest
+
+from faucet import valve_of
+from faucet import valve_packet_in
+from faucet.valve_packet_in import ValvePacketInLimiter
+
+
+FAUCET_MAC = '0e:00:00:00:00:01'
+HOST_MAC = '0e:00:00:00:00:02'
+FakeVLAN = namedtuple('FakeVLAN', ('faucet_vips', 'faucet_mac'))
+FakePacketMeta = namedtuple('FakePacketMeta', ('vlan', 'eth_type', 'eth_dst'))
+
+
+class ValvePacketInClassTestCase(unittest.TestCase): # pytype: disable=module-attr
+    """Test packet in classification."""
+
+    VLAN = FakeVLAN(['10.0.0.254/24'], FAUCET_MAC)
+
+    def _class(self, eth_type, eth_dst, vlan=VLAN):
+        return valve_packet_in.packet_in_class(FakePacketMeta(vlan, eth_type, eth_dst))
+
+    def test_keepalives(self):
+        """Test LACP and LLDP classified as keepalives."""
+        self.assertEqual(
+            valve_packet_in.LACP, self._class(valve_of.ether.ETH_TYPE_SLOW, HOST_MAC))
+        self.assertEqual(
+            valve_packet_in.LLDP, self._class(valve_of.ether.ETH_TYPE_LLDP, HOST_MAC, None))
+
+    def test_control_plane(self):
+        """Test packets for FAUCET VIPs classified as control plane."""
+        self.assertEqual(
+            valve_packet_in.CONTROL_PLANE,
+            self._class(valve_of.ether.ETH_TYPE_ARP, 'ff:ff:ff:ff:ff:ff'))
+        self.assertEqual(
+            valve_packet_in.CONTROL_PLANE,
+            self._class(valve_of.ether.ETH_TYPE_IP, FAUCET_MAC))
+
+    def test_learn(self):
+        """Test other packets classified as learning."""
+        self.assertEqual(
+            valve_packet_in.LEARN, self._class(valve_of.ether.ETH_TYPE_IP, HOST_MAC))
+        self.assertEqual(
+            valve_packet_in.LEARN,
+            self._class(valve_of.ether.ETH_TYPE_ARP, FAUCET_MAC, FakeVLAN([], FAUCET_MAC)))
+
+
+class ValvePacketInLimiterTestCase(unittest.TestCase): # pytype: disable=module-attr
+    """Test ValvePacketInLimiter."""
+
+    LEARN_PPS = 4
+
+    def setUp(self):
+        self.limiter = ValvePacketInLimiter({
+            valve_packet_in.LEARN: self.LEARN_PPS,
+            valve_packet_in.LACP: 1})
+
+    def _allowed(self, now, port_no, pkt_class, count):
+        return sum(self.limiter.allow(now, port_no, pkt_class) for _ in range(count))
+
+    def test_rate(self):
+        """Test at most one second's worth of packets allowed, then refilled."""
+        self.assertEqual(self.LEARN_PPS, self._allowed(1, 1, valve_packet_in.LEARN, 10))
+        self.assertEqual(0, self._allowed(1, 1, valve_packet_in.LEARN, 1))
+        self.assertEqual(self.LEARN_PPS / 2, self._allowed(1.5, 1, valve_packet_in.LEARN, 10))
+        self.assertEqual(self.LEARN_PPS, self._allowed(10, 1, valve_packet_in.LEARN, 10))
+
+    def test_per_port(self):
+        """Test ports have independent buckets."""
+        self.assertEqual(self.LEARN_PPS, self._allowed(1, 1, valve_packet_in.LEARN, 10))
+        self.assertEqual(self.LEARN_PPS, self._allowed(1, 2, valve_packet_in.LEARN, 10))
+
+    def test_unlimited(self):
+        """Test keepalives and classes without a rate never limited."""
+        self.assertEqual(10, self._allowed(1, 1, valve_packet_in.LACP, 10))
+        self.assertEqual(10, self._allowed(1, 1, valve_packet_in.CONTROL_PLANE, 10))
+
+    def test_reset(self):
+        """Test reset refills all buckets."""
+        self._allowed(1, 1, valve_packet_in.LEARN, 10)
+        self.limiter.reset()
+        self.assertEqual(self.LEARN_PPS, self._allowed(1, 1, valve_packet_in.LEARN, 10))
+
+
+if __name__ == "__main__":
+    unittest.main() # pytype: disable=module-attr
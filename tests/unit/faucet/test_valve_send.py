@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Test FAUCET valve_send."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Innovation Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from faucet import valve_of
+from faucet.valve_send import ValveSendQueue
+
+
+class FakeRyuDp: # pylint: disable=too-few-public-methods
+    """Record messages sent to a datapath."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_msg(self, ofmsg):
+        """Record a sent message."""
+        self.sent.append(ofmsg)
+
+
+class ValveSendQueueTestCase(unittest.TestCase): # pytype: disable=module-attr
+    """Test ValveSendQueue."""
+
+    WINDOW = 4
+    BARRIER_TIMEOUT = 10
+
+    def setUp(self):
+        self.ryu_dp = FakeRyuDp()
+        self.send_queue = ValveSendQueue(self.WINDOW, self.BARRIER_TIMEOUT)
+
+    @staticmethod
+    def _ofmsgs(count):
+        return [valve_of.groupdel(group_id=group_id) for group_id in range(1, count + 1)]
+
+    def _sent_ofmsgs(self):
+        return [ofmsg for ofmsg in self.ryu_dp.sent if not valve_of.is_barrier(ofmsg)]
+
+    def test_window(self):
+        """Test no more than window messages sent before a barrier reply."""
+        ofmsgs = self._ofmsgs(10)
+        self.assertIsNone(self.send_queue.send(1, self.ryu_dp, ofmsgs))
+        self.assertEqual(ofmsgs[:self.WINDOW], self._sent_ofmsgs())
+        self.assertTrue(valve_of.is_barrier(self.ryu_dp.sent[-1]))
+        self.assertEqual(6, self.send_queue.depth())
+        self.assertIsNone(self.send_queue.barrier_reply(2))
+        self.assertEqual(ofmsgs[:self.WINDOW * 2], self._sent_ofmsgs())
+        self.assertEqual(2, self.send_queue.barrier_reply(3))
+        self.assertEqual(ofmsgs, self._sent_ofmsgs())
+        self.assertEqual(0, self.send_queue.depth())
+
+    def test_no_window(self):
+        """Test all messages sent without barriers if no window."""
+        self.send_queue.window = 0
+        ofmsgs = self._ofmsgs(10)
+        self.assertEqual(0, self.send_queue.send(1, self.ryu_dp, ofmsgs))
+        self.assertEqual(ofmsgs, self.ryu_dp.sent)
+
+    def test_packetout_priority(self):
+        """Test packet outs are sent ahead of queued messages."""
+        ofmsgs = self._ofmsgs(10)
+        self.send_queue.send(1, self.ryu_dp, ofmsgs)
+        packetout = valve_of.packetout(1, b'')
+        self.send_queue.send(1, self.ryu_dp, [packetout])
+        self.assertEqual(packetout, self.ryu_dp.sent[-1])
+        self.assertEqual(6, self.send_queue.depth())
+
+    def test_barrier_timeout(self):
+        """Test sending resumes if the datapath does not reply to barriers."""
+        self.send_queue.send(1, self.ryu_dp, self._ofmsgs(10))
+        self.assertEqual((False, None), self.send_queue.expire_barriers(2))
+        expired, _ = self.send_queue.expire_barriers(2 + self.BARRIER_TIMEOUT)
+        self.assertTrue(expired)
+        self.assertEqual(self.WINDOW * 2, len(self._sent_ofmsgs()))
+
+    def test_reconnect(self):
+        """Test queue discarded when datapath reconnects."""
+        self.send_queue.send(1, self.ryu_dp, self._ofmsgs(10))
+        new_ryu_dp = FakeRyuDp()
+        self.send_queue.send(2, new_ryu_dp, self._ofmsgs(2))
+        self.assertEqual(0, self.send_queue.depth())
+        self.assertEqual(2, len(new_ryu_dp.sent))
+
+
+if __name__ == "__main__":
+    unittest.main() # pytype: disable=module-attr
@@ -20,14 +20,18 @@
 from functools import partial
 import unittest
 
+import networkx
+
 from ryu.lib import mac
 from ryu.ofproto import ofproto_v1_3 as ofp
 
 from faucet import valves_manager
+from faucet.conf import InvalidConfigError
 from faucet import valve_of
 
 from valve_test_lib import (
-    BASE_DP1_CONFIG, CONFIG, STACK_CONFIG, STACK_LOOP_CONFIG, ValveTestBases)
+    BASE_DP1_CONFIG, CONFIG, STACK_CONFIG, STACK_LOOP_CONFIG, ValveTestBases,
+    benchmark, benchmark_test)
 
 
 class ValveStackRootExtLoopProtectTestCase(ValveTestBases.ValveTestSmall):
@@ -262,6 +266,36 @@ dps:
     def test_nonstack_dp_port(self):
         self.assertEqual(None, self.valves_manager.valves[0x3].dp.shortest_path_port('s1'))
 
+    def test_dp_shards(self):
+        """Test stacked DPs are in the same shard."""
+        dps = [valve.dp for valve in self.valves_manager.valves.values()]
+        by_shard = valves_manager.dp_shards(dps, 3)
+        self.assertEqual({0x1, 0x2}, {dp.dp_id for dp in by_shard[1]})
+        self.assertEqual({0x3}, {dp.dp_id for dp in by_shard[0]})
+        self.assertFalse(by_shard[2])
+
+    def test_dp_shard_move(self):
+        """Test config moving a DP to another shard is rejected."""
+        dps = [valve.dp for valve in self.valves_manager.valves.values()]
+        self.valves_manager.shards = 3
+        self.valves_manager.dp_shard_by_id = {0x1: 1, 0x2: 1, 0x3: 1}
+        with self.assertRaises(InvalidConfigError):
+            self.valves_manager._check_dp_shards(dps) # pylint: disable=protected-access
+        self.valves_manager.dp_shard_by_id = valves_manager.dp_shard_by_id(dps, 3)
+        self.valves_manager._check_dp_shards(dps) # pylint: disable=protected-access
+
+    def test_dp_wrong_shard(self):
+        """Test connection from a DP controlled by another shard is detected."""
+        dps = [valve.dp for valve in self.valves_manager.valves.values()]
+        self.valves_manager.shards = 3
+        self.valves_manager.dp_shard_by_id = valves_manager.dp_shard_by_id(dps, 3)
+        self.assertTrue(self.valves_manager.datapath_wrong_shard(0x1))
+        self.assertFalse(self.valves_manager.datapath_wrong_shard(0x3))
+        self.assertFalse(self.valves_manager.datapath_wrong_shard(0x99))
+        self.assertEqual(1, self.get_prom(
+            'of_dp_wrong_shard_connections_total',
+            labels={'dp_id': hex(0x1), 'shard': '1'}, bare=True))
+
 
 class ValveStackRedundancyTestCase(ValveTestBases.ValveTestSmall):
     """Valve test for root selection."""
@@ -529,6 +563,148 @@ class ValveStackGraphBreakTestCase(ValveTestBases.ValveTestSmall):
         self.validate_flooding(True)
 
 
+class ValveStackFloodRulesChangedTestCase(ValveTestBases.ValveTestSmall):
+    """Test only changed flood rules are sent on stack topology changes."""
+
+    CONFIG = STACK_LOOP_CONFIG
+
+    def setUp(self):
+        self.setup_valve(self.CONFIG)
+
+    def _flood_rules_changed(self):
+        return self.get_prom('stack_flood_rules_changed_sum')
+
+    def test_changed_flood_rules(self):
+        """Test flood rules sent only for changed stack state."""
+        self.activate_all_ports()
+        # Nothing changed since flood rules were last built.
+        self.assertEqual([], self.valve.changed_stack_flood_rules())
+        all_flood_rules = []
+        for vlan in self.valve.dp.vlans.values():
+            all_flood_rules.extend(self.valve.flood_manager.build_flood_rules(vlan))
+        before_rules_changed = self._flood_rules_changed()
+        # Deactivate link between the two other switches, not the one under test.
+        other_dp = self.valves_manager.valves[2].dp
+        self.deactivate_stack_port(other_dp.ports[2])
+        rules_changed = self._flood_rules_changed() - before_rules_changed
+        self.assertGreater(rules_changed, 0)
+        self.assertLess(rules_changed, len(all_flood_rules))
+
+
+class ValveStackShortestPathBenchmark(ValveTestBases.ValveTestSmall):
+    """Benchmark shortest paths in a 32 DP, three tier stack."""
+
+    # Two roots, each connected to every aggregation DP, and
+    # edge DPs connected to two adjacent aggregation DPs.
+    ROOT_DPS = 2
+    AGG_DPS = 8
+    EDGE_DPS = 22
+
+    @classmethod
+    def _stack_config(cls):
+        dp_names = ['s%u' % i for i in range(1, cls.ROOT_DPS + cls.AGG_DPS + cls.EDGE_DPS + 1)]
+        root_dps = dp_names[:cls.ROOT_DPS]
+        agg_dps = dp_names[cls.ROOT_DPS:cls.ROOT_DPS + cls.AGG_DPS]
+        edge_dps = dp_names[cls.ROOT_DPS + cls.AGG_DPS:]
+        links = [(root_dp, agg_dp) for root_dp in root_dps for agg_dp in agg_dps]
+        for i, edge_dp in enumerate(edge_dps):
+            for agg_offset in (0, 1):
+                links.append((agg_dps[(i + agg_offset) % cls.AGG_DPS], edge_dp))
+        interfaces = {dp_name: ["""
+            1:
+                native_vlan: 100
+"""] for dp_name in dp_names}
+
+        def add_stack_port(dp_name, peer_dp_name, peer_port):
+            port = len(interfaces[dp_name]) + 1
+            interfaces[dp_name].append("""
+            %u:
+                stack:
+                    dp: %s
+                    port: %u
+""" % (port, peer_dp_name, peer_port))
+
+        for dp_a, dp_z in links:
+            port_a = len(interfaces[dp_a]) + 1
+            port_z = len(interfaces[dp_z]) + 1
+            add_stack_port(dp_a, dp_z, port_z)
+            add_stack_port(dp_z, dp_a, port_a)
+        config = 'dps:\n'
+        for dp_id, dp_name in enumerate(dp_names, start=1):
+            config += """
+    %s:
+        dp_id: %u
+        hardware: 'GenericTFM'
+""" % (dp_name, dp_id)
+            if dp_name in root_dps:
+                config += """
+        stack:
+            priority: %u
+""" % (root_dps.index(dp_name) + 1)
+            config += """
+        interfaces:
+%s""" % ''.join(interfaces[dp_name])
+        return config
+
+    def setUp(self):
+        self.setup_valve(self._stack_config())
+
+    def test_shortest_path_cache(self):
+        """Test shortest paths are cached, and match paths computed by networkx."""
+        dp = self.valve.dp
+        graph = dp.stack['graph']
+        dp_names = sorted(graph.nodes())
+        self.assertEqual(self.ROOT_DPS + self.AGG_DPS + self.EDGE_DPS, len(dp_names))
+        self.assertEqual(3, dp.stack_longest_path_to_root_len())
+        uncached_paths = [
+            sorted(networkx.all_shortest_paths(graph, src_dp, dest_dp))[0]
+            for src_dp in dp_names for dest_dp in dp_names]
+        cached_paths = [
+            dp.shortest_path(dest_dp, src_dp=src_dp)
+            for src_dp in dp_names for dest_dp in dp_names]
+        self.assertEqual(uncached_paths, cached_paths)
+        self.assertEqual(len(dp_names), len(graph.graph['stack_routes']))
+        self.assertEqual(len(dp_names) ** 2, len(graph.graph['stack_paths']))
+        edge_dp = self.valves_manager.valves[11].dp
+        agg_port = [port for port in edge_dp.stack_ports if port.stack['dp'].name == 's3'][0]
+        dp.remove_stack_link(graph, edge_dp, agg_port)
+        self.assertFalse(graph.graph.get('stack_routes', None))
+        self.assertFalse(graph.graph.get('stack_paths', None))
+
+    @benchmark_test
+    def test_shortest_path_benchmark(self):
+        """Benchmark cached shortest paths against computing paths each time."""
+        dp = self.valve.dp
+        graph = dp.stack['graph']
+        dp_names = sorted(graph.nodes())
+
+        def uncached_paths():
+            return [
+                sorted(networkx.all_shortest_paths(graph, src_dp, dest_dp))[0]
+                for src_dp in dp_names for dest_dp in dp_names]
+
+        def cached_paths():
+            return [
+                dp.shortest_path(dest_dp, src_dp=src_dp)
+                for src_dp in dp_names for dest_dp in dp_names]
+
+        count = 5
+        benchmark('uncached paths for %u DPs' % len(dp_names), uncached_paths, count)
+        benchmark('cached paths for %u DPs' % len(dp_names), cached_paths, count)
+
+    def test_stack_link_change(self):
+        """Test shortest paths are recomputed when stack links change."""
+        dp = self.valve.dp
+        graph = dp.stack['graph']
+        edge_dp = self.valves_manager.valves[11].dp
+        self.assertEqual(['s11', 's3', 's1'], dp.shortest_path('s1', src_dp='s11'))
+        agg_port = [port for port in edge_dp.stack_ports if port.stack['dp'].name == 's3'][0]
+        dp.remove_stack_link(graph, edge_dp, agg_port)
+        self.assertEqual(['s11', 's4', 's1'], dp.shortest_path('s1', src_dp='s11'))
+        dp.add_stack_link(graph, edge_dp, agg_port)
+        self.assertEqual(['s11', 's3', 's1'], dp.shortest_path('s1', src_dp='s11'))
+
+
 class ValveTestIPV4StackedRouting(ValveTestBases.ValveTestStackedRouting):
     """Test inter-vlan routing with stacking capabilities in an IPV4 network"""
 
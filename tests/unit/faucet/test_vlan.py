@@ -1,6 +1,9 @@
 """Unit tests for VLAN"""
 
+import random
+import tracemalloc
 import unittest
+from collections import namedtuple
 from ipaddress import ip_address, ip_network, ip_interface
 
 from faucet.vlan import VLAN
@@ -230,6 +233,155 @@ class FaucetVLANMethodTest(unittest.TestCase):
             ip_network('fc00::30:0/112'): ip_address('fc00::1:99')
         })
 
+    def test_route_gateway_index(self):
+        """Tests routes are indexed by gateway, including when a route changes gateway"""
+
+        vlan = VLAN(1, 1, {})
+        ip_gw1 = ip_address('10.0.0.1')
+        ip_gw2 = ip_address('10.0.0.2')
+        host_route = ip_network('10.0.0.2/32')
+        vlan.add_route(ip_network('10.99.99.0/24'), ip_gw1)
+        vlan.add_route(ip_network('10.99.98.0/24'), ip_gw1)
+        vlan.add_route(host_route, ip_gw2)
+        self.assertEqual(
+            {ip_network('10.99.99.0/24'), ip_network('10.99.98.0/24')},
+            set(vlan.ip_dsts_for_ip_gw(ip_gw1)))
+        self.assertTrue(vlan.is_host_fib_route(ip_gw2))
+        self.assertIn(ip_gw2, vlan.dyn_host_gws_by_ipv[4])
+        vlan.add_route(ip_network('10.99.99.0/24'), ip_gw2)
+        self.assertEqual([ip_network('10.99.98.0/24')], vlan.ip_dsts_for_ip_gw(ip_gw1))
+        self.assertFalse(vlan.is_host_fib_route(ip_gw2))
+        self.assertIn(ip_gw2, vlan.dyn_route_gws_by_ipv[4])
+        vlan.del_route(ip_network('10.99.98.0/24'))
+        self.assertFalse(vlan.is_ip_gw(ip_gw1))
+        self.assertEqual(frozenset([ip_gw2]), vlan.all_ip_gws(4))
+
+    def test_multipath_route(self):
+        """Tests a route via several gateways is indexed by each gateway"""
+
+        vlan = VLAN(1, 1, {})
+        ip_dst = ip_network('10.99.99.0/24')
+        ip_gws = frozenset([ip_address('10.0.0.2'), ip_address('10.0.0.1')])
+        vlan.add_multipath_route(ip_dst, ip_gws)
+        self.assertEqual(ip_gws, vlan.route_gws(ip_dst))
+        self.assertEqual({ip_dst: ip_address('10.0.0.1')}, vlan.routes_by_ipv(4))
+        for ip_gw in ip_gws:
+            self.assertEqual([ip_dst], vlan.ip_dsts_for_ip_gw(ip_gw))
+            self.assertIn(ip_gw, vlan.dyn_route_gws_by_ipv[4])
+        vlan.add_route(ip_dst, ip_address('10.0.0.2'))
+        self.assertEqual(frozenset([ip_address('10.0.0.2')]), vlan.route_gws(ip_dst))
+        self.assertFalse(vlan.is_ip_gw(ip_address('10.0.0.1')))
+        vlan.del_route(ip_dst)
+        self.assertFalse(vlan.route_gws(ip_dst))
+        self.assertFalse(vlan.is_ip_gw(ip_address('10.0.0.2')))
+
+    def test_route_scale(self):
+        """Tests adding routes via one gateway does not copy the gateway's routes"""
+
+        vlan = VLAN(1, 1, {})
+        ip_gw = ip_address('10.0.0.1')
+        calls = {'ip_dsts_for_ip_gw': 0, '_update_gw_types': 0}
+
+        def count_calls(method_name):
+            method = getattr(vlan, method_name)
+
+            def counted(*args):
+                calls[method_name] += 1
+                return method(*args)
+
+            setattr(vlan, method_name, counted)
+
+        for method_name in calls:
+            count_calls(method_name)
+        count = 1000
+        for i in range(count):
+            vlan.add_route(ip_network((0x0b000000 + (i << 8), 24)), ip_gw)
+        # One constant time gateway type update per route, without copying destinations.
+        self.assertEqual({'ip_dsts_for_ip_gw': 0, '_update_gw_types': count}, calls)
+        self.assertEqual(count, len(vlan.ip_dsts_for_ip_gw(ip_gw)))
+
+
+class FaucetVLANHostCacheTest(unittest.TestCase):
+    """Test VLAN host cache learning and expiry."""
+
+    LEARN_TIMEOUT = 30
+    MAX_BYTES_PER_HOST = 512
+
+    @staticmethod
+    def _expected_expired(expected_cache, now, learn_timeout):
+        min_cache_time = now - learn_timeout
+        return [
+            eth_src for eth_src, (port, cache_time) in expected_cache.items()
+            if cache_time < min_cache_time and not port.permanent_learn]
+
+    def test_expire_cache_hosts(self):
+        """Test expiry index expires the same hosts as a full scan."""
+        fake_port = namedtuple('fake_port', ('number', 'permanent_learn'))
+        ports = [fake_port(1, False), fake_port(2, False), fake_port(3, True)]
+        vlan = VLAN(1, 1, {})
+        expected_cache = {}
+        rand = random.Random(1)
+        for now in range(0, 300):
+            for _ in range(rand.randint(0, 10)):
+                eth_src = '0e:00:00:00:00:%02x' % rand.randint(1, 64)
+                port = rand.choice(ports)
+                vlan.add_cache_host(eth_src, port, now)
+                expected_cache[eth_src] = (port, now)
+            if rand.randint(0, 4) == 0:
+                eth_src = rand.choice(list(expected_cache.keys()))
+                vlan.expire_cache_host(eth_src)
+                del expected_cache[eth_src]
+            expected_expired = self._expected_expired(
+                expected_cache, now, self.LEARN_TIMEOUT)
+            expired = vlan.expire_cache_hosts(now, self.LEARN_TIMEOUT)
+            self.assertEqual(expected_expired, [entry.eth_src for entry in expired])
+            for eth_src in expected_expired:
+                del expected_cache[eth_src]
+            self.assertEqual(len(expected_cache), vlan.hosts_count())
+            for port in ports:
+                self.assertEqual(
+                    len([eth_src for eth_src, (cache_port, _) in expected_cache.items()
+                         if cache_port == port]),
+                    vlan.cached_hosts_count_on_port(port))
+
+    def test_cached_hosts_on_port(self):
+        """Test hosts are indexed by port, and move between ports."""
+        fake_port = namedtuple('fake_port', ('number', 'permanent_learn'))
+        port1 = fake_port(1, False)
+        port2 = fake_port(2, False)
+        vlan = VLAN(1, 1, {})
+        vlan.add_cache_host('0e:00:00:00:00:01', port1, 1)
+        vlan.add_cache_host('0e:00:00:00:00:02', port1, 1)
+        self.assertEqual(
+            ['0e:00:00:00:00:01', '0e:00:00:00:00:02'],
+            sorted([entry.eth_src for entry in vlan.cached_hosts_on_port(port1)]))
+        vlan.add_cache_host('0e:00:00:00:00:02', port2, 2)
+        self.assertEqual(1, vlan.cached_hosts_count_on_port(port1))
+        self.assertEqual(port2, vlan.cached_host('0e:00:00:00:00:02').port)
+        self.assertIsNone(vlan.cached_host_on_port('0e:00:00:00:00:02', port1))
+        vlan.clear_cache_hosts_on_port(port1)
+        self.assertIsNone(vlan.cached_host('0e:00:00:00:00:01'))
+        self.assertEqual(1, vlan.hosts_count())
+
+    def test_host_cache_memory(self):
+        """Test memory used per host cache entry."""
+        fake_port = namedtuple('fake_port', ('number', 'permanent_learn'))
+        ports = [fake_port(port_no, False) for port_no in range(1, 49)]
+        for hosts in (10000, 100000):
+            eth_srcs = [
+                '0e:00:%02x:%02x:%02x:%02x' % tuple(i.to_bytes(4, 'big'))
+                for i in range(hosts)]
+            vlan = VLAN(1, 1, {})
+            tracemalloc.start()
+            for i, eth_src in enumerate(eth_srcs):
+                vlan.add_cache_host(eth_src, ports[i % len(ports)], float(i))
+            cache_bytes, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(hosts, vlan.hosts_count())
+            self.assertLess(
+                cache_bytes / hosts, self.MAX_BYTES_PER_HOST,
+                msg='%u bytes for %u hosts' % (cache_bytes, hosts))
+
 
 if __name__ == "__main__":
     unittest.main() # pytype: disable=module-attr
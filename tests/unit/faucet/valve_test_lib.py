@@ -28,6 +28,7 @@ import pstats
 import shutil
 import socket
 import tempfile
+import time
 import unittest
 
 from ryu.lib import mac
@@ -162,6 +163,23 @@ def build_pkt(pkt):
 FAUCET_MAC = '0e:00:00:00:00:01'
 
 
+def benchmark_test(func):
+    """Decorator to run a benchmark test only if FAUCET_UNIT_TEST_BENCHMARK is set."""
+    return unittest.skipUnless(
+        os.getenv('FAUCET_UNIT_TEST_BENCHMARK'),
+        'FAUCET_UNIT_TEST_BENCHMARK not set')(func)
+
+
+def benchmark(desc, func, count=1):
+    """Print and return mean seconds per call of func (for comparison, not assertion)."""
+    start_time = time.perf_counter()
+    for _ in range(count):
+        func()
+    per_call = (time.perf_counter() - start_time) / count
+    print('%s: %.6fs per call (%u calls)' % (desc, per_call, count))
+    return per_call
+
+
 # TODO: fix fake OF table implementation for in_port filtering
 # (ie. do not output to in_port)
 BASE_DP1_CONFIG = """
@@ -1676,15 +1694,73 @@ meters:
             del_event = RouteRemoval(
                 IPPrefix.from_string(prefix),
             )
+            bgp_speaker_key = faucet_bgp.BgpSpeakerKey(self.DP_ID, 0x100, 4)
+            vlan = self.valve.dp.vlans[0x100]
+            ip_dst = ipaddress.ip_network(prefix)
+            speaker_labels = {'vlan': str(vlan.vid), 'ipv': '4'}
+
+            def process_route_changes():
+                self.assertTrue(self.bgp.route_changes_queued())
+                self.bgp.process_route_changes(time.time())
+                self.assertFalse(self.bgp.route_changes_queued())
+                self.assertEqual(0, self.get_prom('bgp_route_queue_depth', labels=speaker_labels))
+
+            # Route installed only when queued changes processed.
             self.bgp._bgp_route_handler(  # pylint: disable=protected-access
-                add_event,
-                faucet_bgp.BgpSpeakerKey(self.DP_ID, 0x100, 4))
+                add_event, bgp_speaker_key)
+            self.assertNotIn(ip_dst, vlan.routes_by_ipv(4))
+            process_route_changes()
+            self.assertEqual(ipaddress.ip_address(nexthop), vlan.routes_by_ipv(4)[ip_dst])
+            self.assertEqual(1, self.get_prom(
+                'bgp_route_convergence_secs_count', labels=speaker_labels))
+            # Withdraw and re-add coalesced, so no flows sent.
             self.bgp._bgp_route_handler(  # pylint: disable=protected-access
-                del_event,
-                faucet_bgp.BgpSpeakerKey(self.DP_ID, 0x100, 4))
+                del_event, bgp_speaker_key)
+            self.bgp._bgp_route_handler(  # pylint: disable=protected-access
+                add_event, bgp_speaker_key)
+            self.last_flows_to_dp[self.DP_ID] = []
+            process_route_changes()
+            self.assertFalse(self.last_flows_to_dp[self.DP_ID])
+            self.assertIn(ip_dst, vlan.routes_by_ipv(4))
+            self.bgp._bgp_route_handler(  # pylint: disable=protected-access
+                del_event, bgp_speaker_key)
+            process_route_changes()
+            self.assertNotIn(ip_dst, vlan.routes_by_ipv(4))
             self.bgp._bgp_up_handler(nexthop, 65001)  # pylint: disable=protected-access
             self.bgp._bgp_down_handler(nexthop, 65001)  # pylint: disable=protected-access
 
+        def test_bgp_route_change_schedule(self):
+            """Test BGP route change processing is scheduled only while changes are queued."""
+            bgp_speaker_key = faucet_bgp.BgpSpeakerKey(self.DP_ID, 0x100, 4)
+            speaker_labels = {'vlan': str(0x100), 'ipv': '4'}
+            scheduled = []
+            self.bgp._schedule_route_changes = lambda: scheduled.append(True)  # pylint: disable=protected-access
+            for prefix in ('192.168.1.1/32', '192.168.1.2/32'):
+                self.bgp._bgp_route_handler(  # pylint: disable=protected-access
+                    RouteAddition(
+                        IPPrefix.from_string(prefix),
+                        IPAddress.from_string('10.0.0.1'),
+                        '65001',
+                        'IGP'),
+                    bgp_speaker_key)
+            self.assertEqual(1, len(scheduled))
+            batch_size = faucet_bgp.BGP_ROUTE_BATCH_SIZE
+            faucet_bgp.BGP_ROUTE_BATCH_SIZE = 1
+            try:
+                self.bgp.process_route_changes(time.time())
+            finally:
+                faucet_bgp.BGP_ROUTE_BATCH_SIZE = batch_size
+            # One change remains, so processing is scheduled again.
+            self.assertEqual(2, len(scheduled))
+            self.assertEqual(1, self.get_prom('bgp_route_queue_depth', labels=speaker_labels))
+            # Changes for a VLAN that no longer exists are discarded.
+            self.bgp.reset({})
+            self.bgp.process_route_changes(time.time())
+            self.bgp.reset(self.valves_manager.valves)
+            self.assertFalse(self.bgp.route_changes_queued())
+            self.assertEqual(2, len(scheduled))
+            self.assertEqual(0, self.get_prom('bgp_route_queue_depth', labels=speaker_labels))
+
         def test_packet_in_rate(self):
             """Test packet in rate limit triggers."""
             now = self.mock_time(10)
@@ -138,6 +138,29 @@ dbs:
         gauge_file, _ = self.create_config_files(conf)
         self.assertFalse(self.parse_conf_result(gauge_file, 'gauge_config_test'))
 
+    def test_invalid_influx_batch(self):
+        """Test InfluxDB batch and buffer sizes are validated."""
+        GAUGE_CONF = """
+watchers:
+    port_stats_poller:
+        type: 'port_stats'
+        all_dps: True
+        interval: 10
+        db: 'influx'
+dbs:
+    influx:
+        type: 'influx'
+        influx_batch_points: %u
+        influx_buffer_points: %u
+"""
+        for batch_points, buffer_points, valid in (
+                (0, 10, False), (10, 0, False), (10, 5, False), (10, 10, True)):
+            conf = self.get_config(GAUGE_CONF % (batch_points, buffer_points))
+            gauge_file, _ = self.create_config_files(conf)
+            self.assertEqual(
+                valid, self.parse_conf_result(gauge_file, 'gauge_config_test'),
+                msg='batch %u buffer %u' % (batch_points, buffer_points))
+
     def test_file_not_writable(self):
         """Test file arg is not writable."""
         GAUGE_CONF = """
@@ -1,12 +1,14 @@
 """Unit tests for gauge"""
 
 from collections import namedtuple
+import json
 import random
 import re
 import shutil
 import tempfile
 import threading
 import time
+import tracemalloc
 import os
 import unittest
 from unittest import mock
@@ -20,7 +22,6 @@ from requests.exceptions import ReadTimeout
 
 from ryu.controller.ofp_event import EventOFPMsgBase
 from ryu.lib import type_desc
-from ryu.lib import hub
 from ryu.ofproto import ofproto_v1_3 as ofproto
 from ryu.ofproto import ofproto_v1_3_parser as parser
 
@@ -222,6 +223,21 @@ class PretendInflux(QuietHandler):
         self.end_headers()
 
 
+class RecordingInflux(QuietHandler):
+    """An HTTP Handler that records InfluxDB writes, or fails them if asked."""
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Record request lines, or fail if the server is down."""
+        content_length = int(self.headers['content-length'])
+        data = self.rfile.read(content_length)
+        if self.server.fail_writes:
+            self.send_response(500)
+        else:
+            self.server.writes.append(data.decode('utf-8').splitlines())
+            self.send_response(204)
+        self.end_headers()
+
+
 class GaugePrometheusTests(unittest.TestCase): # pytype: disable=module-attr
     """Tests the GaugePortStatsPrometheusPoller update method"""
 
@@ -344,8 +360,11 @@ class GaugePrometheusTests(unittest.TestCase): # pytype: disable=module-attr
         conf = mock.Mock(dp=datapath,
                          type='',
                          interval=1,
+                         tables=None,
+                         flow_sample=1,
                          prometheus_port=9303,
                          prometheus_addr='localhost',
+                         prometheus_max_flow_series=100000,
                          use_test_thread=True
                         )
 
@@ -356,6 +375,90 @@ class GaugePrometheusTests(unittest.TestCase): # pytype: disable=module-attr
         prom_poller.update(rcv_time, msg)
 
 
+class GaugeFlowTablePrometheusDeltaTest(unittest.TestCase): # pytype: disable=module-attr
+    """Tests GaugeFlowTablePrometheusPoller exports only changes"""
+
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        self.prom_client = gauge_prom.GaugePrometheusClient(reg=self.registry)
+        self.conf = mock.Mock(dp=create_mock_datapath(0),
+                              type='',
+                              interval=1,
+                              tables=None,
+                              flow_sample=1,
+                              prometheus_max_flow_series=0)
+        self.poller = gauge_prom.GaugeFlowTablePrometheusPoller(
+            self.conf, '__name__', self.prom_client)
+
+    def _poll(self, flows, more=False, match_fields=None):
+        """Send a flow stats reply with (in_port, packet_count) flows."""
+        if match_fields is None:
+            match_fields = {}
+        body = [
+            parser.OFPFlowStats(
+                0, 1, 0, 1000, 0, 0, 0, 0, packet_count, packet_count * 100,
+                parser.OFPMatch(in_port=in_port, **match_fields), [])
+            for in_port, packet_count in flows]
+        msg = parser.OFPFlowStatsReply(self.conf.dp, body=body)
+        msg.flags = ofproto.OFPMPF_REPLY_MORE if more else 0
+        self.poller.update(time.time(), msg)
+
+    def _in_ports(self, var='flow_packet_count_table0'):
+        return sorted(
+            sample.labels['in_port'] for metric in self.registry.collect()
+            if metric.name == var for sample in metric.samples)
+
+    def test_delta(self):
+        """Test only changed series are updated"""
+        self._poll([(1, 10), (2, 20)])
+        self.assertEqual(['1', '2'], self._in_ports())
+        metrics = [self.prom_client.metrics[var + '_table0'] for var in gauge_prom.PROM_FLOW_VARS]
+        with mock.patch.object(metrics[0], 'labels', wraps=metrics[0].labels) as packet_labels, \
+                mock.patch.object(metrics[1], 'labels', wraps=metrics[1].labels) as byte_labels:
+            self._poll([(1, 10), (2, 25)])
+        self.assertEqual(1, packet_labels.call_count)
+        self.assertEqual(1, byte_labels.call_count)
+
+    def test_stale(self):
+        """Test series removed for flows no longer present"""
+        self._poll([(1, 10), (2, 20)])
+        self._poll([(1, 10)])
+        for var in gauge_prom.PROM_FLOW_VARS:
+            self.assertEqual(['1'], self._in_ports(var + '_table0'))
+
+    def test_multipart(self):
+        """Test series removed only after the last reply to a poll"""
+        self._poll([(1, 10), (2, 20)])
+        self._poll([(1, 10)], more=True)
+        self.assertEqual(['1', '2'], self._in_ports())
+        self._poll([(3, 30)])
+        self.assertEqual(['1', '3'], self._in_ports())
+
+    def test_max_series(self):
+        """Test no more than the maximum number of series exported, all of a flow's or none"""
+        self.conf.prometheus_max_flow_series = 3
+        self._poll([(1, 10), (2, 20)])
+        for var in gauge_prom.PROM_FLOW_VARS:
+            self.assertEqual(['1'], self._in_ports(var + '_table0'))
+        self._poll([(2, 20), (3, 30)])
+        for var in gauge_prom.PROM_FLOW_VARS:
+            self.assertEqual(['2'], self._in_ports(var + '_table0'))
+        # Flows already exported continue to be exported when the maximum is lowered.
+        self.conf.prometheus_max_flow_series = 1
+        self._poll([(2, 20), (3, 30)])
+        for var in gauge_prom.PROM_FLOW_VARS:
+            self.assertEqual(['2'], self._in_ports(var + '_table0'))
+
+    def test_reregister(self):
+        """Test all series set again when new labels are registered"""
+        self._poll([(1, 10)])
+        self._poll([(1, 10)])
+        self._poll([(1, 10), (2, 20)], match_fields={'eth_type': 0x800})
+        self.assertEqual(['1', '2'], self._in_ports())
+        self._poll([(1, 10)])
+        self.assertEqual(['1'], self._in_ports())
+
+
 class GaugeInfluxShipperTest(unittest.TestCase): # pytype: disable=module-attr
     """Tests the InfluxShipper"""
 
@@ -367,7 +470,11 @@ class GaugeInfluxShipperTest(unittest.TestCase): # pytype: disable=module-attr
                          influx_user='gauge',
                          influx_pwd='',
                          influx_db='gauge',
-                         influx_timeout=10
+                         influx_timeout=10,
+                         influx_retries=1,
+                         influx_batch_points=3,
+                         influx_batch_secs=1,
+                         influx_buffer_points=5,
                         )
         return conf
 
@@ -391,7 +498,8 @@ class GaugeInfluxShipperTest(unittest.TestCase): # pytype: disable=module-attr
             shipper = gauge_influx.InfluxShipper()
             shipper.conf = self.create_config_obj(server.server_port)
             points = [{'measurement': 'test_stat_name', 'fields' : {'value':1}},]
-            shipper.ship_points(points)
+            self.assertTrue(shipper.ship_points(points))
+            self.assertTrue(shipper.writer.flush())
         except (ConnectionError, ReadTimeout) as err:
             self.fail("Code threw an exception: {}".format(err))
         finally:
@@ -408,9 +516,87 @@ class GaugeInfluxShipperTest(unittest.TestCase): # pytype: disable=module-attr
             shipper.logger = mock.Mock()
             points = [{'measurement': 'test_stat_name', 'fields' : {'value':1}},]
             shipper.ship_points(points)
+            self.assertFalse(shipper.writer.flush())
         except (ConnectionError, ReadTimeout) as err:
             self.fail("Code threw an exception: {}".format(err))
 
+    def _recording_server(self):
+        server = start_server(RecordingInflux)
+        server.writes = []
+        server.fail_writes = False
+        self.addCleanup(server.shutdown)
+        self.addCleanup(server.socket.close)
+        return server
+
+    @staticmethod
+    def _points(count):
+        return [{'measurement': 'test_stat_name', 'time': 1, 'fields': {'value': i}}
+                for i in range(count)]
+
+    def test_ship_batch(self):
+        """Checks points from all shippers are written together, in batches"""
+        server = self._recording_server()
+        conf = self.create_config_obj(server.server_port)
+        shippers = [gauge_influx.InfluxShipper() for _ in range(2)]
+        for shipper in shippers:
+            shipper.conf = conf
+            shipper.logger = mock.Mock()
+        self.assertIs(shippers[0].writer, None)
+        for shipper in shippers:
+            self.assertTrue(shipper.ship_points(self._points(2)))
+        self.assertIs(shippers[0].writer, shippers[1].writer)
+        self.assertFalse(server.writes)
+        self.assertTrue(shippers[0].writer.flush())
+        self.assertEqual([3, 1], [len(write) for write in server.writes])
+
+    def test_ship_outage(self):
+        """Checks newest points are buffered while InfluxDB is down"""
+        server = self._recording_server()
+        server.fail_writes = True
+        shipper = gauge_influx.InfluxShipper()
+        shipper.conf = self.create_config_obj(server.server_port)
+        shipper.logger = mock.Mock()
+        points = self._points(8)
+        shipper.ship_points(points[:4])
+        self.assertFalse(shipper.writer.flush())
+        self.assertFalse(shipper.ship_points(points[4:]))
+        self.assertEqual(points[3:], list(shipper.writer.points))
+        self.assertEqual(3, shipper.writer.dropped_points)
+        server.fail_writes = False
+        self.assertTrue(shipper.writer.flush())
+        self.assertFalse(shipper.writer.points)
+        self.assertEqual(5, sum(len(write) for write in server.writes))
+
+    def test_ship_outage_requeue(self):
+        """Checks points dropped when requeuing a failed batch are counted"""
+        writer = gauge_influx.InfluxWriter(self.create_config_obj(), mock.Mock())
+        points = self._points(8)
+        writer.points.extend(points[:3])
+
+        def write_during_outage(_batch):
+            # More points are buffered while the write is in progress.
+            writer.write(points[3:])
+            return False
+
+        writer._write_points = write_during_outage # pylint: disable=protected-access
+        self.assertFalse(writer.flush())
+        self.assertEqual(points[3:], list(writer.points))
+        self.assertEqual(3, writer.dropped_points)
+
+    def test_stop_unused_writers(self):
+        """Checks writers no longer configured are stopped"""
+        conf = self.create_config_obj(port=12346)
+        conf.db_type = 'influx'
+        self.addCleanup(gauge_influx.stop_unused_influx_writers, [])
+        writer = gauge_influx.influx_writer(conf, mock.Mock())
+        writer.start()
+        gauge_influx.stop_unused_influx_writers([conf])
+        self.assertIs(writer, gauge_influx.influx_writer(conf, mock.Mock()))
+        self.assertIsNotNone(writer.thread)
+        gauge_influx.stop_unused_influx_writers([])
+        self.assertIsNone(writer.thread)
+        self.assertIsNot(writer, gauge_influx.influx_writer(conf, mock.Mock()))
+
     def test_ship_no_config(self):
         """Check that no exceptions are thrown when
         there is no config"""
@@ -477,7 +663,13 @@ class GaugeInfluxUpdateTest(unittest.TestCase): # pytype: disable=module-attr
                          influx_pwd='',
                          influx_db='gauge',
                          influx_timeout=10,
+                         influx_retries=1,
+                         influx_batch_points=1000,
+                         influx_batch_secs=1,
+                         influx_buffer_points=1000,
                          interval=5,
+                         tables=None,
+                         flow_sample=1,
                          dp=datapath
                         )
         return conf
@@ -538,6 +730,7 @@ class GaugeInfluxUpdateTest(unittest.TestCase): # pytype: disable=module-attr
             msg = port_state_msg(conf.dp, i, reasons[i-1])
             rcv_time = int(time.time())
             db_logger.update(rcv_time, msg)
+            db_logger.writer.flush()
 
             with open(self.server.output_file, 'r') as log:
                 output = log.read()
@@ -556,6 +749,7 @@ class GaugeInfluxUpdateTest(unittest.TestCase): # pytype: disable=module-attr
         rcv_time = int(time.time())
 
         db_logger.update(rcv_time, msg)
+        db_logger.writer.flush()
         with open(self.server.output_file, 'r') as log:
             output = log.readlines()
 
@@ -583,6 +777,7 @@ class GaugeInfluxUpdateTest(unittest.TestCase): # pytype: disable=module-attr
         instructions = [parser.OFPInstructionGotoTable(1)]
         msg = flow_stats_msg(conf.dp, instructions)
         db_logger.update(rcv_time, msg)
+        db_logger.writer.flush()
 
         other_fields = {'dp_name': conf.dp.name,
                         'dp_id': hex(conf.dp.dp_id),
@@ -624,62 +819,100 @@ class GaugeThreadPollerTest(unittest.TestCase): # pytype: disable=module-attr
 
     def setUp(self):
         """Creates a gauge poller and initialises class variables"""
-        self.interval = 1
-        conf = mock.Mock(interval=self.interval)
-        self.poller = gauge_pollers.GaugeThreadPoller(conf, '__name__', mock.Mock())
-        self.send_called = False
+        self.interval = 4
+        self.scheduler = gauge_pollers.GaugePollScheduler()
+        self.poller = self._poller(1)
+        self.send_called = 0
+
+    def _poller(self, dp_id):
+        dp = mock.Mock(dp_id=dp_id)
+        dp.name = 'dp%u' % dp_id
+        conf = mock.Mock(interval=self.interval, dp=dp, type='port_stats', file=None)
+        poller = gauge_pollers.GaugeThreadPoller(conf, '__name__', mock.Mock())
+        poller.send_req = self.fake_send_req
+        poller.no_response = self.fake_no_response
+        return poller
 
     def fake_send_req(self):
         """This should be called instead of the send_req method in the
         GaugeThreadPoller class, which just throws an error"""
-        self.send_called = True
+        self.send_called += 1
 
     def fake_no_response(self):
         """This should be called instead of the no_response method in the
         GaugeThreadPoller class, which just throws an error"""
         return
 
+    def _tick(self, secs):
+        start = int(time.time())
+        for now in range(start, start + secs):
+            self.scheduler.tick(now)
+
     def test_start(self):
         """ Checks if the poller is started """
-        self.poller.send_req = self.fake_send_req
-        self.poller.no_response = self.fake_no_response
-
-        self.poller.start(mock.Mock(), active=True)
-        poller_thread = self.poller.thread
-        hub.sleep(self.interval + 1)
-        self.assertTrue(self.send_called)
-        self.assertFalse(poller_thread.dead)
+        self.poller.start(mock.Mock(), active=True, scheduler=self.scheduler)
+        self.assertEqual(1, self.scheduler.pollers())
+        self._tick(self.interval + 1)
+        self.assertEqual(1, self.send_called)
+        self.assertTrue(self.poller.reply_pending)
 
     def test_stop(self):
         """ Check if a poller can be stopped """
-        self.poller.send_req = self.fake_send_req
-        self.poller.no_response = self.fake_no_response
-
-        self.poller.start(mock.Mock(), active=True)
-        poller_thread = self.poller.thread
+        self.poller.start(mock.Mock(), active=True, scheduler=self.scheduler)
         self.poller.stop()
-        hub.sleep(self.interval + 1)
-
+        self.assertEqual(0, self.scheduler.pollers())
+        self._tick(self.interval + 1)
         self.assertFalse(self.send_called)
-        self.assertTrue(poller_thread.dead)
 
     def test_active(self):
         """Check if active reflects the state of the poller """
         self.assertFalse(self.poller.is_active())
         self.assertFalse(self.poller.running())
-        self.poller.start(mock.Mock(), active=True)
+        self.poller.start(mock.Mock(), active=True, scheduler=self.scheduler)
         self.assertTrue(self.poller.is_active())
         self.assertTrue(self.poller.running())
         self.poller.stop()
         self.assertFalse(self.poller.is_active())
         self.assertFalse(self.poller.running())
-        self.poller.start(mock.Mock(), active=False)
+        self.poller.start(mock.Mock(), active=False, scheduler=self.scheduler)
         self.assertFalse(self.poller.is_active())
         self.assertTrue(self.poller.running())
         self.poller.stop()
         self.assertFalse(self.poller.is_active())
         self.assertFalse(self.poller.running())
 
+    def test_deterministic_spread(self):
+        """Check requests to many DPs spread across the interval, the same way each time."""
+        slots = []
+        for _ in range(2):
+            pollers = [self._poller(dp_id) for dp_id in range(1, 101)]
+            scheduler = gauge_pollers.GaugePollScheduler()
+            for poller in pollers:
+                scheduler.add(poller, 100)
+            slots.append(sorted(scheduler.wheel))
+            polled = [scheduler.tick(now) for now in range(101, 101 + self.interval)]
+            self.assertEqual(len(pollers), sum(polled))
+            self.assertLess(max(polled), len(pollers) / 2)
+            self.assertEqual(len(pollers), scheduler.tick(101 + self.interval * 2))
+        self.assertEqual(slots[0], slots[1])
+
+    def test_adaptive_interval(self):
+        """Check interval backs off while replies are slow, then recovers."""
+        self.poller.start(mock.Mock(), active=True, scheduler=self.scheduler)
+        self.poller.poll(100)
+        self.poller.update(100 + self.interval, mock.Mock())
+        self.assertEqual(self.interval, self.poller.reply_latency)
+        self.assertEqual(self.interval * 2, self.poller.interval)
+        for now in range(200, 300, self.poller.interval):
+            self.poller.poll(now)
+        self.assertEqual(
+            self.interval * gauge_pollers.GaugeThreadPoller.MAX_INTERVAL_MULTIPLIER,
+            self.poller.interval)
+        for now in range(300, 400, self.poller.interval):
+            self.poller.poll(now)
+            self.poller.update(now, mock.Mock())
+        self.assertEqual(self.interval, self.poller.interval)
+
 
 class GaugePollerTest(unittest.TestCase): # pytype: disable=module-attr
     """Checks the send_req and no_response methods in a Gauge Poller"""
@@ -722,7 +955,7 @@ class GaugeFlowTablePollerTest(GaugePollerTest):
 
     def test_send_req(self):
         """Check that the poller sends a flow stats request"""
-        conf = mock.Mock(interval=1)
+        conf = mock.Mock(interval=1, tables=None)
         poller = gauge_pollers.GaugeFlowTablePoller(conf, '__name__', mock.Mock())
         self.check_send_req(poller, parser.OFPFlowStatsRequest)
 
@@ -732,6 +965,136 @@ class GaugeFlowTablePollerTest(GaugePollerTest):
         self.check_no_response(poller)
 
 
+class GaugeFlowTableStreamTest(unittest.TestCase): # pytype: disable=module-attr
+    """Checks flow table replies are exported incrementally."""
+
+    TABLES = 3
+
+    def setUp(self):
+        self.temp_fd, self.temp_path = tempfile.mkstemp()
+        self.datapath = create_mock_datapath(0)
+        self.datapath.tables = {
+            'table%u' % table_id: mock.Mock(table_id=table_id) for table_id in range(self.TABLES)}
+        self.conf = mock.Mock(
+            dp=self.datapath, file=self.temp_path, compress=False, tables=None, flow_sample=1)
+
+    def tearDown(self):
+        os.close(self.temp_fd)
+        os.remove(self.temp_path)
+
+    def _flow_stats_msg(self, flows):
+        instructions = [parser.OFPInstructionGotoTable(1)]
+        body = [
+            parser.OFPFlowStats(
+                i % self.TABLES, 1, 0, 1000, 0, 0, 0, i, i * 10, i * 1000,
+                parser.OFPMatch(
+                    in_port=i % 48 + 1, vlan_vid=(i % 4000 + 1) | ofproto.OFPVID_PRESENT,
+                    eth_dst='0e:00:00:%02x:%02x:%02x' % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff)),
+                instructions)
+            for i in range(flows)]
+        return parser.OFPFlowStatsReply(self.datapath, body=body)
+
+    def _poller(self):
+        poller = watcher.GaugeFlowTableLogger(self.conf, '__name__', mock.Mock())
+        poller._running = True # pylint: disable=protected-access
+        return poller
+
+    def _jsondict_flow_stat_records(self, poller, msg):
+        """Parse flow stats the way Gauge did before streaming (via to_jsondict())."""
+        records = []
+        for stats_reply in msg.to_jsondict()['OFPFlowStatsReply']['body']:
+            stats = stats_reply['OFPFlowStats']
+            tags = {
+                'dp_name': poller.dp.name,
+                'dp_id': hex(poller.dp.dp_id),
+                'table_id': int(stats['table_id']),
+                'priority': int(stats['priority']),
+                'inst_count': len(stats['instructions']),
+                'cookie': int(stats['cookie']),
+            }
+            for oxm_match in stats['match']['OFPMatch']['oxm_fields']:
+                oxm_tlv = oxm_match['OXMTlv']
+                val = oxm_tlv['value']
+                if oxm_tlv['mask'] is not None:
+                    val = '/'.join((str(val), str(oxm_tlv['mask'])))
+                tags[oxm_tlv['field']] = val
+                if oxm_tlv['field'] == 'vlan_vid' and oxm_tlv['mask'] is None:
+                    tags['vlan'] = int(val) ^ ofproto.OFPVID_PRESENT
+            records.append(('flow_packet_count', tags, int(stats['packet_count'])))
+            records.append(('flow_byte_count', tags, int(stats['byte_count'])))
+        return records
+
+    def test_records(self):
+        """Check streamed records match records parsed from the whole reply."""
+        poller = self._poller()
+        msg = self._flow_stats_msg(10)
+        self.assertEqual(
+            self._jsondict_flow_stat_records(poller, msg),
+            list(poller._flow_stat_records(msg))) # pylint: disable=protected-access
+
+    def test_file(self):
+        """Check streamed file output is the same as dumping the whole reply."""
+        poller = self._poller()
+        msg = self._flow_stats_msg(10)
+        rcv_time = time.time()
+        poller.update(rcv_time, msg)
+        with open(self.temp_path) as log:
+            output = log.read()
+        expected = '---\n%s\n' % json.dumps({
+            'time': poller._rcv_time(rcv_time), # pylint: disable=protected-access
+            'ref': '-'.join((self.datapath.name, 'flowtables')),
+            'msg': msg.to_jsondict()})
+        self.assertEqual(expected, output)
+
+    def test_table_filter(self):
+        """Check only flows from configured tables are exported and requested."""
+        self.conf.tables = ['table1']
+        poller = self._poller()
+        msg = self._flow_stats_msg(30)
+        stats = list(poller._flow_stats(msg)) # pylint: disable=protected-access
+        self.assertEqual(10, len(stats))
+        self.assertEqual({1}, {stat.table_id for stat in stats})
+        datapath = mock.Mock(ofproto=ofproto, ofproto_parser=parser)
+        poller.start(datapath, active=False)
+        poller.send_req()
+        self.assertEqual(1, poller.req.table_id)
+
+    def test_sample(self):
+        """Check the same sample of flows is exported each poll."""
+        self.conf.flow_sample = 10
+        poller = self._poller()
+        msg = self._flow_stats_msg(1000)
+        cookies = [
+            [stat.cookie for stat in poller._flow_stats(msg)] # pylint: disable=protected-access
+            for _ in range(2)]
+        self.assertEqual(cookies[0], cookies[1])
+        self.assertLess(50, len(cookies[0]))
+        self.assertGreater(200, len(cookies[0]))
+
+    def test_benchmark(self):
+        """Check streaming allocates less than parsing the whole reply."""
+        poller = self._poller()
+        msg = self._flow_stats_msg(2000)
+
+        def jsondict_poll():
+            for _ in self._jsondict_flow_stat_records(poller, msg):
+                pass
+
+        def stream_poll():
+            for _ in poller._flow_stat_records(msg): # pylint: disable=protected-access
+                pass
+
+        peaks = []
+        for poll in (jsondict_poll, stream_poll):
+            tracemalloc.start()
+            poll()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        jsondict_peak, stream_peak = peaks
+        self.assertLess(stream_peak * 10, jsondict_peak, msg='peak %u vs %u bytes' % (
+            stream_peak, jsondict_peak))
+
+
 class GaugeWatcherTest(unittest.TestCase): # pytype: disable=module-attr
     """Checks the loggers in watcher.py."""
 
@@ -742,7 +1105,7 @@ class GaugeWatcherTest(unittest.TestCase): # pytype: disable=module-attr
     def setUp(self):
         """Creates a temporary file and a mocked conf object"""
         self.temp_fd, self.temp_path = tempfile.mkstemp()
-        self.conf = mock.Mock(file=self.temp_path, compress=False)
+        self.conf = mock.Mock(file=self.temp_path, compress=False, tables=None, flow_sample=1)
 
     def tearDown(self):
         """Closes and deletes the temporary file"""